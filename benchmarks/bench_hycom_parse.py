@@ -0,0 +1,76 @@
+""" Benchmark for parsing HYCOM OPeNDAP ASCII responses.
+
+    Compares the vectorized parser in `kadlu.geospatial.data_sources.hycom`
+    against the previous row-by-row parser, using the recorded payload in
+    kadlu/tests/assets/hycom_salinity.ascii tiled to the size of a single
+    index bin (1 degree, 40 depths, 24 hours).
+
+    Usage:
+        python -m benchmarks.bench_hycom_parse
+"""
+import os
+import timeit
+import numpy as np
+from kadlu.geospatial.data_sources.hycom import parse_ascii, grid_columns, ascii_separator
+
+path_to_assets = os.path.join(os.path.dirname(os.path.dirname(__file__)), "kadlu", "tests", "assets")
+
+
+def legacy_parse(text, epoch, depth, lat, lon):
+    """ row-by-row parser and tuple grid, as used before vectorization """
+    meta, data = text.split(ascii_separator)
+    arrs = data.split("\n\n")[:-1]
+    shape_str, payload = arrs[0].split("\n", 1)
+    shape = tuple([int(x) for x in shape_str.split("[", 1)[1][:-1].split("][")])
+    cube = np.ndarray(shape, dtype=float)
+    for arr in payload.split("\n"):
+        ix_str, row_csv = arr.split(", ", 1)
+        a, b, c = [int(x) for x in ix_str[1:-1].split("][")]
+        cube[a][b][c] = np.array(row_csv.split(", "), dtype=int)
+
+    grid = np.array([(None, y, x, t, d, 'hycom') for t in epoch for d in depth for y in lat for x in lon])
+    grid[:, 0] = np.reshape(cube, cube.size) * 0.001 + 20
+    return grid[grid[:, 0] != -10]
+
+
+def bin_sized_payload(nt=8, ny=26, nx=13):
+    """ tile the recorded payload to the size of one HYCOM index bin """
+    with open(os.path.join(path_to_assets, "hycom_salinity.ascii")) as f:
+        cube = parse_ascii(f.read())
+
+    cube = np.resize(cube, (nt, cube.shape[1], ny, nx))
+    lines = [f"salinity.salinity[{']['.join(map(str, cube.shape))}]"]
+    for a in range(cube.shape[0]):
+        for b in range(cube.shape[1]):
+            for c in range(cube.shape[2]):
+                lines.append(f"[{a}][{b}][{c}], " + ", ".join(map(str, cube[a, b, c])))
+
+    text = "Dataset {}\n" + ascii_separator + "\n".join(lines) + "\n\n"
+    return text, cube.shape
+
+
+def main(number=3):
+    text, (nt, nd, ny, nx) = bin_sized_payload()
+    epoch = 175536. + 3 * np.arange(nt)
+    depth = np.arange(nd, dtype=float)
+    lat = 44 + 0.04 * np.arange(ny)
+    lon = 296 + 0.08 * np.arange(nx)
+
+    def vectorized():
+        return grid_columns(parse_ascii(text), epoch, depth, lat, lon, 'salinity')
+
+    def legacy():
+        return legacy_parse(text, epoch, depth, lat, lon)
+
+    assert len(vectorized()[0]) == len(legacy())
+
+    t_new = min(timeit.repeat(vectorized, number=1, repeat=number))
+    t_old = min(timeit.repeat(legacy, number=1, repeat=number))
+
+    print(f"payload: {nt*nd*ny*nx} values, {len(text)/1E6:.1f} MB")
+    print(f"row-by-row parser: {t_old*1E3:8.1f} ms")
+    print(f"vectorized parser: {t_new*1E3:8.1f} ms  ({t_old/t_new:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
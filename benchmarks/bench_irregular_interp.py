@@ -0,0 +1,59 @@
+""" Benchmark for interpolating data on an irregular 3D grid.
+
+    Maps scattered (lat, lon, depth) data points onto a regular grid with
+    `_IrregularGridInterpolator`, and compares the per-batch `griddata` calls
+    used before the triangulation was cached, which rebuild the Delaunay
+    triangulation for every batch of 10,000 points, against
+    `kadlu.geospatial.interpolation._IrregularGridInterpolator`.
+
+    Usage:
+        python -m benchmarks.bench_irregular_interp [--points 5000] [--grid 50]
+"""
+import argparse
+import timeit
+import numpy as np
+from scipy.interpolate import griddata
+from kadlu.geospatial.interpolation import _IrregularGridInterpolator
+
+
+def batched_griddata(points, values, pts, method, batch_size=10000):
+    """ per-batch griddata calls used before the triangulation was cached """
+    v = []
+    for a in range(0, pts.shape[0], batch_size):
+        v.append(griddata(points, values, pts[a:a + batch_size], method=method, rescale=False))
+
+    v = np.concatenate(v, axis=0)
+    nearest = np.concatenate([
+        griddata(points, values, pts[a:a + batch_size], method='nearest', rescale=False)
+        for a in range(0, pts.shape[0], batch_size)
+    ])
+    v[np.isnan(v)] = nearest[np.isnan(v)]
+    return v
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=5000, help='number of scattered data points')
+    parser.add_argument('--grid', type=int, default=50, help='number of grid nodes along each axis')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    points = rng.uniform(0, 1, (args.points, 3))
+    values = np.sin(points[:, 0] * 6) + points[:, 1] * points[:, 2]
+    axis = np.linspace(0, 1, args.grid)
+    pts = np.array([x.ravel() for x in np.meshgrid(axis, axis, axis, indexing='ij')]).T
+    print(f'{args.points} data points -> {pts.shape[0]} grid nodes')
+
+    t_old = timeit.timeit(lambda: batched_griddata(points, values, pts, 'linear'), number=1)
+    t_new = timeit.timeit(lambda: _IrregularGridInterpolator(points, values, method='linear')(pts.T), number=1)
+
+    old = batched_griddata(points, values, pts, 'linear')
+    new = _IrregularGridInterpolator(points, values, method='linear')(pts.T)
+    assert np.allclose(old, new)
+
+    print(f'  griddata per batch:     {t_old * 1e3:9.1f} ms')
+    print(f'  cached triangulation:   {t_new * 1e3:9.1f} ms ({t_old / t_new:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+""" Benchmark for finding the maximum depth within the propagation range.
+
+    Generates a GEBCO-like bathymetry at the native 15 arc-second resolution for
+    the region loaded by `kadlu.sound.geophony.transmission_loss`, and compares
+    the search of the interpolated bathymetry on a 2000 x 2000 grid in
+    `kadlu.sound.parabolic_equation.TransmissionLoss._max_depth` against the
+    bound on the data values obtained with
+    `kadlu.geospatial.interpolation.RegularGridGeospatialInterpolator.max_value`.
+
+    Usage:
+        python -m benchmarks.bench_max_depth [--range 50]
+"""
+import argparse
+import timeit
+import numpy as np
+from kadlu.geospatial.interpolation import get_interpolator
+from kadlu.sound.parabolic_equation import TransmissionLoss
+from kadlu.utils import deg2rad, R1_IUGG
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--range', type=float, default=50, help='propagation range in km')
+    args = parser.parse_args()
+
+    # region loaded for a source at 45N, 60W
+    r_max = 1e3 * args.range
+    dlat = 1.2 * r_max / (R1_IUGG * deg2rad)
+    dlon = dlat / np.cos(45 * deg2rad)
+    lat = np.arange(45 - dlat, 45 + dlat, 1 / 240)
+    lon = np.arange(-60 - dlon, -60 + dlon, 1 / 240)
+
+    # sloping seafloor with a canyon and random roughness
+    rng = np.random.default_rng(0)
+    y, x = np.meshgrid(lat - 45, lon + 60, indexing='ij')
+    value = 1000 + 800 * y + 1500 * np.exp(-(x - 0.3)**2 / 0.01) + rng.normal(0, 20, y.shape)
+    interp = get_interpolator(value, lat=lat, lon=lon, origin=(45, -60))
+    print(f'{len(lat)} x {len(lon)} bathymetry nodes, propagation range {args.range:.0f} km')
+
+    def bathy(x, y, grid=False):
+        return interp(x=x, y=y, grid=grid)
+
+    t_search = timeit.timeit(lambda: TransmissionLoss._max_depth(None, bathy, r_max), number=1)
+
+    def first_query():
+        interp._pyramids.clear()
+        return interp.max_value(radius=r_max)
+
+    t_first = min(timeit.repeat(first_query, number=1, repeat=5))
+    t_coarse = min(timeit.repeat(lambda: interp.max_value(radius=r_max), number=100, repeat=5)) / 100
+    t_refine = min(timeit.repeat(lambda: interp.max_value(radius=r_max, refine=True), number=10, repeat=5)) / 10
+
+    search = TransmissionLoss._max_depth(None, bathy, r_max)
+    coarse, refine = interp.max_value(radius=r_max), interp.max_value(radius=r_max, refine=True)
+    assert coarse >= refine
+
+    print(f'  2000 x 2000 search:      {t_search * 1e3:9.1f} ms, max depth {search:.1f} m (square of side 2 x range)')
+    print(f'  first query, with setup: {t_first * 1e3:9.1f} ms')
+    print(f'  pyramid, coarse bound:   {t_coarse * 1e6:9.1f} us, max depth {coarse:.1f} m')
+    print(f'  pyramid, refined bound:  {t_refine * 1e6:9.1f} us, max depth {refine:.1f} m (disc of radius range)')
+
+
+if __name__ == '__main__':
+    main()
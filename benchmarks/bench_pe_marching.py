@@ -0,0 +1,78 @@
+""" Benchmark for the split-step marching loop of the parabolic equation solver.
+
+    Propagates a complex field of shape (sources, depths, azimuths) through a
+    number of range steps, and compares the out-of-place implementation used
+    before the FFT work buffer was introduced, which allocates new arrays for
+    every product and transform, against the in-place marching with
+    `kadlu.sound.parabolic_equation.VerticalFFT`.
+
+    Usage:
+        python -m benchmarks.bench_pe_marching [--nz 4096] [--nq 36] [--steps 50] [--workers 1]
+"""
+import argparse
+import timeit
+import numpy as np
+import scipy.fft
+from kadlu.sound.parabolic_equation import VerticalFFT, prop_refr
+
+
+def march_out_of_place(psi, UD, n, k0, dr, steps):
+    """ out-of-place implementation used before the FFT work buffer """
+    for _ in range(steps):
+        psi = UD * psi
+        UR = prop_refr(x=dr, k0=k0, n=n)
+        psi = scipy.fft.fft(UR * scipy.fft.ifft(psi, axis=1), axis=1)
+        psi = UD * psi
+    return psi
+
+
+def march_in_place(psi, UD, n, k0, dr, steps, workers, backend):
+    """ in-place marching in the FFT work buffer """
+    fft = VerticalFFT(psi.shape, dtype=psi.dtype, workers=workers, backend=backend)
+    fft.buffer[...] = psi
+    psi = fft.buffer
+    UR = np.empty(psi.shape[1:], dtype=psi.dtype)
+    for _ in range(steps):
+        psi *= UD
+        np.subtract(n, 1, out=UR)
+        UR *= 1j * dr * k0
+        np.exp(UR, out=UR)
+        fft.ifft()
+        psi *= UR
+        fft.fft()
+        psi *= UD
+    return psi
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ns', type=int, default=1, help='number of source depths')
+    parser.add_argument('--nz', type=int, default=4096, help='number of vertical grid points')
+    parser.add_argument('--nq', type=int, default=36, help='number of azimuthal bins')
+    parser.add_argument('--steps', type=int, default=50, help='number of range steps')
+    parser.add_argument('--workers', type=int, default=1, help='number of FFT threads')
+    parser.add_argument('--backend', default='scipy', choices=VerticalFFT.backends, help='FFT backend')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    shape = (args.ns, args.nz, args.nq)
+    psi = rng.random(shape) + 1j * rng.random(shape)
+    UD = np.exp(1j * rng.random((1, args.nz, args.nq)))
+    n = 1 + 0.01 * rng.random((args.nz, args.nq)) + 1e-4j
+    k0, dr = 0.4, 50.
+    print(f'field shape {shape}, {args.steps} steps, {args.workers} FFT thread(s), {args.backend}')
+
+    t_old = min(timeit.repeat(lambda: march_out_of_place(psi, UD, n, k0, dr, args.steps), number=1, repeat=3))
+    t_new = min(timeit.repeat(lambda: march_in_place(psi, UD, n, k0, dr, args.steps, args.workers, args.backend),
+                              number=1, repeat=3))
+
+    old = march_out_of_place(psi, UD, n, k0, dr, args.steps)
+    new = march_in_place(psi, UD, n, k0, dr, args.steps, args.workers, args.backend)
+    assert np.allclose(old, new)
+
+    print(f'  out-of-place: {t_old * 1e3:9.1f} ms')
+    print(f'  in-place:     {t_new * 1e3:9.1f} ms ({t_old / t_new:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
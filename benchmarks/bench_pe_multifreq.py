@@ -0,0 +1,78 @@
+""" Benchmark for the multi-frequency transmission loss solver.
+
+    Computes the transmission loss in third-octave bands over a sloping seafloor
+    with a range-dependent sound speed profile, and compares a loop over
+    `kadlu.sound.parabolic_equation.TransmissionLoss` solvers, on their default
+    grids and on the nested grids of the multi-frequency solver, against
+    `kadlu.sound.parabolic_equation.MultiFrequencyTransmissionLoss`.
+
+    Usage:
+        python -m benchmarks.bench_pe_multifreq [--fmin 100] [--bands 7] [--range 5] [--angular-bin 10]
+"""
+import argparse
+import timeit
+import numpy as np
+from kadlu.sound.parabolic_equation import TransmissionLoss, MultiFrequencyTransmissionLoss
+
+bottom = {'sound_speed': 1700, 'density': 1.5, 'attenuation': 0.5}
+
+
+def bathy(x, y, grid=False):
+    if grid: x, y = np.meshgrid(x, y)
+    return 200 + 0.01 * x + 0.005 * y
+
+
+def bathy_deriv(x, y, axis):
+    return (0.01 if axis == 'x' else 0.005) * np.ones(np.shape(x))
+
+
+def sound_speed(x, y, z):
+    return 1490 + 0.05 * z + 0.001 * x
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fmin', type=float, default=100, help='lowest band centre frequency in Hz')
+    parser.add_argument('--bands', type=int, default=7, help='number of third-octave bands')
+    parser.add_argument('--range', type=float, default=5, help='propagation range in km')
+    parser.add_argument('--angular-bin', type=float, default=10, help='angular bin size in degrees')
+    args = parser.parse_args()
+
+    freq = args.fmin * 2**(np.arange(args.bands) / 3)
+    kwargs = dict(bathy_func=bathy, bathy_deriv_func=bathy_deriv, sound_speed_func=sound_speed, bottom=bottom,
+                  propagation_range=args.range, angular_bin=args.angular_bin)
+    calc_kwargs = dict(source_depth=[20], rec_depth=[10], progress_bar=False, size_limit=False)
+
+    def loop_default():
+        return [TransmissionLoss(freq=f, **kwargs).calc(**calc_kwargs)[0] for f in freq]
+
+    def loop_nested(grids):
+        return [
+            TransmissionLoss(freq=f, dr=g.dr, dz=g.dz, r_max=g.r[-1], z_max=np.max(g.z), **kwargs).calc(**calc_kwargs)[0]
+            for f, g in zip(freq, grids)
+        ]
+
+    def multi():
+        return MultiFrequencyTransmissionLoss(freq=freq, **kwargs).calc(**calc_kwargs)[0]
+
+    mf = MultiFrequencyTransmissionLoss(freq=freq, **kwargs)
+    grids = [tl.grid for tl in mf.solvers]
+    print(f'{args.bands} bands from {freq[0]:.0f} to {freq[-1]:.0f} Hz, '
+          f'{len(mf._groups)} nested grids, nr={grids[-1].nr}, nz={grids[-1].nz} for the finest')
+
+    t_default = timeit.timeit(loop_default, number=1)
+    t_nested = timeit.timeit(lambda: loop_nested(grids), number=1)
+    t_multi = timeit.timeit(multi, number=1)
+
+    # the output of the finer grids is subsampled to the grid of the lowest frequency
+    tl_multi = multi()
+    for tl, tl_nested, (m, _) in zip(tl_multi, loop_nested(grids), mf._grid_ratio):
+        assert np.allclose(tl_nested[..., m - 1::m], tl)
+
+    print(f'  loop, default grids: {t_default * 1e3:9.1f} ms')
+    print(f'  loop, nested grids:  {t_nested * 1e3:9.1f} ms')
+    print(f'  multi-frequency:     {t_multi * 1e3:9.1f} ms ({t_nested / t_multi:.1f}x faster than the loop on the same grids)')
+
+
+if __name__ == '__main__':
+    main()
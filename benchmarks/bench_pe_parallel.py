@@ -0,0 +1,61 @@
+""" Benchmark for the parallel PE marching of the transmission loss solver.
+
+    Computes the transmission loss over a sloping seafloor with a range-dependent
+    sound speed profile, and compares the serial marching against
+    `kadlu.sound.parabolic_equation.TransmissionLoss` with the azimuthal bins split
+    across a pool of thread or process workers.
+
+    Usage:
+        python -m benchmarks.bench_pe_parallel [--range 10] [--angular-bin 5] [--workers 4] [--pool process]
+"""
+import argparse
+import timeit
+import numpy as np
+from kadlu.sound.parabolic_equation import TransmissionLoss
+
+bottom = {'sound_speed': 1700, 'density': 1.5, 'attenuation': 0.5}
+
+
+def bathy(x, y, grid=False):
+    if grid: x, y = np.meshgrid(x, y)
+    return 200 + 0.01 * x + 0.005 * y
+
+
+def bathy_deriv(x, y, axis):
+    return (0.01 if axis == 'x' else 0.005) * np.ones(np.shape(x))
+
+
+def sound_speed(x, y, z):
+    return 1490 + 0.05 * z + 0.001 * x
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--freq', type=float, default=200, help='frequency in Hz')
+    parser.add_argument('--range', type=float, default=10, help='propagation range in km')
+    parser.add_argument('--angular-bin', type=float, default=5, help='angular bin size in degrees')
+    parser.add_argument('--workers', type=int, default=4, help='number of workers')
+    parser.add_argument('--pool', default='process', choices=TransmissionLoss.pools, help='type of worker pool')
+    args = parser.parse_args()
+
+    def calc(workers):
+        tl = TransmissionLoss(freq=args.freq, bathy_func=bathy, bathy_deriv_func=bathy_deriv,
+                              sound_speed_func=sound_speed, bottom=bottom, propagation_range=args.range,
+                              angular_bin=args.angular_bin, workers=workers, pool=args.pool)
+        return tl.calc(source_depth=[20], rec_depth=[10], progress_bar=False)[0]
+
+    tl = TransmissionLoss(freq=args.freq, bathy_func=bathy, bathy_deriv_func=bathy_deriv,
+                          sound_speed_func=sound_speed, bottom=bottom, propagation_range=args.range,
+                          angular_bin=args.angular_bin)
+    print(f'grid: nr={tl.grid.nr}, nz={tl.grid.nz}, nq={tl.grid.nq}')
+
+    t_serial = timeit.timeit(lambda: calc(1), number=1)
+    t_parallel = timeit.timeit(lambda: calc(args.workers), number=1)
+    assert np.allclose(calc(1), calc(args.workers))
+
+    print(f'  serial:            {t_serial * 1e3:9.1f} ms')
+    print(f'  {args.workers} {args.pool} workers: {t_parallel * 1e3:9.1f} ms ({t_serial / t_parallel:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+""" Benchmark for assembling HYCOM row data into a dense 4D grid.
+
+    Generates rows for a HYCOM-sized region at the native 0.08 x 0.04 degree
+    resolution, with 40 depth layers and 3-hourly time steps, where the depth
+    columns are truncated at a random seafloor depth and some columns are on
+    land. Compares the row-by-row implementation of `reshape_4D` used before
+    vectorization against `kadlu.geospatial.data_sources.data_util.reshape_4D`.
+
+    Usage:
+        python -m benchmarks.bench_reshape [--degrees 1] [--days 1]
+"""
+import argparse
+import timeit
+import numpy as np
+from kadlu.geospatial.data_sources.data_util import index_arr, reshape_4D
+
+hycom_depths = np.array([
+    0, 2, 4, 6, 8, 10, 12, 15, 20, 25, 30, 35, 40, 45, 50, 60, 70, 80, 90, 100, 125, 150, 200, 250, 300, 350, 400,
+    500, 600, 700, 800, 900, 1000, 1250, 1500, 2000, 2500, 3000, 4000, 5000
+], dtype=float)
+
+
+def hycom_rows(degrees, days, seed=0):
+    """ rows of (val, lat, lon, time, depth) for a square region """
+    rng = np.random.default_rng(seed)
+    lat = np.arange(44, 44 + degrees, 0.04)
+    lon = np.arange(-64, -64 + degrees, 0.08)
+    epoch = np.arange(0, 24 * days, 3, dtype=float)
+    y, x, t, z = np.meshgrid(lat, lon, epoch, hycom_depths, indexing='ij')
+
+    # seafloor depth of each column, with ~10% of the columns on land
+    seafloor = rng.uniform(0, 3000, (len(lat), len(lon)))
+    seafloor[rng.random(seafloor.shape) < 0.1] = -1
+    keep = z <= seafloor[:, :, None, None]
+
+    val = 30 + rng.random(y.shape)
+    return np.array([val[keep], y[keep], x[keep], t[keep], z[keep]])
+
+
+def reshape_4D_rows(cols):
+    """ row-by-row implementation used before vectorization """
+    vals, y, x, t, z = cols
+    rows = np.array((vals, y, x, z, t)).T
+    xgrid, ygrid, zgrid, tgrid = np.unique(x), np.unique(y), np.unique(z), np.unique(t)
+    gridspace = np.full((len(ygrid), len(xgrid), len(zgrid), len(tgrid)), fill_value=None, dtype=float)
+
+    for row in rows:
+        x_ix = index_arr(row[2], xgrid)
+        y_ix = index_arr(row[1], ygrid)
+        z_ix = index_arr(row[3], zgrid)
+        t_ix = index_arr(row[4], tgrid)
+        gridspace[y_ix, x_ix, z_ix, t_ix] = row[0]
+
+    for xi in range(0, gridspace.shape[0]):
+        for yi in range(0, gridspace.shape[1]):
+            col = gridspace[xi, yi]
+            if np.sum(np.isnan(col)) > 0 and np.sum(np.isnan(col)) < len(col):
+                col[np.isnan(col)] = col[~np.isnan(col)][-1]
+                gridspace[xi, yi] = col
+
+    for zi in range(0, gridspace.shape[2]):
+        gridspace[:, :, zi, :][np.isnan(gridspace[:, :, zi, :])] = np.average(
+            gridspace[:, :, zi, :][~np.isnan(gridspace[:, :, zi, :])])
+
+    return dict(values=gridspace, lats=ygrid, lons=xgrid, depths=zgrid, times=tgrid)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--degrees', type=float, default=1, help='width and height of the region in degrees')
+    parser.add_argument('--days', type=int, default=1, help='number of days of 3-hourly data')
+    args = parser.parse_args()
+
+    cols = hycom_rows(args.degrees, args.days)
+    print(f'{cols.shape[1]} rows ({args.degrees} x {args.degrees} degrees, {args.days} days, {len(hycom_depths)} depths)')
+
+    t_rows = timeit.timeit(lambda: reshape_4D_rows(cols), number=1)
+    t_vec = min(timeit.repeat(lambda: reshape_4D(cols), number=1, repeat=3))
+
+    old, new = reshape_4D_rows(cols), reshape_4D(cols)
+    assert all(np.array_equal(old[k], new[k]) for k in ('lats', 'lons', 'depths', 'times'))
+    assert not np.any(np.isnan(new['values']))
+
+    print(f'  row-by-row: {t_rows * 1e3:9.1f} ms')
+    print(f'  vectorized: {t_vec * 1e3:9.1f} ms ({t_rows / t_vec:.0f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
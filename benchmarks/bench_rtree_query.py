@@ -0,0 +1,85 @@
+""" Benchmark for small-box range queries on a global geospatial database.
+
+    Builds a synthetic ERA5-style table holding a global 0.25 degree grid
+    for a number of hourly time steps, then compares the plain range query
+    used before the spatial index was introduced against the R*Tree query
+    built by `kadlu.geospatial.data_sources.data_util.range_query`.
+
+    Each hour of global data adds about 1M rows (~100 MB including the
+    indexes), so e.g. `--hours 48` produces a database of several GB.
+
+    Usage:
+        python -m benchmarks.bench_rtree_query [--hours 6] [--path /tmp/bench.db]
+"""
+import os
+import argparse
+import sqlite3
+import tempfile
+import timeit
+import numpy as np
+from kadlu.geospatial.data_sources.data_util import range_query, rtree_index
+
+
+def build_database(path, hours):
+    """ global 0.25 degree grid with hourly time steps, one row per value """
+    db = sqlite3.connect(path).cursor()
+    db.execute('CREATE TABLE IF NOT EXISTS waves'
+               '( val     REAL    NOT NULL, '
+               '  lat     REAL    NOT NULL, '
+               '  lon     REAL    NOT NULL, '
+               '  time    INT     NOT NULL, '
+               '  source  TEXT    NOT NULL) ')
+    db.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_waves on waves(time, lon, lat, val, source)')
+
+    n = db.execute('SELECT COUNT(DISTINCT time) FROM waves').fetchone()[0]
+    lat, lon = np.meshgrid(np.arange(-90, 90.01, 0.25), np.arange(-180, 180, 0.25), indexing='ij')
+    rng = np.random.default_rng(0)
+    for t in range(n, hours):
+        val = rng.random(lat.size)
+        db.executemany('INSERT OR IGNORE INTO waves VALUES (?,?,?,?,?)',
+                       zip(val.tolist(), lat.ravel().tolist(), lon.ravel().tolist(), [t] * lat.size, ['era5'] * lat.size))
+        db.connection.commit()
+        print(f'  inserted hour {t + 1}/{hours}')
+
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=int, default=6, help='number of hourly global grids')
+    parser.add_argument('--path', default=os.path.join(tempfile.gettempdir(), 'kadlu_bench_rtree.db'))
+    args = parser.parse_args()
+
+    print(f'building database at {args.path} ...')
+    db = build_database(args.path, args.hours)
+    rows = db.execute('SELECT COUNT(*) FROM waves').fetchone()[0]
+    print(f'{rows} rows, {os.path.getsize(args.path) / 1e9:.2f} GB')
+
+    # 1x1 degree box over 3 hours, like the default Ocean boundaries
+    bounds = dict(lat=(44.25, 45.25), lon=(-64.5, -63.5), time=(1, 3))
+    values = tuple(v for rng in bounds.values() for v in rng)
+    plain = ('SELECT * FROM waves WHERE lat >= ? AND lat <= ? AND lon >= ? AND lon <= ? '
+             'AND time >= ? AND time <= ? ORDER BY time, lat, lon ASC')
+
+    t_plain = timeit.timeit(lambda: db.execute(plain, values).fetchall(), number=3) / 3
+    n_plain = len(db.execute(plain, values).fetchall())
+
+    def migrate():
+        rtree_index(db, 'waves')
+        db.connection.commit()
+
+    t_build = timeit.timeit(migrate, number=1)
+    print(f'R*Tree migration: {t_build:.1f} s')
+
+    sql, rtree_values = range_query('waves', bounds, order_by='time, lat, lon')
+    t_rtree = timeit.timeit(lambda: db.execute(sql, rtree_values).fetchall(), number=3) / 3
+    n_rtree = len(db.execute(sql, rtree_values).fetchall())
+    assert n_plain == n_rtree
+
+    print(f'small-box query ({n_plain} rows):')
+    print(f'  plain range query:  {t_plain * 1e3:8.1f} ms')
+    print(f'  R*Tree range query: {t_rtree * 1e3:8.1f} ms ({t_plain / t_rtree:.0f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
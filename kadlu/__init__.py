@@ -8,10 +8,12 @@ logging.basicConfig(format='%(message)s',
                     datefmt='%Y-%m-%d %I:%M:%S')
 
 from .index import index, parallelindex
+from .utils import set_precision, get_precision
 
 # data utils
 from .geospatial.data_sources.data_util import (
     database_cfg,
+    database_transaction,
     dt_2_epoch,
     epoch_2_dt,
     ext,
@@ -0,0 +1,245 @@
+"""
+    Columnar array storage for gridded data sources.
+
+    Each fetched bin is stored as a compressed numpy archive (*.npz) holding
+    a dense n-dimensional array of values together with its 1-D coordinate
+    axes. Missing values, e.g. grid points on land or below the seafloor,
+    are stored as NaN.
+
+    Tiles are stored in the folder `arrays/{table}` in the kadlu storage
+    directory. The bounding box of each tile is encoded in its filename,
+    allowing the tiles that intersect a query to be selected without
+    opening them. Loads slice each tile by index and merge the slices
+    into a single dense array.
+
+    The array store is used instead of the sqlite database when the storage
+    backend is set to `npz`, e.g.
+
+        >>> kadlu.storage_cfg().backend('npz') # doctest: +SKIP
+"""
+
+import os
+from glob import glob
+
+import numpy as np
+
+from kadlu.geospatial.data_sources.data_util import storage_cfg
+
+# tolerance used when comparing coordinates against tile bounds, which
+# are rounded to 6 decimals in the filenames
+tol = 1e-6
+
+
+def tile_dir(table):
+    """ Path to the folder containing the tiles of a table.
+
+        The folder is created if it does not exist.
+
+        Args:
+            table: str
+                Table name, e.g. `hycom_salinity`
+
+        Returns:
+            path: str
+                Folder path
+    """
+    path = os.path.join(storage_cfg(), 'arrays', table)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def tile_name(axes):
+    """ Encode the bounding box of a tile as a filename
+
+        Args:
+            axes: dict
+                1-D coordinate arrays, ordered by dimension
+
+        Returns:
+            name: str
+                Filename, e.g. `44.000000,45.000000_296.000000,297.000000.npz`
+    """
+    return '_'.join(f'{ax[0]:.6f},{ax[-1]:.6f}' for ax in axes.values()) + '.npz'
+
+
+def tile_bounds(path):
+    """ Decode the bounding box of a tile from its filename
+
+        Args:
+            path: str
+                Path to the tile
+
+        Returns:
+            bounds: list(tuple)
+                (min, max) coordinate values, ordered by dimension
+    """
+    name = os.path.basename(path)[:-len('.npz')]
+    return [tuple(map(float, b.split(','))) for b in name.split('_')]
+
+
+def grid_points(val, **coords):
+    """ Place scattered data points on a dense grid
+
+        Grid points without data are set to NaN.
+
+        Args:
+            val: array
+                Data values
+            coords: arrays
+                Coordinates of the data points, e.g. `lat=lat, lon=lon`.
+                The keyword order determines the order of the array dimensions.
+
+        Returns:
+            values: numpy array
+                Dense array of data values
+            axes: dict
+                Sorted 1-D coordinate arrays
+    """
+    axes, index = dict(), []
+    for dim, c in coords.items():
+        axes[dim], ix = np.unique(np.asarray(c, dtype=float), return_inverse=True)
+        index.append(ix)
+
+    values = np.full(tuple(map(len, axes.values())), np.nan)
+    values[tuple(index)] = val
+    return values, axes
+
+
+def save_tile(table, values, **axes):
+    """ Save a dense array of data values to the array store
+
+        Axes given in descending order are reversed.
+
+        Args:
+            table: str
+                Table name, e.g. `hycom_salinity`
+            values: numpy array
+                Data values. Missing values must be NaN.
+            axes: arrays
+                1-D coordinate arrays, e.g. `lat=lat, lon=lon`. The keyword
+                order must match the order of the array dimensions.
+
+        Returns:
+            n: int
+                Number of (non-NaN) data values stored
+    """
+    values = np.asarray(values, dtype=float)
+    axes = {dim: np.asarray(ax, dtype=float) for dim, ax in axes.items()}
+    assert values.shape == tuple(map(len, axes.values())), \
+        f'array shape {values.shape} does not match axes {tuple(axes.keys())}'
+
+    if values.size == 0:
+        return 0
+
+    # store all axes in ascending order
+    for i, (dim, ax) in enumerate(axes.items()):
+        if np.any(np.diff(ax) < 0):
+            order = np.argsort(ax, kind='stable')
+            axes[dim] = ax[order]
+            values = np.take(values, order, axis=i)
+
+    # write to a temporary file first, so that a tile is never partially written
+    path = os.path.join(tile_dir(table), tile_name(axes))
+    tmp = path[:-len('.npz')] + f'.{os.getpid()}.tmp.npz'
+    np.savez_compressed(tmp, values=values, dims=np.array(list(axes.keys())), **axes)
+    os.replace(tmp, path)
+
+    return int(np.sum(~np.isnan(values)))
+
+
+def load_tiles(table, dims, **bounds):
+    """ Load data values from the array store
+
+        Args:
+            table: str
+                Table name, e.g. `hycom_salinity`
+            dims: tuple(str)
+                Dimension names, in the order used when the tiles were saved
+            bounds: tuple(float, float)
+                Inclusive (min, max) coordinate range for each dimension,
+                e.g. `lat=(44, 45)`. Dimensions without bounds are not sliced.
+
+        Returns:
+            values: numpy array
+                Dense array of data values, with NaN where no data are available
+            axes: dict
+                1-D coordinate arrays
+    """
+    rng = [bounds.get(dim, (-np.inf, np.inf)) for dim in dims]
+
+    # select and slice the tiles intersecting the query
+    tiles = []
+    for path in sorted(glob(os.path.join(tile_dir(table), '*.npz'))):
+        if not all(lo <= b1 + tol and hi >= b0 - tol for (b0, b1), (lo, hi) in zip(tile_bounds(path), rng)):
+            continue
+
+        with np.load(path) as f:
+            axes = [f[dim] for dim in dims]
+            ix = tuple(
+                slice(np.searchsorted(ax, lo, side='left'), np.searchsorted(ax, hi, side='right'))
+                for ax, (lo, hi) in zip(axes, rng)
+            )
+            values = f['values'][ix]
+
+        if values.size > 0:
+            tiles.append((values, [ax[s] for ax, s in zip(axes, ix)]))
+
+    if len(tiles) == 0:
+        return np.empty((0, ) * len(dims)), {dim: np.array([]) for dim in dims}
+
+    # merge the slices into a single dense array
+    axes = [np.unique(np.concatenate([t[1][i] for t in tiles])) for i in range(len(dims))]
+    grid = np.full(tuple(map(len, axes)), np.nan)
+    for values, tile_axes in tiles:
+        ix = np.ix_(*[np.searchsorted(ax, tax) for ax, tax in zip(axes, tile_axes)])
+        block = grid[ix]
+        np.copyto(block, values, where=~np.isnan(values))
+        grid[ix] = block
+
+    return grid, dict(zip(dims, axes))
+
+
+def to_columns(values, axes, order):
+    """ Convert a dense array of data values to flattened columns
+
+        NaN values are removed. The rows are ordered by the array dimensions.
+
+        Args:
+            values: numpy array
+                Data values
+            axes: dict
+                1-D coordinate arrays
+            order: tuple(str)
+                Dimensions to be returned as coordinate columns
+
+        Returns:
+            cols: numpy array
+                Array with shape (1 + len(order), n) containing the data values
+                followed by the coordinate columns
+    """
+    grids = dict(zip(axes.keys(), np.meshgrid(*axes.values(), indexing='ij')))
+    keep = ~np.isnan(values.ravel())
+    return np.array([values.ravel()[keep]] + [grids[dim].ravel()[keep] for dim in order], dtype=float)
+
+
+def to_grid(values, axes, order):
+    """ Convert a dense array of data values to a gridded data dict
+
+        The array dimensions are transposed to the requested order. Unlike 
+        `to_columns`, the values are not flattened, see `data_util.as_grid`.
+
+        Args:
+            values: numpy array
+                Data values
+            axes: dict
+                1-D coordinate arrays
+            order: tuple(str)
+                Dimension order of the returned array
+
+        Returns:
+            data: dict
+                The data values `value`, the 1-D coordinate arrays, and `mask`,
+                which is True where no data are available
+    """
+    values = np.transpose(values, [list(axes.keys()).index(dim) for dim in order])
+    return dict(value=values, **{dim: np.asarray(axes[dim], dtype=float) for dim in order}, mask=np.isnan(values))
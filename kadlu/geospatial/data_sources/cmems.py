@@ -23,6 +23,7 @@ import numpy.ma as ma
 from kadlu import index
 from kadlu.geospatial.data_sources.data_util import (
     database_cfg,
+    database_transaction,
     dt_2_epoch,
     logmsg,
     logmsg_nodata,
@@ -101,18 +102,15 @@ def clear_cache_cmems():
     logger.info(info_msg)
 
 
-def fetch_cmems(var, *, west, east, south, north, start, **_):
-    """ Fetch global CMEMS data for specified variable, geographic region, and time range.
+def download_cmems(var, *, west, east, south, north, start, **_):
+    """ Download CMEMS data for specified variable, geographic region, and day.
 
-        Downloads 24-hours of global data on the specified day, and saves these data to 
+        Downloads 24-hours of data on the specified day, and saves these data to 
         a *.nc file in the kadlu data storage directory.
 
         The *.nc file can be deleted manually by calling the `clear_cache_cmems` function 
         to save disk space, if necessary.
 
-        Only data within the specified geographic boundaries (`west`, `east`, `south`, `north`) 
-        are inserted into the kadlu geospatial.db database.
-
         args:
             var: string
                 The variable short name of desired wave parameter according to CMEMS docs. 
@@ -122,7 +120,9 @@ def fetch_cmems(var, *, west, east, south, north, start, **_):
                 UTC date of the data request. 24-hours of data will be fetched.
                 
         return:
-            True if new data was fetched, else False
+            data: numpy array
+                Array with rows (values, lats, lons, times, source), or None
+                if the *.nc file was already downloaded
     """
     logger = logging.getLogger("kadlu")
 
@@ -222,20 +222,51 @@ def fetch_cmems(var, *, west, east, south, north, start, **_):
         ['cmems' for _ in vals],
     ])
 
+    return data
+
+
+def fetch_cmems(var, *, west, east, south, north, start, data=None, **_):
+    """ Fetch global CMEMS data for specified variable, geographic region, and time range.
+
+        Downloads 24-hours of data on the specified day using `download_cmems`.
+
+        Only data within the specified geographic boundaries (`west`, `east`, `south`, `north`) 
+        are inserted into the kadlu geospatial.db database.
+
+        args:
+            var: string
+                The variable short name of desired wave parameter according to CMEMS docs. 
+            west,east,south,north: float
+                Geographic boundaries of the data request
+            start: datetime.datetime
+                UTC date of the data request. 24-hours of data will be fetched.
+            data: numpy array
+                Data returned by `download_cmems`. If None, the data are downloaded first.
+                
+        return:
+            True if new data was fetched, else False
+    """
+    if data is None:
+        data = download_cmems(var, west=west, east=east, south=south, north=north, start=start)
+
+    if data is None:
+        return
+
+    # time window
+    start = datetime(start.year, start.month, start.day)
+    end = start + timedelta(days=1)
+
     # SQL table name
     table = var
 
     # perform the insertion into the database
     initdb()
-    conn, db = database_cfg()
-    n1 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
-    db.executemany(
-        f"INSERT OR IGNORE INTO {table} "
-        f"VALUES (?,?,?,CAST(? AS INT),?)", data.T)
-    n2 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
-    db.execute("COMMIT")
-    conn.commit()
-    conn.close()
+    with database_transaction() as db:
+        n1 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
+        db.executemany(
+            f"INSERT OR IGNORE INTO {table} "
+            f"VALUES (?,?,?,CAST(? AS INT),?)", data.T)
+        n2 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
 
     # log message
     kwargs = dict(
@@ -282,13 +313,14 @@ def load_cmems(var, *, west, east, south, north, start, end, fetch=True, **_):
         # Check local database for data.
         # Fetch data from Copernicus API, if missing.
         with index(storagedir=storage_cfg(),
+                source='cmems',
                 west=west,
                 east=east,
                 south=south,
                 north=north,
                 start=start,
                 end=end) as fetchmap:
-            fetchmap(callback=fetch_cmems, var=var)
+            fetchmap(callback=fetch_cmems, fetch=download_cmems, var=var)
 
     # connect to local database
     conn, db = database_cfg()
@@ -0,0 +1,221 @@
+"""
+    Compact typed storage for gridded data sources in the geospatial.db database.
+
+    Compared with the default schema, which stores one row of
+    (val REAL, lat REAL, lon REAL, time INT, source TEXT) per grid value,
+    the compact schema stores
+
+        * data values as integers, quantized with a per-table scale and offset.
+          Tables without a scale store the values as REAL.
+        * coordinates as integer grid indices. The coordinate value of each
+          grid index is stored in the `compact_axes` table.
+        * the data source, scale, and offset once per table, in the
+          `compact_tables` table.
+
+    Data tables are named `{table}_compact` and clustered on their grid index
+    columns (WITHOUT ROWID), so no separate index is needed.
+
+    Data are saved and loaded as dense arrays, in the same way as for the
+    array store (see array_store.py). Loads rehydrate the values to floats.
+
+    The compact schema is used when the storage backend is set to `compact`, e.g.
+
+        >>> kadlu.storage_cfg().backend('compact') # doctest: +SKIP
+"""
+
+import numpy as np
+
+from kadlu.geospatial.data_sources.data_util import (
+    database_cfg,
+    database_transaction,
+)
+
+
+def initdb(db):
+    """ Create the metadata tables of the compact schema """
+    db.execute('CREATE TABLE IF NOT EXISTS compact_tables'
+               '( name    TEXT    NOT NULL PRIMARY KEY, '
+               '  source  TEXT    NOT NULL, '
+               '  dims    TEXT    NOT NULL, '
+               '  scale_factor  REAL, '
+               '  add_offset    REAL    NOT NULL) ')
+    db.execute('CREATE TABLE IF NOT EXISTS compact_axes'
+               '( name    TEXT    NOT NULL, '
+               '  dim     TEXT    NOT NULL, '
+               '  idx     INT     NOT NULL, '
+               '  value   REAL    NOT NULL, '
+               '  PRIMARY KEY (name, dim, idx)) WITHOUT ROWID')
+    db.execute('CREATE UNIQUE INDEX IF NOT EXISTS '
+               'idx_compact_axes on compact_axes(name, dim, value)')
+
+
+def table_meta(db, table):
+    """ Get the metadata of a compact table
+
+        Returns:
+            meta: dict
+                Keys are source, dims, scale, offset. None if the table does not exist.
+    """
+    initdb(db)
+    row = db.execute('SELECT source, dims, scale_factor, add_offset FROM compact_tables WHERE name = ?',
+                     (table, )).fetchone()
+    if row is None:
+        return None
+
+    source, dims, scale, offset = row
+    return dict(source=source, dims=tuple(dims.split(',')), scale=scale, offset=offset)
+
+
+def axis_index(db, table, dim, values):
+    """ Convert coordinate values to grid indices
+
+        Coordinate values that have not been seen before are assigned new indices.
+
+        Args:
+            db:
+                Connection cursor object
+            table: str
+                Table name
+            dim: str
+                Dimension name
+            values: array
+                Coordinate values
+
+        Returns:
+            idx: numpy array
+                Grid indices
+    """
+    rows = db.execute('SELECT value, idx FROM compact_axes WHERE name = ? AND dim = ?',
+                      (table, dim)).fetchall()
+    index = dict(rows)
+
+    new = [v for v in dict.fromkeys(np.asarray(values, dtype=float).tolist()) if v not in index]
+    if len(new) > 0:
+        first = max(index.values(), default=-1) + 1
+        index.update(zip(new, range(first, first + len(new))))
+        db.executemany('INSERT INTO compact_axes VALUES (?,?,?,?)',
+                       ((table, dim, index[v], v) for v in new))
+
+    return np.array([index[v] for v in np.asarray(values, dtype=float).tolist()], dtype=np.int64)
+
+
+def save_tile(table, values, *, source, scale=None, offset=0, **axes):
+    """ Save a dense array of data values using the compact schema
+
+        Args:
+            table: str
+                Table name, e.g. `hycom_salinity`
+            values: numpy array
+                Data values. Missing values must be NaN, and are not stored.
+            source: str
+                Data source, e.g. `hycom`
+            scale, offset: float
+                Values are stored as the integers round((values - offset) / scale).
+                If scale is None, values are stored as floats.
+            axes: arrays
+                1-D coordinate arrays, e.g. `lat=lat, lon=lon`. The keyword
+                order must match the order of the array dimensions.
+
+        Returns:
+            n: int
+                Number of new values stored
+    """
+    values = np.asarray(values, dtype=float)
+    assert values.shape == tuple(map(len, axes.values())), \
+        f'array shape {values.shape} does not match axes {tuple(axes.keys())}'
+
+    dims = tuple(axes.keys())
+    keep = ~np.isnan(values)
+
+    if scale is None:
+        val = values[keep]
+    else:
+        val = np.rint((values[keep] - offset) / scale).astype(np.int64)
+
+    with database_transaction() as db:
+        meta = table_meta(db, table)
+        if meta is None:
+            db.execute(f'CREATE TABLE IF NOT EXISTS {table}_compact'
+                       f'( val {"REAL" if scale is None else "INT"} NOT NULL, '
+                       + ''.join(f'{dim} INT NOT NULL, ' for dim in dims)
+                       + f'PRIMARY KEY ({", ".join(dims)})) WITHOUT ROWID')
+            db.execute('INSERT INTO compact_tables VALUES (?,?,?,?,?)',
+                       (table, source, ','.join(dims), scale, offset))
+        else:
+            assert meta['dims'] == dims and meta['scale'] == scale and meta['offset'] == offset, \
+                f'compact table {table} was created with different dimensions or scaling: {meta}'
+
+        # grid indices of the stored values
+        idx = [
+            axis_index(db, table, dim, ax)[ix]
+            for dim, ax, ix in zip(dims, axes.values(), np.nonzero(keep))
+        ]
+
+        n1 = db.execute(f'SELECT COUNT(*) FROM {table}_compact').fetchone()[0]
+        db.executemany(
+            f'INSERT OR IGNORE INTO {table}_compact VALUES ({",".join("?" * (len(dims) + 1))})',
+            zip(val.tolist(), *(ix.tolist() for ix in idx)))
+        n2 = db.execute(f'SELECT COUNT(*) FROM {table}_compact').fetchone()[0]
+
+    return n2 - n1
+
+
+def load_tiles(table, dims, **bounds):
+    """ Load data values stored using the compact schema
+
+        Args:
+            table: str
+                Table name, e.g. `hycom_salinity`
+            dims: tuple(str)
+                Dimension names, in the order used when the data were saved
+            bounds: tuple(float, float)
+                Inclusive (min, max) coordinate range for each dimension,
+                e.g. `lat=(44, 45)`. Dimensions without bounds are not sliced.
+
+        Returns:
+            values: numpy array
+                Dense array of data values, with NaN where no data are available
+            axes: dict
+                1-D coordinate arrays
+    """
+    empty = np.empty((0, ) * len(dims)), {dim: np.array([]) for dim in dims}
+
+    conn, db = database_cfg()
+    meta = table_meta(db, table)
+    if meta is None:
+        return empty
+
+    assert meta['dims'] == tuple(dims), f'compact table {table} has dimensions {meta["dims"]}'
+
+    # coordinate values and grid indices within the query boundaries
+    axes, idx = dict(), dict()
+    for dim in dims:
+        lo, hi = bounds.get(dim, (-np.inf, np.inf))
+        rows = db.execute(
+            'SELECT value, idx FROM compact_axes WHERE name = ? AND dim = ? '
+            'AND value >= ? AND value <= ? ORDER BY value', (table, dim, lo, hi)).fetchall()
+        if len(rows) == 0:
+            return empty
+        axes[dim], idx[dim] = np.array(rows).T
+        idx[dim] = idx[dim].astype(np.int64)
+
+    sql = (f'SELECT val, {", ".join(dims)} FROM {table}_compact WHERE '
+           + ' AND '.join(f'{dim} IN ({",".join(map(str, idx[dim]))})' for dim in dims))
+    rows = np.array(db.execute(sql).fetchall(), dtype=float)
+
+    # place the values on a dense grid and rehydrate them
+    values = np.full(tuple(map(len, axes.values())), np.nan)
+    if len(rows) > 0:
+        position = []
+        for i, dim in enumerate(dims):
+            lookup = np.zeros(idx[dim].max() + 1, dtype=np.int64)
+            lookup[idx[dim]] = np.arange(len(idx[dim]))
+            position.append(lookup[rows[:, i + 1].astype(np.int64)])
+
+        val = rows[:, 0]
+        if meta['scale'] is not None:
+            val = val * meta['scale'] + meta['offset']
+
+        values[tuple(position)] = val
+
+    return values, axes
@@ -6,16 +6,126 @@ import configparser
 import logging
 import os
 import sqlite3
+import threading
 import warnings
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from functools import reduce, partial
 from os.path import dirname
 
 import numpy as np
+from scipy.ndimage import distance_transform_edt
 
 ext = lambda filepath, extensions: isinstance(extensions, tuple) and any(
     x.lower() == filepath.lower()[-len(x):] for x in extensions)
 
+# storage backends for gridded data sources:
+#   sqlite: one row per grid value in the geospatial.db database
+#   npz: one compressed n-dimensional array per fetched bin, see array_store.py
+#   compact: quantized values and grid-index coordinates in the geospatial.db
+#            database, see compact_store.py
+storage_backends = ('sqlite', 'npz', 'compact')
+
+
+# connection settings applied to each pooled database connection.
+# WAL journaling lets readers proceed while a writer is active, and
+# the busy timeout makes writers wait for locks instead of failing
+# with 'database is locked'
+database_timeout = 60
+database_pragmas = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-65536',  # 64 MB
+    'PRAGMA mmap_size=268435456',  # 256 MB
+    'PRAGMA temp_store=MEMORY',
+)
+
+# pooled connections, one per database file for each thread
+_pool = threading.local()
+
+
+class PooledConnection():
+    """ sqlite connection that is kept open for reuse
+
+        behaves like sqlite3.Connection, except that close() rolls back
+        uncommitted changes without closing the underlying connection.
+        while a transaction opened with database_transaction is active,
+        close() and commit() have no effect, and the transaction is
+        ended by database_transaction
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.depth = 0  # number of nested managed transactions
+
+    def __getattr__(self, attr):
+        return getattr(self.conn, attr)
+
+    def commit(self):
+        if self.depth == 0:
+            self.conn.commit()
+
+    def close(self):
+        if self.depth == 0 and self.conn.in_transaction:
+            self.conn.rollback()
+
+    @contextmanager
+    def transaction(self):
+        """ managed transaction
+
+            the outermost transaction is started with BEGIN IMMEDIATE and
+            committed on exit. nested transactions, and transactions opened
+            while an unmanaged transaction is pending, are run in a savepoint
+            that is released on exit, leaving the enclosing transaction open.
+            on errors, the changes made within the transaction are rolled back
+        """
+        savepoint = f'kadlu_{self.depth}' if self.conn.in_transaction else None
+        self.conn.execute(f'SAVEPOINT {savepoint}' if savepoint else 'BEGIN IMMEDIATE')
+        self.depth += 1
+        try:
+            yield
+        except BaseException:
+            if savepoint:
+                self.conn.execute(f'ROLLBACK TO {savepoint}')
+                self.conn.execute(f'RELEASE {savepoint}')
+            else:
+                self.conn.rollback()
+            raise
+        else:
+            if savepoint:
+                self.conn.execute(f'RELEASE {savepoint}')
+            else:
+                self.conn.commit()
+        finally:
+            self.depth -= 1
+
+
+def connect(path):
+    """ get the pooled connection to an sqlite database
+
+        connections are reused within each thread and process. new
+        connections are configured with the pragmas in database_pragmas
+
+        args:
+            path: str
+                database filepath
+
+        returns:
+            conn: PooledConnection
+    """
+    # connections must not be shared with forked child processes
+    if getattr(_pool, 'pid', None) != os.getpid():
+        _pool.pid = os.getpid()
+        _pool.connections = {}
+
+    if path not in _pool.connections:
+        conn = sqlite3.connect(path, timeout=database_timeout)
+        for pragma in database_pragmas:
+            conn.execute(pragma)
+        _pool.connections[path] = PooledConnection(conn)
+
+    return _pool.connections[path]
+
 
 def database_cfg():
     """ configure and connect to sqlite database
@@ -23,33 +133,161 @@ def database_cfg():
         time is stored as an integer in the database, where each value
         is epoch hours since 2000-01-01 00:00
 
+        the connection is pooled and reused by subsequent calls from
+        the same thread
+
         returns:
             conn:
                 database connection object
             db:
                 connection cursor object
     """
-    conn = sqlite3.connect(storage_cfg() + 'geospatial.db')
+    conn = connect(storage_cfg() + 'geospatial.db')
     db = conn.cursor()
 
     return conn, db
 
 
+@contextmanager
+def database_transaction():
+    """ run a series of database statements inside a single transaction
+
+        the transaction is committed on exit, or rolled back if an
+        exception is raised. the write lock is acquired when entering
+        the transaction, so that concurrent writers wait for each other
+        rather than failing part-way through
+
+        transactions may be nested, e.g. by calling a function that opens
+        a transaction from within another transaction. nested transactions
+        are run in a savepoint, and the changes are committed when the
+        outermost transaction exits. while a transaction is active, calls
+        to close() or commit() on the pooled connection have no effect
+
+        >>> with database_transaction() as db: # doctest: +SKIP
+        ...     db.executemany('INSERT OR IGNORE INTO gebco VALUES (?,?,?)', rows)
+
+        yields:
+            db:
+                connection cursor object
+    """
+    conn, db = database_cfg()
+    with conn.transaction():
+        yield db
+
+
+# tables with an up-to-date R*Tree index, per database file, see rtree_index
+_rtree_tables = set()
+
+
+def rtree_index(db, table, dims=('lat', 'lon', 'time')):
+    """ create an R*Tree index over the coordinate columns of a table
+
+        the index is stored in the virtual table rtree_{table} and kept up
+        to date by insert and delete triggers. rows that were inserted before
+        the index was created are added to the index, so that existing
+        databases are migrated the first time this function is called.
+        the index is only checked once per process for each table
+
+        the changes are not committed, this is left to the caller, e.g.
+        by calling this function within a database_transaction
+
+        args:
+            db:
+                connection cursor object
+            table: str
+                table name
+            dims: tuple(str)
+                coordinate columns to be indexed
+    """
+    # in-memory databases have no filename, and are always checked
+    path = db.execute('PRAGMA database_list').fetchone()[2]
+    if path and (path, table) in _rtree_tables:
+        return
+
+    rtree = f'rtree_{table}'
+    bounds = ', '.join(f'min_{d}, max_{d}' for d in dims)
+    values = ', '.join(f'{{0}}.{d}, {{0}}.{d}' for d in dims)
+
+    db.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {rtree} USING rtree(id, {bounds})')
+    db.execute(f'CREATE TRIGGER IF NOT EXISTS {rtree}_insert AFTER INSERT ON {table} '
+               f'BEGIN INSERT INTO {rtree} VALUES (new.rowid, {values.format("new")}); END')
+    db.execute(f'CREATE TRIGGER IF NOT EXISTS {rtree}_delete AFTER DELETE ON {table} '
+               f'BEGIN DELETE FROM {rtree} WHERE id = old.rowid; END')
+
+    # migration: index rows that are not yet in the R*Tree. the ids of the
+    # R*Tree are looked up in its rowid shadow table to avoid a full scan
+    n_rtree = db.execute(f'SELECT IFNULL(MAX(rowid), 0) FROM {rtree}_rowid').fetchone()[0]
+    n_table = db.execute(f'SELECT IFNULL(MAX(rowid), 0) FROM {table}').fetchone()[0]
+    if n_table > n_rtree:
+        logging.info(f'building spatial index for table {table} ...')
+        db.execute(f'INSERT INTO {rtree} SELECT rowid, {values.format(table)} '
+                   f'FROM {table} WHERE rowid > ?', (n_rtree, ))
+
+    if path:
+        _rtree_tables.add((path, table))
+
+
+def range_query(table, bounds, columns='*', where=None, order_by=None):
+    """ build an SQL query selecting the rows of a table within a bounding box
+
+        rows are preselected using the R*Tree index of the table, which must
+        have been created with rtree_index, e.g. by the initdb function of
+        the data source. the exact range predicates are then applied to the
+        preselected rows.
+
+        args:
+            table: str
+                table name
+            bounds: dict
+                inclusive (min, max) range for each coordinate column,
+                e.g. dict(lat=(44, 45), lon=(-64, -63))
+            columns: str
+                columns to be selected
+            where: str
+                additional SQL condition
+            order_by: str
+                columns to order the result by
+
+        returns:
+            sql: str
+                SQL query
+            values: tuple
+                query parameters
+    """
+    rtree_cond = ' AND '.join(f'max_{d} >= ? AND min_{d} <= ?' for d in bounds)
+    range_cond = ' AND '.join(f'{d} >= ? AND {d} <= ?' for d in bounds)
+    sql = (f'SELECT {columns} FROM {table} '
+           f'WHERE rowid IN (SELECT id FROM rtree_{table} WHERE {rtree_cond}) '
+           f'AND {range_cond}')
+    if where is not None:
+        sql += f' AND {where}'
+    if order_by is not None:
+        sql += f' ORDER BY {order_by} ASC'
+
+    values = tuple(v for rng in bounds.values() for v in rng)
+    return sql, values + values
+
+
 class storage_cfg(os.PathLike):
     """ return filepath containing storage configuration string
 
         first checks the config.ini file in kadlu root folder, then
-        defaults to kadlu/storage
+        defaults to kadlu/storage. the resolved location is cached, and
+        only updated when a new directory is set
     """
     """
     __file__  = '/home/matt_s/kadlu/kadlu/geospatial/data_sources/data_util.py'
     """
     cfg = configparser.ConfigParser()  # read .ini into dictionary object
 
+    # resolved storage location, cached after the first successful lookup
+    location = None
+
     def __init__(self, setdir=None):
-        self.cfg.read(
-            os.path.join(dirname(dirname(dirname(dirname(__file__)))),
-                         "config.ini"))
+        if storage_cfg.location is None or setdir:
+            self.cfg.read(
+                os.path.join(dirname(dirname(dirname(dirname(__file__)))),
+                             "config.ini"))
         if setdir:
             self.__call__(setdir)
 
@@ -66,6 +304,9 @@ class storage_cfg(os.PathLike):
         return storage_location
 
     def __call__(self, setdir=None) -> str:
+        if setdir is None and storage_cfg.location is not None:
+            return storage_cfg.location
+
         if 'storage' not in self.cfg.sections():
             self.cfg.add_section('storage')
 
@@ -89,9 +330,43 @@ class storage_cfg(os.PathLike):
             return self.default_storage('storage location does not exist.')
 
         if storage_location[-1] != os.path.sep:
-            return storage_location + os.path.sep
+            storage_location += os.path.sep
+        else:
+            storage_location = str(os.path.abspath(storage_location))
+
+        storage_cfg.location = storage_location
+        return storage_location
+
+    def backend(self, set_backend=None) -> str:
+        """ return the storage backend used for gridded data sources
+
+            the backend is read from the config.ini file in kadlu root folder,
+            and defaults to sqlite
+
+            args:
+                set_backend: str
+                    if given, the backend is updated in the config.ini file.
+                    options are 'sqlite', 'npz', and 'compact'
+
+            returns:
+                backend: str
+        """
+        if 'storage' not in self.cfg.sections():
+            self.cfg.add_section('storage')
+
+        if set_backend is not None:
+            assert set_backend in storage_backends, \
+                f'invalid storage backend. valid options are: {storage_backends}'
+            self.cfg.set('storage', 'storage_backend', set_backend)
+            with open(
+                    os.path.join(dirname(dirname(dirname(dirname(__file__)))),
+                                 "config.ini"), 'w') as f:
+                self.cfg.write(f)
 
-        return str(os.path.abspath(storage_location))
+        backend = self.cfg['storage'].get('storage_backend', 'sqlite')
+        assert backend in storage_backends, \
+            f'invalid storage backend {backend} in config.ini. valid options are: {storage_backends}'
+        return backend
 
     def __repr__(self) -> str:
         return self.__str__()
@@ -109,6 +384,48 @@ class storage_cfg(os.PathLike):
         return ''.join([self.__str__(), other.__str__()])
 
 
+def backend_kwargs():
+    """ keyword arguments passed to the index and fetch callbacks of gridded
+        data sources for the current storage backend
+
+        the backend is included in the arguments hashed by the index, so that
+        data are fetched again when the backend is changed. it is omitted for
+        the default sqlite backend, so that bins cached before the other
+        backends were introduced are still found
+
+        returns:
+            kwargs: dict
+                `dict(backend=backend)`, or an empty dict for sqlite
+    """
+    backend = storage_cfg().backend()
+    return dict(backend=backend) if backend != 'sqlite' else dict()
+
+
+def load_tiles(table, dims, **bounds):
+    """ load gridded data from the store used by the current storage backend:
+        the compact database schema if the backend is compact, otherwise the
+        npz array store
+
+        args:
+            table: str
+                table name, e.g. `hycom_salinity`
+            dims: tuple(str)
+                dimension names, in the order used when the data were saved
+            bounds: tuple(float, float)
+                inclusive (min, max) coordinate range for each dimension
+
+        returns:
+            values: numpy array
+                dense array of data values, with NaN where no data are available
+            axes: dict
+                1-D coordinate arrays
+    """
+    # the stores import this module, so they are imported on first use
+    from kadlu.geospatial.data_sources import array_store, compact_store
+    store = compact_store if storage_cfg().backend() == 'compact' else array_store
+    return store.load_tiles(table, dims, **bounds)
+
+
 def verbosity(set_verbosity=None):
     '''
     __file__ = '/home/matt/kadlu/kadlu/geospatial/data_sources/data_util.py'
@@ -191,19 +508,130 @@ def reshape_3D(cols):
     return dict(values=cols[0], lats=cols[1], lons=cols[2], depths=cols[3])
 
 
+def grid_values(vals, *coords):
+    """ place flattened data values on a dense grid
+
+        args:
+            vals: array
+                data values
+            coords: arrays
+                coordinates of the data values, one array per grid axis
+
+        return:
+            gridspace: numpy array
+                dense grid of values, with NaN where no data is available.
+                if a grid point occurs more than once, the last value is used
+            grids: list of numpy arrays
+                sorted unique coordinates along each grid axis
+    """
+    grids, index = [], []
+    for c in coords:
+        grid, ix = np.unique(np.asarray(c, dtype=float), return_inverse=True)
+        grids.append(grid)
+        index.append(ix)
+
+    gridspace = np.full(tuple(map(len, grids)), np.nan)
+    gridspace[tuple(index)] = np.asarray(vals, dtype=float)
+    return gridspace, grids
+
+
+def fill_depth(gridspace, axis=2):
+    """ fill missing values in a gridded array for interpolation
+
+        missing values in each depth column are filled with the last value
+        above them, or the first value below them if there is no value above.
+        columns without values are filled with the average value in each
+        depth plane
+
+        args:
+            gridspace: numpy array
+                gridded values with NaN where no data is available. modified
+                in place
+            axis: int
+                depth axis
+
+        return:
+            gridspace: numpy array
+                the filled array
+    """
+    # forward-fill along the depth axis, then back-fill any leading gaps
+    for flip in (False, True):
+        a = np.flip(gridspace, axis) if flip else gridspace
+        shape = [1] * a.ndim
+        shape[axis] = a.shape[axis]
+        idx = np.where(np.isnan(a), 0, np.arange(a.shape[axis]).reshape(shape))
+        np.maximum.accumulate(idx, axis=axis, out=idx)
+        a[...] = np.take_along_axis(a, idx, axis=axis)
+
+    # null depth columns are filled with the average value at each depth plane
+    mask = np.isnan(gridspace)
+    if mask.any():
+        planes = tuple(i for i in range(gridspace.ndim) if i != axis)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)  # empty planes
+            mean = np.nanmean(gridspace, axis=planes, keepdims=True)
+        np.copyto(gridspace, np.broadcast_to(mean, gridspace.shape), where=mask)
+
+    return gridspace
+
+
+def fill_nearest(values, mask=None):
+    """ replace missing values with the value of the nearest grid point
+
+        distances are measured in grid steps
+
+        args:
+            values: numpy array
+                gridded values
+            mask: numpy array
+                boolean array which is True where values are missing.
+                defaults to the NaN values
+
+        return:
+            filled: numpy array
+                the filled array. a copy is returned if any values were missing
+    """
+    if mask is None:
+        mask = np.isnan(values)
+
+    if not mask.any() or mask.all():
+        return values
+
+    index = distance_transform_edt(mask, return_distances=False, return_indices=True)
+    return values[tuple(index)]
+
+
+def as_grid(rowdata, dims=('lat', 'lon', 'epoch', 'depth')):
+    """ convert flattened rows of data to a dense grid
+
+        args:
+            rowdata: numpy array
+                array with shape (1 + len(dims), n) containing the data values
+                followed by the coordinate columns
+            dims: tuple(str)
+                names of the coordinate columns
+
+        return:
+            data: dict
+                the gridded data values `value`, with one axis per dimension,
+                the sorted 1-D coordinate arrays, and `mask`, which is True
+                where no data is available, e.g. on land or below the seafloor.
+                missing values are NaN
+    """
+    value, grids = grid_values(rowdata[0], *rowdata[1:len(dims) + 1])
+    return dict(value=value, **dict(zip(dims, grids)), mask=np.isnan(value))
+
+
 def reshape_4D(cols):
     """ prepare loaded data for interpolation
 
-        TODO: review, validate and cleanup this function
-                especially the replacement of nan values!
-
         args:
             cols: flattened numpy array of shape (5, n)
                 cols[0]: values
                 cols[1]: latitude
                 cols[2]: longitude
-                cols[3]: depth
-                cols[4]: time (hours since )
+                cols[3]: time (hours since 2000-01-01)
+                cols[4]: depth
 
         return: gridded
             dict(values=gridspace, lats=ygrid, lons=xgrid, depths=zgrid, times=tgrid)
@@ -214,35 +642,11 @@ def reshape_4D(cols):
 
     vals, y, x, t, z = cols
 
-    rows = np.array((vals, y, x, z, t)).T
-
     # reshape row data to 4D array
-    xgrid, ygrid, zgrid, tgrid = np.unique(x), np.unique(y), np.unique(z), np.unique(t)
-    gridspace = np.full((len(ygrid), len(xgrid), len(zgrid), len(tgrid)),
-                        fill_value=None,
-                        dtype=float)
-
-    # this could potentially be optimized to avoid an index lookup cost
-    for row in rows:
-        x_ix = index_arr(row[2], xgrid)
-        y_ix = index_arr(row[1], ygrid)
-        z_ix = index_arr(row[3], zgrid)
-        t_ix = index_arr(row[4], tgrid)
-        gridspace[y_ix, x_ix, z_ix, t_ix] = row[0]
-
-    # remove nulls for interpolation:
-    # fill missing depth values with last value in each column
-    for xi in range(0, gridspace.shape[0]):
-        for yi in range(0, gridspace.shape[1]):
-            col = gridspace[xi, yi]
-            if np.sum(np.isnan(col)) > 0 and np.sum(np.isnan(col)) < len(col):
-                col[np.isnan(col)] = col[~np.isnan(col)][-1]
-                gridspace[xi, yi] = col
+    gridspace, (ygrid, xgrid, zgrid, tgrid) = grid_values(vals, y, x, z, t)
 
-    # null depth columns are filled with the average value at each depth plane
-    for zi in range(0, gridspace.shape[2]):
-        gridspace[:, :, zi, :][np.isnan(gridspace[:, :, zi, :])] = np.average(
-            gridspace[:, :, zi, :][~np.isnan(gridspace[:, :, zi, :])])
+    # remove nulls for interpolation
+    fill_depth(gridspace, axis=2)
 
     return dict(values=gridspace, lats=ygrid, lons=xgrid, depths=zgrid, times=tgrid)
 
@@ -250,14 +654,13 @@ def reshape_4D(cols):
 def reshape_3D_gridded(cols):
     """ prepare loaded data for interpolation
 
-        TODO: review and cleanup this function
-
         args:
-            cols: flattened numpy array of shape (4, n)
+            cols: flattened numpy array of shape (5, n)
                 cols[0]: values
                 cols[1]: latitude
                 cols[2]: longitude
-                cols[3]: depth
+                cols[3]: time (hours since 2000-01-01)
+                cols[4]: depth
 
         return: gridded
             dict(values=gridspace, lats=ygrid, lons=xgrid, depths=zgrid)
@@ -276,34 +679,11 @@ def reshape_3D_gridded(cols):
     else:
         vals, y, x, _, z = cols
 
-    rows = np.array((vals, y, x, z)).T
-
     # reshape row data to 3D array
-    xgrid, ygrid, zgrid = np.unique(x), np.unique(y), np.unique(z)
-    gridspace = np.full((len(ygrid), len(xgrid), len(zgrid)),
-                        fill_value=None,
-                        dtype=float)
-
-    # this could potentially be optimized to avoid an index lookup cost
-    for row in rows:
-        x_ix = index_arr(row[2], xgrid)
-        y_ix = index_arr(row[1], ygrid)
-        z_ix = index_arr(row[3], zgrid)
-        gridspace[y_ix, x_ix, z_ix] = row[0]
-
-    # remove nulls for interpolation:
-    # fill missing depth values with last value in each column
-    for xi in range(0, gridspace.shape[0]):
-        for yi in range(0, gridspace.shape[1]):
-            col = gridspace[xi, yi]
-            if sum(np.isnan(col)) > 0 and sum(np.isnan(col)) < len(col):
-                col[np.isnan(col)] = col[~np.isnan(col)][-1]
-                gridspace[xi, yi] = col
+    gridspace, (ygrid, xgrid, zgrid) = grid_values(vals, y, x, z)
 
-    # null depth columns are filled with the average value at each depth plane
-    for zi in range(0, gridspace.shape[2]):
-        gridspace[:, :, zi][np.isnan(gridspace[:, :, zi])] = np.average(
-            gridspace[:, :, zi][~np.isnan(gridspace[:, :, zi])])
+    # remove nulls for interpolation
+    fill_depth(gridspace, axis=2)
 
     return dict(values=gridspace, lats=ygrid, lons=xgrid, depths=zgrid)
 
@@ -17,6 +17,7 @@ import os
 import logging
 import warnings
 import platform
+import threading
 from os.path import isfile, dirname
 from glob import glob
 from datetime import datetime, timedelta
@@ -31,11 +32,18 @@ else:
     import pygrib
 
 from kadlu import index
+from kadlu.geospatial.data_sources import array_store, compact_store
 from kadlu.geospatial.data_sources.data_util import (
+    as_grid,
+    backend_kwargs,
     database_cfg,
+    database_transaction,
     dt_2_epoch,
+    load_tiles,
     logmsg,
     logmsg_nodata,
+    range_query,
+    rtree_index,
     storage_cfg,
     str_def,
 )
@@ -60,23 +68,26 @@ era5_tables = [
     'surface_solar_radiation_downwards',  #https://codes.ecmwf.int/grib/param-db/169
 ]
 
+# dimensions of the arrays in the array store
+era5_dims = ('epoch', 'lat', 'lon')
+
 
 logging.getLogger('cdsapi').setLevel(logging.WARNING)
 
 
 def initdb():
     """ Create tables in kadlu's geospatial.db database for storing ERA5 data"""
-    conn, db = database_cfg()
-    for var in era5_tables:
-        db.execute(f'CREATE TABLE IF NOT EXISTS {var}'
-                   '( val     REAL    NOT NULL, '
-                   '  lat     REAL    NOT NULL, '
-                   '  lon     REAL    NOT NULL, '
-                   '  time    INT     NOT NULL, '
-                   '  source  TEXT    NOT NULL) ')
-        db.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS '
-                   f'idx_{var} on {var}(time, lon, lat, val, source)')
-    conn.close()
+    with database_transaction() as db:
+        for var in era5_tables:
+            db.execute(f'CREATE TABLE IF NOT EXISTS {var}'
+                       '( val     REAL    NOT NULL, '
+                       '  lat     REAL    NOT NULL, '
+                       '  lon     REAL    NOT NULL, '
+                       '  time    INT     NOT NULL, '
+                       '  source  TEXT    NOT NULL) ')
+            db.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS '
+                       f'idx_{var} on {var}(time, lon, lat, val, source)')
+            rtree_index(db, var)
 
 
 def clear_cache_era5():
@@ -109,8 +120,19 @@ def clear_cache_era5():
     logger.info(info_msg)
 
 
-def fetch_era5(var, *, west, east, south, north, start, **_):
-    """ Fetch global ERA5 data for specified variable, geographic region, and time range.
+_download_locks = {}
+_download_locks_guard = threading.Lock()
+
+
+def _download_lock(target):
+    """ lock guarding the download of the given file """
+    with _download_locks_guard:
+        return _download_locks.setdefault(target, threading.Lock())
+
+
+def download_era5(var, *, west, east, south, north, start, **_):
+    """ Download global ERA5 data for specified variable and day, and decode the
+        data within the specified geographic region.
 
         Downloads 24-hours of global data on the specified day, and saves these data to 
         a *.grb2 file in the kadlu data storage directory, using the recommended spatial 
@@ -119,21 +141,17 @@ def fetch_era5(var, *, west, east, south, north, start, **_):
         The *.grb2 file can be deleted manually by calling the `clear_cache_era5` function 
         to save disk space, if necessary.
 
-        Only data within the specified geographic boundaries (`west`, `east`, `south`, `north`) 
-        are inserted into the kadlu geospatial.db database.
-
         args:
             var: string
                 The variable short name of desired wave parameter according to ERA5 docs. 
-                The complete list can be found here (table 7 for wave params):
-                https://confluence.ecmwf.int/display/CKB/ERA5+data+documentation#ERA5datadocumentation-Temporalfrequency
             west,east,south,north: float
                 Geographic boundaries of the data request
             start: datetime.datetime
                 UTC date of the data request. 24-hours of data will be fetched.
-                
+
         return:
-            True if new data was fetched, else False
+            data: numpy array
+                Array with rows (values, lats, lons, times, source)
     """
     logger = logging.getLogger("kadlu")
 
@@ -167,15 +185,18 @@ def fetch_era5(var, *, west, east, south, north, start, **_):
     dataset = 'reanalysis-era5-single-levels'
     target = f'ERA5_reanalysis_{var}_{t.strftime("%Y-%m-%d")}.grb2'
     target = f'{storage_cfg()}{target}'
-    if not isfile(target):
-        logger.info(f'fetching {target}...')
-        client.retrieve(dataset, request, target)
-
-    # load the data from the *.grb2 file and insert it into the database
+    # blocks on the same day share the global file. the file is downloaded once, under a
+    # per-file lock, and moved into place when complete so it is never read partially written
+    with _download_lock(target):
+        if not isfile(target):
+            logger.info(f'fetching {target}...')
+            client.retrieve(dataset, request, f'{target}.part')
+            os.replace(f'{target}.part', target)
+
+    # load the data from the *.grb2 file
     assert isfile(target)
     grb = pygrib.open(target)
     data = np.array([[], [], [], [], []])
-    table = var[4:] if var[0:4] == '10m_' else var
 
     # process data 'messages' 
     for msg in grb:
@@ -227,19 +248,43 @@ def fetch_era5(var, *, west, east, south, north, start, **_):
         # aggregate data
         data = np.hstack((data, msg_data))
 
-    # perform the insertion into the database
-    initdb()
-    conn, db = database_cfg()
-    n1 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
-    db.executemany(
-        f"INSERT OR IGNORE INTO {table} "
-        f"VALUES (?,?,?,CAST(? AS INT),?)", data.T)
-    n2 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
-    db.execute("COMMIT")
-    conn.commit()
-    conn.close()
+    return data
+
+
+def fetch_era5(var, *, west, east, south, north, start, backend='sqlite', data=None, **_):
+    """ Fetch global ERA5 data for specified variable, geographic region, and time range.
+
+        Downloads 24-hours of global data on the specified day using `download_era5`.
+
+        Only data within the specified geographic boundaries (`west`, `east`, `south`, `north`) 
+        are inserted into the kadlu geospatial.db database.
+
+        args:
+            var: string
+                The variable short name of desired wave parameter according to ERA5 docs. 
+                The complete list can be found here (table 7 for wave params):
+                https://confluence.ecmwf.int/display/CKB/ERA5+data+documentation#ERA5datadocumentation-Temporalfrequency
+            west,east,south,north: float
+                Geographic boundaries of the data request
+            start: datetime.datetime
+                UTC date of the data request. 24-hours of data will be fetched.
+            backend: str
+                Storage backend. If `npz`, the data are stored as a dense array in 
+                the array store instead of the local database. If `compact`, the 
+                data are stored using the compact database schema.
+            data: numpy array
+                Data returned by `download_era5`. If None, the data are downloaded first.
+                
+        return:
+            True if new data was fetched, else False
+    """
+    if data is None:
+        data = download_era5(var, west=west, east=east, south=south, north=north, start=start)
+
+    t = datetime(start.year, start.month, start.day)
+    table = var[4:] if var[0:4] == '10m_' else var
 
-    # log message
+    # log message arguments
     kwargs = dict(
         south = south,
         west = west,
@@ -248,12 +293,61 @@ def fetch_era5(var, *, west, east, south, north, start, **_):
         start = t,
         end = t + timedelta(hours=24)     
     )
+
+    # place the data on a dense grid and store it in the array store,
+    # or using the compact database schema
+    if backend != 'sqlite':
+        val, lat, lon, epoch = data[:4].astype(float)
+        values, axes = array_store.grid_points(val, epoch=epoch, lat=lat, lon=lon)
+        if backend == 'npz':
+            n = array_store.save_tile(table, values, **axes)
+        else:
+            n = compact_store.save_tile(table, values, source='era5', **axes)
+        logmsg('era5', var, (0, n), **kwargs)
+        return True
+
+    # perform the insertion into the database
+    initdb()
+    with database_transaction() as db:
+        n1 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
+        db.executemany(
+            f"INSERT OR IGNORE INTO {table} "
+            f"VALUES (?,?,?,CAST(? AS INT),?)", data.T)
+        n2 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
+
     logmsg('era5', var, (n1, n2), **kwargs)
     
     return True
 
 
-def load_era5(var, *, west, east, south, north, start, end, fetch=True, **_):
+def load_array(table, *, west, east, south, north, start, end, **_):
+    """ Load ERA5 data from the array store, or from the compact database 
+        schema if the storage backend is `compact`
+
+        Args:
+            table: str
+                Table name, e.g. `mean_wave_direction`
+            west,east,south,north: float
+                Geographic boundaries of the data request
+            start, end: datetime.datetime
+                UTC time range of the data request
+
+        Returns:
+            values: numpy array
+                Data values with shape (time, lat, lon). Missing values are NaN.
+            axes: dict
+                The coordinate arrays epoch, lat, lon
+    """
+    return load_tiles(
+        table,
+        era5_dims,
+        lat=(south, north),
+        lon=(west, east),
+        epoch=(dt_2_epoch(start), dt_2_epoch(end)),
+    )
+
+
+def load_era5(var, *, west, east, south, north, start, end, fetch=True, gridded=False, **_):
     """ Load ERA5 data from local geospatial.db database
 
         Args:
@@ -269,6 +363,9 @@ def load_era5(var, *, west, east, south, north, start, end, fetch=True, **_):
                 If the data have not already been downloaded and inserted into 
                 Kadlu's local geospatial database, fetch data from the Copernicus 
                 Climate Data Store (CDS) automatically using the CDS API. Default is True.
+            gridded: bool
+                If True, return the data on a dense grid instead, as a dict with keys 
+                value, lat, lon, epoch, and mask. See `data_util.as_grid`. Default is False.
                 
         Returns:
             values:
@@ -280,34 +377,61 @@ def load_era5(var, *, west, east, south, north, start, end, fetch=True, **_):
             epoch:
                 timestamps in epoch hours since jan 1 2000
     """
+    backend = storage_cfg().backend()
+
+    if gridded and backend == 'sqlite':
+        rowdata = load_era5(var, west=west, east=east, south=south, north=north, start=start, end=end, fetch=fetch)
+        return as_grid(rowdata, ('lat', 'lon', 'epoch'))
+
     if fetch:
         # Check local database for data.
         # Fetch data from CDS API, if missing.
         with index(storagedir=storage_cfg(),
+                source='era5',
                 west=west,
                 east=east,
                 south=south,
                 north=north,
                 start=start,
                 end=end) as fetchmap:
-            fetchmap(callback=fetch_era5, var=var)
-
-    # connect to local database
-    conn, db = database_cfg()
+            fetchmap(callback=fetch_era5, fetch=download_era5, var=var, **backend_kwargs())
 
     # table name in local database
     table = var[4:] if var[0:4] == '10m_' else var  # table name can't start with int
 
+    if backend != 'sqlite':
+        values, axes = load_array(table, west=west, east=east, south=south, north=north, start=start, end=end)
+        if gridded:
+            return array_store.to_grid(values, axes, ('lat', 'lon', 'epoch'))
+
+        rowdata = array_store.to_columns(values, axes, ('lat', 'lon', 'epoch'))
+
+        if rowdata.shape[1] == 0:
+            logmsg_nodata(
+                'era5', var,
+                west=west, east=east, south=south, north=north,
+                start=start, end=end
+            )
+            return np.array([[], [], [], []])
+
+        return rowdata
+
+    # connect to local database
+    conn, db = database_cfg()
+
     # check if the table exists
     rows = db.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table}'").fetchall()
     table_exists = len(rows) > 0
 
     if table_exists:
-        # query local database for data
-        sql_query_list = [f"SELECT * FROM {table} WHERE lat >= ?", 'lat <= ?', 'lon >= ?', 'lon <= ?', 'time >= ?', 'time <= ?']
-        sql_query = ' AND '.join(sql_query_list) + ' ORDER BY time, lat, lon ASC'
-        sql_values = tuple(
-            map(str, [south, north, west, east, dt_2_epoch(start), dt_2_epoch(end)])
+        # create the spatial index for tables from databases created before it was introduced
+        initdb()
+
+        # query local database for data, using the spatial index
+        sql_query, sql_values = range_query(
+            table,
+            bounds=dict(lat=(south, north), lon=(west, east), time=(dt_2_epoch(start), dt_2_epoch(end))),
+            order_by='time, lat, lon',
         )
         db.execute(sql_query, sql_values)
         rowdata = np.array(db.fetchall(), dtype=object).T
@@ -372,31 +496,55 @@ class Era5():
     def load_wind_v(self, **kwargs):
         return load_era5('10m_v_component_of_wind', **kwargs)
     
-    def load_insolation(self, **kwargs):
-        data = load_era5('surface_solar_radiation_downwards', **kwargs)
+    def load_insolation(self, gridded=False, **kwargs):
+        data = load_era5('surface_solar_radiation_downwards', gridded=gridded, **kwargs)
         # for accumulated quantities, we subtract 1/2 hour to get the time at the center of the forecast bin
-        data[3] -= 0.5
+        if gridded:
+            data['epoch'] = data['epoch'] - 0.5
+        else:
+            data[3] -= 0.5
         return data
 
-    def load_irradiance(self, **kwargs):
-        data = self.load_insolation(**kwargs)
-        data[0] /= 3600
+    def load_irradiance(self, gridded=False, **kwargs):
+        data = self.load_insolation(gridded=gridded, **kwargs)
+        if gridded:
+            data['value'] = data['value'] / 3600
+        else:
+            data[0] /= 3600
         return data
 
-    def load_wind_uv(self, fetch=True, **kwargs):
+    def load_wind_uv(self, fetch=True, gridded=False, **kwargs):
         """ Loads wind speed computed as sqrt(wind_u^2 + wind_v^2)"""
         # Check local database for data.
         # Fetch data from CDS API, if missing.
+        backend = storage_cfg().backend()
+
+        if gridded and backend == 'sqlite':
+            return as_grid(self.load_wind_uv(fetch=fetch, **kwargs), ('lat', 'lon', 'epoch'))
+
         if fetch:
+            passkwargs = backend_kwargs()
             with index(storagedir=storage_cfg(),
+                    source='era5',
                     west=kwargs['west'],
                     east=kwargs['east'],
                     south=kwargs['south'],
                     north=kwargs['north'],
                     start=kwargs['start'],
                     end=kwargs['end']) as fetchmap:
-                fetchmap(callback=fetch_era5, var='10m_u_component_of_wind')
-                fetchmap(callback=fetch_era5, var='10m_v_component_of_wind')
+                fetchmap(callback=fetch_era5, fetch=download_era5, var='10m_u_component_of_wind', **passkwargs)
+                fetchmap(callback=fetch_era5, fetch=download_era5, var='10m_v_component_of_wind', **passkwargs)
+
+        if backend != 'sqlite':
+            wind_u, axes = load_array('u_component_of_wind', **kwargs)
+            wind_v, _ = load_array('v_component_of_wind', **kwargs)
+            assert wind_u.shape == wind_v.shape, 'wind_u and wind_v grids do not match'
+
+            val = np.sqrt(np.square(wind_u) + np.square(wind_v))
+            if gridded:
+                return array_store.to_grid(val, axes, ('lat', 'lon', 'epoch'))
+
+            return array_store.to_columns(val, axes, ('lat', 'lon', 'epoch'))
 
         # establish connection to the geospatial.db database
         conn, db = database_cfg()
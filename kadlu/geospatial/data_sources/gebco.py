@@ -9,26 +9,35 @@ from tqdm import tqdm
 
 import kadlu
 from kadlu import index
+from kadlu.geospatial.data_sources import array_store, compact_store
 from kadlu.geospatial.data_sources.data_util import (
+    backend_kwargs,
     database_cfg,
+    database_transaction,
+    load_tiles,
     logmsg,
     logmsg_nodata,
+    range_query,
+    rtree_index,
     storage_cfg,
 )
 
 fname = 'GEBCO_2021.nc'
 url = 'https://www.bodc.ac.uk/data/open_download/gebco/gebco_2021/zip/'
 
+# dimensions of the arrays in the array store
+gebco_dims = ('lat', 'lon')
+
 
 def initdb():
-    conn, db = database_cfg()
-    db.execute('CREATE TABLE IF NOT EXISTS gebco'
-               '(   val     REAL    NOT NULL,  '
-               '    lat     REAL    NOT NULL,  '
-               '    lon     REAL    NOT NULL  )')
-    db.execute(
-        'CREATE UNIQUE INDEX IF NOT EXISTS idx_gebco on gebco(val, lat, lon)')
-    conn.close()
+    with database_transaction() as db:
+        db.execute('CREATE TABLE IF NOT EXISTS gebco'
+                   '(   val     REAL    NOT NULL,  '
+                   '    lat     REAL    NOT NULL,  '
+                   '    lon     REAL    NOT NULL  )')
+        db.execute(
+            'CREATE UNIQUE INDEX IF NOT EXISTS idx_gebco on gebco(val, lat, lon)')
+        rtree_index(db, 'gebco', dims=('lat', 'lon'))
 
 
 class Gebco():
@@ -70,8 +79,12 @@ class Gebco():
                        top=None,
                        bottom=None,
                        start=None,
-                       end=None):
-        """ build data grid indexes from .nc file and insert into database """
+                       end=None,
+                       backend='sqlite'):
+        """ build data grid indexes from .nc file and insert into database,
+            or into the array store if backend is npz. if backend is compact,
+            the elevations are stored as integers using the compact schema
+        """
 
         if not os.path.isfile(os.path.join(storage_cfg(), fname)):
             self.fetch_bathymetry_grid()
@@ -80,15 +93,31 @@ class Gebco():
                                south=south,
                                north=north,
                                west=west,
-                               east=east).T
+                               east=east)
+
+        if backend != 'sqlite':
+            values, axes = array_store.grid_points(rows[0], lat=rows[1], lon=rows[2])
+            if backend == 'npz':
+                n = array_store.save_tile('gebco', values, **axes)
+            else:
+                n = compact_store.save_tile('gebco', values, source='gebco', scale=1, **axes)
+            logmsg('gebco',
+                   'bathymetry', (0, n),
+                   south=south,
+                   west=west,
+                   north=north,
+                   east=east)
+            return
+
+        rows = rows.T
 
         initdb()
-        conn, db = database_cfg()
-        n1 = db.execute("SELECT COUNT(*) FROM gebco ").fetchall()[0][0]
-        db.executemany(
-            "INSERT OR IGNORE INTO gebco (val, lat, lon)  VALUES (?,?,?)",
-            rows)
-        n2 = db.execute("SELECT COUNT(*) FROM gebco ").fetchall()[0][0]
+        with database_transaction() as db:
+            n1 = db.execute("SELECT COUNT(*) FROM gebco ").fetchall()[0][0]
+            db.executemany(
+                "INSERT OR IGNORE INTO gebco (val, lat, lon)  VALUES (?,?,?)",
+                rows)
+            n2 = db.execute("SELECT COUNT(*) FROM gebco ").fetchall()[0][0]
 
         logmsg('gebco',
                'bathymetry', (n1, n2),
@@ -96,8 +125,6 @@ class Gebco():
                west=west,
                north=north,
                east=east)
-        conn.commit()
-        conn.close()
         return
 
     def load_bathymetry(self, south, north, west, east, **_):
@@ -117,15 +144,33 @@ class Gebco():
                    bottom=99999,
                    start=datetime(2000, 1, 1),
                    end=datetime(2000, 1, 2)) as fetchmap:
-            _ = fetchmap(callback=self.fetch_callback)
+            _ = fetchmap(callback=self.fetch_callback, **backend_kwargs())
+
+        if storage_cfg().backend() != 'sqlite':
+            values, axes = load_tiles('gebco',
+                                      gebco_dims,
+                                      lat=(south, north),
+                                      lon=(west, east))
+            res = array_store.to_columns(values, axes, ('lat', 'lon'))
+            if res.shape[1] == 0:
+                logmsg_nodata('gebco',
+                              'bathymetry',
+                              south=south,
+                              north=north,
+                              west=west,
+                              east=east)
+                return np.array([[], [], []])
+            val, lat, lon = res
+            return val, lat, lon
 
+        initdb()
         conn, db = kadlu.database_cfg()
-        qry = ' AND '.join([
-            'SELECT val, lat, lon FROM gebco WHERE lat >= ?', 'lat <= ?',
-            'lon >= ?', 'lon <= ?'
-        ])
+        qry, values = range_query('gebco',
+                                  bounds=dict(lat=(south, north),
+                                              lon=(west, east)),
+                                  columns='val, lat, lon')
         logging.debug(f'query: {qry}')
-        db.execute(qry, (south, north, west, east))
+        db.execute(qry, values)
         res = np.array(db.fetchall()).T
         conn.close()
         if len(res) == 0:
@@ -18,9 +18,12 @@ import numpy.ma as ma
 from kadlu import index
 from kadlu.geospatial.data_sources.data_util import (
     database_cfg,
+    database_transaction,
     dt_2_epoch,
     logmsg,
     logmsg_nodata,
+    range_query,
+    rtree_index,
     storage_cfg,
     str_def,
 )
@@ -39,21 +42,21 @@ gfs_tables = {  #kadlu name: GFS name
 
 def initdb():
     """ Create tables in kadlu's geospatial.db database for storing CMEMS data"""
-    conn, db = database_cfg()
-    for var in gfs_tables.keys():
-        db.execute(f'CREATE TABLE IF NOT EXISTS {var}'
-                   '( val     REAL    NOT NULL, '
-                   '  lat     REAL    NOT NULL, '
-                   '  lon     REAL    NOT NULL, '
-                   '  time    INT     NOT NULL, '
-                   '  source  TEXT    NOT NULL) ')
-        db.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS '
-                   f'idx_{var} on {var}(time, lon, lat, val, source)')
-    conn.close()
-
-
-def fetch_gfs(var, *, west, east, south, north, start, **_):
-    """ Fetch GFS data for specified variable, geographic region, and time range.
+    with database_transaction() as db:
+        for var in gfs_tables.keys():
+            db.execute(f'CREATE TABLE IF NOT EXISTS {var}'
+                       '( val     REAL    NOT NULL, '
+                       '  lat     REAL    NOT NULL, '
+                       '  lon     REAL    NOT NULL, '
+                       '  time    INT     NOT NULL, '
+                       '  source  TEXT    NOT NULL) ')
+            db.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS '
+                       f'idx_{var} on {var}(time, lon, lat, val, source)')
+            rtree_index(db, var)
+
+
+def download_gfs(var, *, west, east, south, north, start, **_):
+    """ Download GFS data for specified variable, geographic region, and day.
 
         Fetches data on a regular grid with 0.25 degree spatial resolution and 1-hour temporal resolution.
 
@@ -66,7 +69,8 @@ def fetch_gfs(var, *, west, east, south, north, start, **_):
                 UTC date of the data request. 24-hours of data will be fetched.
                 
         return:
-            True if new data was fetched, else False
+            data: numpy array
+                Array with rows (values, lats, lons, times, source)
     """
     logger = logging.getLogger("kadlu")
 
@@ -133,20 +137,45 @@ def fetch_gfs(var, *, west, east, south, north, start, **_):
         ['gfs' for _ in vals],
     ])
 
+    return data
+
+
+def fetch_gfs(var, *, west, east, south, north, start, data=None, **_):
+    """ Fetch GFS data for specified variable, geographic region, and time range.
+
+        Downloads the data using `download_gfs` and inserts it into the local database.
+
+        args:
+            var: string
+                The variable short name of desired wave parameter according to CMEMS docs. 
+            west,east,south,north: float
+                Geographic boundaries of the data request
+            start: datetime.datetime
+                UTC date of the data request. 24-hours of data will be fetched.
+            data: numpy array
+                Data returned by `download_gfs`. If None, the data are downloaded first.
+                
+        return:
+            True if new data was fetched, else False
+    """
+    if data is None:
+        data = download_gfs(var, west=west, east=east, south=south, north=north, start=start)
+
+    # time window
+    start = datetime(start.year, start.month, start.day)
+    end = start + timedelta(days=1)
+
     # SQL table name
     table = var
 
     # perform the insertion into the database
     initdb()
-    conn, db = database_cfg()
-    n1 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
-    db.executemany(
-        f"INSERT OR IGNORE INTO {table} "
-        f"VALUES (?,?,?,CAST(? AS INT),?)", data.T)
-    n2 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
-    db.execute("COMMIT")
-    conn.commit()
-    conn.close()
+    with database_transaction() as db:
+        n1 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
+        db.executemany(
+            f"INSERT OR IGNORE INTO {table} "
+            f"VALUES (?,?,?,CAST(? AS INT),?)", data.T)
+        n2 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
 
     # log message
     kwargs = dict(
@@ -193,13 +222,14 @@ def load_gfs(var, *, west, east, south, north, start, end, fetch=True, **_):
         # Check local database for data.
         # Fetch data from Copernicus API, if missing.
         with index(storagedir=storage_cfg(),
+                source='gfs',
                 west=west,
                 east=east,
                 south=south,
                 north=north,
                 start=start,
                 end=end) as fetchmap:
-            fetchmap(callback=fetch_gfs, var=var)
+            fetchmap(callback=fetch_gfs, fetch=download_gfs, var=var)
 
     # connect to local database
     conn, db = database_cfg()
@@ -212,11 +242,14 @@ def load_gfs(var, *, west, east, south, north, start, end, fetch=True, **_):
     table_exists = len(rows) > 0
 
     if table_exists:
-        # query local database for data
-        sql_query_list = [f"SELECT * FROM {table} WHERE lat >= ?", 'lat <= ?', 'lon >= ?', 'lon <= ?', 'time >= ?', 'time <= ?']
-        sql_query = ' AND '.join(sql_query_list) + ' ORDER BY time, lat, lon ASC'
-        sql_values = tuple(
-            map(str, [south, north, west, east, dt_2_epoch(start), dt_2_epoch(end)])
+        # create the spatial index for tables from databases created before it was introduced
+        initdb()
+
+        # query local database for data, using the spatial index
+        sql_query, sql_values = range_query(
+            table,
+            bounds=dict(lat=(south, north), lon=(west, east), time=(dt_2_epoch(start), dt_2_epoch(end))),
+            order_by='time, lat, lon',
         )
         db.execute(sql_query, sql_values)
         rowdata = np.array(db.fetchall(), dtype=object).T
@@ -17,22 +17,31 @@
 
 """
 
+import re
 import logging
 import requests
 from functools import reduce
+from itertools import repeat
 from datetime import datetime, timedelta
 
 import numpy as np
 
 from kadlu import index
+from kadlu.geospatial.data_sources import array_store, compact_store
 from kadlu.geospatial.data_sources.data_util import (
+    as_grid,
+    backend_kwargs,
     database_cfg,
+    database_transaction,
     dt_2_epoch,
     fmt_coords,
     fmt_time,
     index_arr,
+    load_tiles,
     logmsg,
     logmsg_nodata,
+    range_query,
+    rtree_index,
     storage_cfg,
     str_def,
 )
@@ -50,23 +59,206 @@ slices_str = lambda var, slices, steps=(
     1, 1, 1, 1
 ): f"{var}{''.join(map(lambda tup, step : f'[{tup[0]}:{step}:{tup[1]}]', slices, steps))}"
 
+# separator between the metadata header and the data in OPeNDAP ASCII responses
+ascii_separator = "---------------------------------------------\n"
+
+# index prefix at the start of each row of an OPeNDAP ASCII array, e.g. '[0][12][3], '
+ascii_row_prefix = re.compile(r"^(?:\[\d+\])+, ", flags=re.MULTILINE)
+
+# separator between the dataset descriptor and the XDR data in OPeNDAP binary responses
+dods_separator = b"\nData:\n"
+
+# array declaration in the dataset descriptor, e.g. 'Int16 salinity[time = 1][depth = 40]...;'
+dods_array_decl = re.compile(r"(Int16|UInt16|Int32|UInt32|Float32|Float64)\s+(\w+)((?:\[[^\]]*\])+);")
+
+# XDR encoding of DAP2 types; 16-bit integers are padded to 32 bits
+dods_dtypes = {
+    'Int16': '>i4',
+    'UInt16': '>u4',
+    'Int32': '>i4',
+    'UInt32': '>u4',
+    'Float32': '>f4',
+    'Float64': '>f8',
+}
+
+# raw value used by HYCOM for grid points on land or below the seafloor
+fill_value = -30000
+
+# dimensions of the HYCOM arrays, in the order used by the HYCOM server
+hycom_dims = ('epoch', 'depth', 'lat', 'lon')
+
+# response encodings that can be requested from the HYCOM server
+transports = ('ascii', 'dods')
+
+
+def parse_ascii(text):
+    """ Parse the OPeNDAP ASCII response for a single HYCOM variable.
+
+        The rows of the response are written in C order, so once the
+        `[a][b][c], ` row prefixes are stripped the entire payload can be
+        read with a single call to `np.fromstring`.
+
+        Args:
+            text: str
+                Body of the `.ascii` response
+
+        Returns:
+            cube: numpy array
+                Raw (scaled) int16 values with shape (time, depth, lat, lon)
+    """
+    meta, data = text.split(ascii_separator)
+    shape_str, payload = data.split("\n\n", 1)[0].split("\n", 1)
+    shape = tuple(
+        [int(x) for x in shape_str.split("[", 1)[1][:-1].split("][")])
+
+    values = ascii_row_prefix.sub("", payload).replace("\n", ", ")
+    cube = np.fromstring(values, dtype=np.int16, sep=",")
+
+    assert cube.size == np.prod(shape), \
+        f"expected {np.prod(shape)} values in HYCOM response but found {cube.size}"
+
+    return cube.reshape(shape)
+
+
+def parse_dods(content):
+    """ Parse the OPeNDAP binary (DAP2 `.dods`) response for a single HYCOM variable.
+
+        The response consists of a textual dataset descriptor (DDS) followed by
+        the XDR-encoded data. Only the first array, i.e. the data values of the 
+        requested grid, is decoded; the coordinate maps that follow it are ignored.
+
+        Note that DAP2 transmits 16-bit integers as 32-bit big-endian integers.
+
+        Args:
+            content: bytes
+                Body of the `.dods` response
+
+        Returns:
+            cube: numpy array
+                Raw (scaled) int16 values with shape (time, depth, lat, lon)
+    """
+    dds, data = content.split(dods_separator, 1)
+
+    match = dods_array_decl.search(dds.decode('ascii'))
+    assert match is not None, "could not find array declaration in DODS response"
+
+    dtype = dods_dtypes[match.group(1)]
+    shape = tuple(int(n) for n in re.findall(r"=\s*(\d+)\]", match.group(3)))
+
+    # array length is written twice as XDR unsigned ints, followed by the values
+    n, n2 = np.frombuffer(data, dtype='>u4', count=2)
+    assert n == n2 == np.prod(shape), \
+        f"expected {np.prod(shape)} values in HYCOM response but found {n}"
+
+    cube = np.frombuffer(data, dtype=dtype, count=n, offset=8)
+
+    return cube.astype(np.int16).reshape(shape)
+
+
+def scaling(var):
+    """ Scale factor and offset of the raw HYCOM values of a variable.
+
+        Args:
+            var: str
+                Variable name
+
+        Returns:
+            scale, offset: float
+                Physical values are obtained as raw * scale + offset
+    """
+    return 0.001, 20 if 'salinity' in var or 'water_temp' in var else 0
+
+
+def scale_cube(cube, var):
+    """ Rescale a raw HYCOM data cube to physical units.
+
+        Null values (land or below the seafloor) are replaced by NaN.
+
+        Args:
+            cube: numpy array
+                Raw int16 values
+            var: str
+                Variable name
+
+        Returns:
+            values: numpy array
+                Rescaled values, with the same shape as the cube
+    """
+    scale, offset = scaling(var)
+
+    values = cube * scale + offset
+    values[cube == fill_value] = np.nan
+
+    return values
+
+
+def grid_columns(cube, epoch, depth, lat, lon, var):
+    """ Convert a raw HYCOM data cube to flattened (val, lat, lon, epoch, depth) columns.
+
+        Values are rescaled to physical units and null values (land or below the
+        seafloor) are removed.
+
+        Args:
+            cube: numpy array
+                Raw int16 values with shape (time, depth, lat, lon)
+            epoch, depth, lat, lon: numpy array
+                Coordinate axes of the cube
+            var: str
+                Variable name
+
+        Returns:
+            val, lat, lon, epoch, depth: numpy array
+                Flattened columns, ordered by time, depth, lat, lon
+    """
+    t, d, y, x = np.meshgrid(epoch, depth, lat, lon, indexing='ij')
+    val = scale_cube(cube, var).ravel()
+    keep = ~np.isnan(val)
+
+    return val[keep], y.ravel()[keep], x.ravel()[keep], t.ravel()[keep], d.ravel()[keep]
+
+
+def load_array(table, kwargs):
+    """ Load HYCOM data from the array store, or from the compact database 
+        schema if the storage backend is `compact`.
+
+        Args:
+            table: str
+                Table name, e.g. `hycom_salinity`
+            kwargs: dict
+                Boundaries as keyword arguments. Longitudes must be in the range [0;360].
+
+        Returns:
+            values: numpy array
+                Data values with shape (time, depth, lat, lon). Missing values are NaN.
+            axes: dict
+                The coordinate arrays epoch, depth, lat, lon
+    """
+    return load_tiles(
+        table,
+        hycom_dims,
+        lat=(kwargs['south'], kwargs['north']),
+        lon=(kwargs['west'], kwargs['east']),
+        epoch=(dt_2_epoch(kwargs['start']), dt_2_epoch(kwargs['end'])),
+        depth=(kwargs['top'], kwargs['bottom']),
+    )
+
 
 def initdb():
     """ Create tables in kadlu's geospatial.db database for storing HYCOM data"""
-    conn, db = database_cfg()
+    with database_transaction() as db:
+        for var in hycom_tables:
+            db.execute(f'CREATE TABLE IF NOT EXISTS {var}'
+                       '( val     REAL NOT NULL,'
+                       '  lat     REAL NOT NULL,'
+                       '  lon     REAL NOT NULL,'
+                       '  time    INT  NOT NULL,'
+                       '  depth   INT  NOT NULL,'
+                       '  source  TEXT NOT NULL )')
 
-    for var in hycom_tables:
-        db.execute(f'CREATE TABLE IF NOT EXISTS {var}'
-                   '( val     REAL NOT NULL,'
-                   '  lat     REAL NOT NULL,'
-                   '  lon     REAL NOT NULL,'
-                   '  time    INT  NOT NULL,'
-                   '  depth   INT  NOT NULL,'
-                   '  source  TEXT NOT NULL )')
+            db.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS '
+                       f'idx_{var} on {var}(time, lon, lat, depth, val, source)')
 
-        db.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS '
-                   f'idx_{var} on {var}(time, lon, lat, depth, val, source)')
-    conn.close()
+            rtree_index(db, var, dims=('lat', 'lon', 'time', 'depth'))
 
 
 def fetch_grid(**_):
@@ -134,6 +326,14 @@ def load_grid():
 class Hycom():
     """ Collection of module functions for fetching and loading HYCOM data.
 
+        Args:
+            transport: str
+                Encoding used for data requests to the HYCOM server. Options are 
+                `ascii` (default) and `dods`. The binary `dods` (DAP2) encoding is 
+                several times smaller than the ASCII encoding and does not require 
+                text parsing. If a binary response cannot be decoded, the request 
+                is repeated using the ASCII encoding.
+
         Attributes:
             lat, lon: arrays
                 Lat/lon coordinates.
@@ -143,10 +343,12 @@ class Hycom():
                 Depth coordinates.
     """
 
-    def __init__(self):
+    def __init__(self, transport='ascii'):
+        assert transport in transports, f"invalid transport `{transport}`. Valid options are: {transports}"
         self.ygrid, self.xgrid, self.epoch, self.depth = None, None, None, None
         self.logger = logging.getLogger("kadlu")
         self.name = "HYCOM"
+        self.transport = transport
 
     def load_salinity(self, **kwargs):
         return self.load_hycom('salinity', kwargs)
@@ -160,14 +362,8 @@ class Hycom():
     def load_water_v(self, **kwargs):
         return self.load_hycom('water_v', kwargs)
 
-    def callback(self, var, max_attempts=3, **kwargs):
-        """ Builds indices for query, fetches data from HYCOM, and inserts into local database.
-
-            Note: Null/NaN values are removed before the data is inserted into the local database.
-            Null/NaN values occur when the grid overlaps with land or extends below the seafloor. 
-
-            TODO: Add download progress bar, e.g., using the approach described here:
-                https://stackoverflow.com/questions/37573483/progress-bar-while-download-file-over-http-with-requests
+    def fetch_bin(self, var, max_attempts=3, **kwargs):
+        """ Builds indices for query and fetches data from HYCOM.
 
             Args:
                 var: string
@@ -177,6 +373,12 @@ class Hycom():
                     Maximum number of request attempts. Default is 3. Each request has a timeout of 120 s.
                 kwargs: dict
                     boundaries as keyword arguments
+
+            Returns:
+                cube: numpy array
+                    Raw (scaled) int16 values with shape (time, depth, lat, lon)
+                axes: dict
+                    The coordinate arrays epoch, depth, lat, lon
         """
         # build request indexes
         south = kwargs["south"]
@@ -201,21 +403,133 @@ class Hycom():
             np.multiply, map(lambda s: s[1] - s[0] + 1, slices)
         ) > 0, f"0 records available within query boundaries: {kwargs}"
 
-        # generate data download request for HYCOM server
-        url = f"{hycom_src}.ascii?{slices_str(var, slices)}"
+        # download and decode the data
+        cube = self.fetch_cube(var, slices, max_attempts=max_attempts)
 
+        axes = dict(
+            epoch=self.epoch[slices[0][0]:slices[0][1] + 1],
+            depth=self.depth[slices[1][0]:slices[1][1] + 1],
+            lat=self.ygrid[slices[2][0]:slices[2][1] + 1],
+            lon=self.xgrid[slices[3][0]:slices[3][1] + 1],
+        )
+
+        return cube, axes
+
+    def callback(self, var, max_attempts=3, backend='sqlite', data=None, **kwargs):
+        """ Fetches data from HYCOM, and inserts into local database.
+
+            Note: Null/NaN values are removed before the data is inserted into the local database.
+            Null/NaN values occur when the grid overlaps with land or extends below the seafloor. 
+
+            TODO: Add download progress bar, e.g., using the approach described here:
+                https://stackoverflow.com/questions/37573483/progress-bar-while-download-file-over-http-with-requests
+
+            Args:
+                var: string
+                    Variable to be fetched. complete list of variables here
+                    https://tds.hycom.org/thredds/dodsC/GLBv0.08/expt_53.X/data/2015.html
+                max_attempts: int
+                    Maximum number of request attempts. Default is 3. Each request has a timeout of 120 s.
+                backend: str
+                    Storage backend. If `npz`, the data are stored as a dense array in 
+                    the array store instead of the local database. If `compact`, the 
+                    raw integer values are stored using the compact database schema.
+                data: tuple
+                    Data returned by `fetch_bin`. If None, the data are fetched first.
+                kwargs: dict
+                    boundaries as keyword arguments
+        """
+        if data is None:
+            data = self.fetch_bin(var, max_attempts=max_attempts, **kwargs)
+
+        cube, axes = data
+
+        # store the rescaled cube in the array store
+        if backend == 'npz':
+            n = array_store.save_tile(f'hycom_{var}', scale_cube(cube, var), **axes)
+            logmsg('hycom', var, (0, n), **kwargs)
+            return
+
+        # store the raw cube values using the compact schema
+        if backend == 'compact':
+            scale, offset = scaling(var)
+            n = compact_store.save_tile(f'hycom_{var}', scale_cube(cube, var), source='hycom',
+                                        scale=scale, offset=offset, **axes)
+            logmsg('hycom', var, (0, n), **kwargs)
+            return
+
+        # build coordinate columns, adjust scaling, remove nulls
+        cols = grid_columns(cube, var=var, **axes)
+        grid = zip(*(col.tolist() for col in cols), repeat('hycom'))
+
+        # insert into db
+        initdb()
+        with database_transaction() as db:
+            n1 = db.execute(f"SELECT COUNT(*) FROM hycom_{var}").fetchall()[0][0]
+            db.executemany(
+                f"INSERT OR IGNORE INTO hycom_{var} VALUES "
+                "(?, ?, ?, CAST(? AS INT), CAST(? AS INT), ?)", grid)
+            n2 = db.execute(f"SELECT COUNT(*) FROM hycom_{var}").fetchall()[0][0]
+
+        logmsg('hycom', var, (n1, n2), **kwargs)
+        return
+
+    def fetch_cube(self, var, slices, max_attempts=3):
+        """ Request a subset of a HYCOM variable and decode it into a numpy array.
+
+            The response encoding is determined by the `transport` attribute.
+            If a binary (`dods`) response cannot be decoded, the request falls
+            back to the ASCII encoding.
+
+            Args:
+                var: string
+                    Variable to be fetched
+                slices: list(tuple)
+                    Index ranges (first, last) along the time, depth, lat and lon axes
+                max_attempts: int
+                    Maximum number of request attempts. Default is 3.
+
+            Returns:
+                cube: numpy array
+                    Raw (scaled) int16 values with shape (time, depth, lat, lon)
+        """
+        if self.transport == 'dods':
+            payload = self._request(f"{hycom_src}.dods?{slices_str(var, slices)}", max_attempts)
+            try:
+                return parse_dods(payload.content)
+
+            except (AssertionError, ValueError):
+                warn_msg = f"[{self.name}] Failed to decode binary response. Repeating request with ASCII encoding."
+                self.logger.warning(warn_msg)
+
+        payload = self._request(f"{hycom_src}.ascii?{slices_str(var, slices)}", max_attempts)
+        return parse_ascii(payload.text)
+
+    def _request(self, url, max_attempts=3, timeout=120):
+        """ Make several download attempts until successful 
+
+            Args:
+                url: str
+                    Data request URL
+                max_attempts: int
+                    Maximum number of request attempts. Default is 3.
+                timeout: float
+                    Timeout of each request in seconds. Default is 120.
+
+            Returns:
+                payload: requests.Response
+                    The server response
+        """
         self.logger.debug(f"[{self.name}] data request URL: {url}")
 
-        # make several download attempts until successful
         counter = 0
-        timeout = 120
         code = None
         while counter < max_attempts:
             counter += 1
             self.logger.debug(f"[{self.name}] Requesting data from Hycom server ... (attempt no. {counter}/{max_attempts})")
             try:
-                payload_netcdf = requests.get(url, stream=True, timeout=timeout, verify=True)
-                code = payload_netcdf.status_code
+                payload = requests.get(url, stream=True, timeout=timeout, verify=True)
+                code = payload.status_code
                 if code == 200:
                     debug_msg = f"[{self.name}] Data request was successful"
                     self.logger.debug(debug_msg)
@@ -231,49 +545,7 @@ class Hycom():
  
         assert code == 200, f"[{self.name}] Data request unsuccesful. Could not access Hycom server."
 
-        meta, data = payload_netcdf.text.split("---------------------------------------------\n")
-
-        # parse response into numpy array
-        arrs = data.split("\n\n")[:-1]
-        shape_str, payload = arrs[0].split("\n", 1)
-        shape = tuple(
-            [int(x) for x in shape_str.split("[", 1)[1][:-1].split("][")])
-        cube = np.ndarray(shape, dtype=float)
-
-        for arr in payload.split("\n"):
-            ix_str, row_csv = arr.split(", ", 1)
-            a, b, c = [int(x) for x in ix_str[1:-1].split("][")]
-            cube[a][b][c] = np.array(row_csv.split(", "), dtype=int)
-
-        # build coordinate grid, populate values, adjust scaling, remove nulls
-        flatten = reduce(np.multiply, map(lambda s: s[1] - s[0] + 1, slices))
-        add_offset = 20 if 'salinity' in var or 'water_temp' in var else 0
-        null_value = -10 if 'salinity' in var or 'water_temp' in var else -30
-
-        grid = np.array([
-            (None, y, x, t, d, 'hycom')
-            for t in self.epoch[slices[0][0]:slices[0][1] + 1]
-            for d in self.depth[slices[1][0]:slices[1][1] + 1]
-            for y in self.ygrid[slices[2][0]:slices[2][1] + 1]
-            for x in self.xgrid[slices[3][0]:slices[3][1] + 1]
-        ])
-        grid[:, 0] = np.reshape(cube, flatten) * 0.001 + add_offset
-        grid = grid[grid[:, 0] != null_value]
-
-        # insert into db
-        initdb()
-        conn, db = database_cfg()
-        n1 = db.execute(f"SELECT COUNT(*) FROM hycom_{var}").fetchall()[0][0]
-        db.executemany(
-            f"INSERT OR IGNORE INTO hycom_{var} VALUES "
-            "(?, ?, ?, CAST(? AS INT), CAST(? AS INT), ?)", grid)
-        n2 = db.execute(f"SELECT COUNT(*) FROM hycom_{var}").fetchall()[0][0]
-        db.execute("COMMIT")
-        conn.commit()
-        conn.close()
-
-        logmsg('hycom', var, (n1, n2), **kwargs)
-        return
+        return payload
 
     def fetch_hycom(self, var, kwargs, max_attempts=3):
         """ Fetch data from the HYCOM server.
@@ -332,14 +604,20 @@ class Hycom():
 
             self.logger.info(f'[{self.name}] Fetching {var} in region {fmt_coords(args)} for time period {fmt_time(args)}')
 
+            # bins are downloaded concurrently, and inserted by this thread
             with index(storagedir=storage_cfg(),
                        bins=True,
                        dx=1,
                        dy=1,
                        dz=5000,
                        dt=timedelta(hours=24),
+                       source='hycom',
                        **args) as fetchmap:
-                fetchmap(callback=self.callback, var=var, max_attempts=max_attempts)
+                fetchmap(callback=self.callback,
+                         fetch=self.fetch_bin,
+                         var=var,
+                         max_attempts=max_attempts,
+                         **backend_kwargs())
 
         return True
 
@@ -363,6 +641,10 @@ class Hycom():
                         xmin, xmax coordinate values. range: -180, 180
                     start, end: datetime
                         temporal boundaries in datetime format
+                    gridded: bool
+                        If True, return the data on a dense grid instead, as a dict 
+                        with keys value, lat, lon, epoch, depth, and mask. See 
+                        `data_util.as_grid`. Default is False.
 
             Returns:
                 values: array
@@ -377,6 +659,10 @@ class Hycom():
                     measured in meters
         """
         kwargs = kwargs.copy()
+        gridded = kwargs.pop('gridded', False)
+
+        if gridded and storage_cfg().backend() == 'sqlite':
+            return as_grid(self.load_hycom(var, kwargs))
 
         # check if grids are initialized
         if self.ygrid is None:
@@ -395,6 +681,8 @@ class Hycom():
             kwargs2 = kwargs.copy()
             kwargs1['west'] = self.xgrid[0]
             kwargs2['east'] = self.xgrid[-1]
+            if gridded:
+                return as_grid(np.hstack((self.load_hycom(var, kwargs1), self.load_hycom(var, kwargs2))))
             return np.hstack(
                 (self.load_hycom(var, kwargs1), self.load_hycom(var, kwargs2)))
 
@@ -410,22 +698,41 @@ class Hycom():
 
         assert kwargs['start'] <= kwargs['end']
 
-        # prepare SQL query
-        sql_query = ' AND '.join([
-            f"SELECT * FROM hycom_{var} WHERE lat >= ?", 'lat <= ?',
-            'lon >= ?', 'lon <= ?', 'time >= ?', 'time <= ?', 'depth >= ?',
-            'depth <= ?', "source == 'hycom' "
-        ]) + 'ORDER BY time, depth, lat, lon ASC'
+        if storage_cfg().backend() != 'sqlite':
+            values, axes = load_array(f'hycom_{var}', kwargs)
 
-        sql_values = [
-                kwargs['south'], kwargs['north'], kwargs['west'], kwargs['east'],
-                dt_2_epoch(kwargs['start']), dt_2_epoch(kwargs['end']), 
-                kwargs['top'], kwargs['bottom']
-        ]
-        sql_values = tuple(map(str, sql_values))
+            # the arrays are returned as they are stored, unless the 
+            # longitude axis crosses the antimeridian
+            if gridded:
+                axes['lon'] = np.where(axes['lon'] > 180, axes['lon'] - 360, axes['lon'])
+                if np.all(np.diff(axes['lon']) > 0):
+                    return array_store.to_grid(values, axes, ('lat', 'lon', 'epoch', 'depth'))
+                return as_grid(array_store.to_columns(values, axes, ('lat', 'lon', 'epoch', 'depth')))
 
-        # query the local database
+            rowdata = array_store.to_columns(values, axes, ('lat', 'lon', 'epoch', 'depth'))
+
+            if rowdata.shape[1] == 0:
+                logmsg_nodata('hycom', var, **kwargs)
+                return np.array([[], [], [], [], []])
+
+            # convert longitude from [0;360] to [-180;180]
+            rowdata[2, rowdata[2] > 180] -= 360
+            return rowdata
+
+        # query the local database, using the spatial index
+        initdb()
         conn, db = database_cfg()
+        sql_query, sql_values = range_query(
+            f'hycom_{var}',
+            bounds=dict(
+                lat=(kwargs['south'], kwargs['north']),
+                lon=(kwargs['west'], kwargs['east']),
+                time=(dt_2_epoch(kwargs['start']), dt_2_epoch(kwargs['end'])),
+                depth=(kwargs['top'], kwargs['bottom']),
+            ),
+            where="source == 'hycom'",
+            order_by='time, depth, lat, lon',
+        )
         db.execute(sql_query, sql_values)
         rowdata = np.array(db.fetchall(), dtype=object).T
 
@@ -458,6 +765,8 @@ class Hycom():
                         xmin, xmax coordinate values. range: -180, 180
                     start, end: datetime
                         temporal boundaries in datetime format
+                    gridded: bool
+                        If True, return the data on a dense grid instead. Default is False.
 
             Returns:
                 values: array
@@ -471,6 +780,11 @@ class Hycom():
                 depth: array
                     measured in meters
         """
+        gridded = kwargs.pop('gridded', False)
+
+        if gridded and storage_cfg().backend() == 'sqlite':
+            return as_grid(self.load_water_uv(**kwargs))
+
         kwargs = kwargs.copy()
 
         # convert from [-180;180] to [0;360]
@@ -483,6 +797,30 @@ class Hycom():
         self.fetch_hycom('water_u', kwargs, max_attempts=3)
         self.fetch_hycom('water_v', kwargs, max_attempts=3)
 
+        if storage_cfg().backend() != 'sqlite':
+            water_u, axes = load_array('hycom_water_u', kwargs)
+            water_v, _ = load_array('hycom_water_v', kwargs)
+            assert water_u.shape == water_v.shape, f'[{self.name}] water_u and water_v grids do not match'
+
+            val = np.sqrt(np.square(water_u) + np.square(water_v))
+
+            if gridded:
+                axes['lon'] = np.where(axes['lon'] > 180, axes['lon'] - 360, axes['lon'])
+                if np.all(np.diff(axes['lon']) > 0):
+                    return array_store.to_grid(val, axes, ('lat', 'lon', 'epoch', 'depth'))
+                return as_grid(array_store.to_columns(val, axes, ('lat', 'lon', 'epoch', 'depth')))
+
+            qry = array_store.to_columns(val, axes, ('lat', 'lon', 'epoch', 'depth'))
+
+            if qry.shape[1] == 0:
+                self.logger.warning(f'[{self.name}] water_uv: no data found in region '
+                                f'{fmt_coords(kwargs)}, returning empty arrays')
+                return np.array([[], [], [], [], []])
+
+            # convert longitude from [0;360] to [-180;180]
+            qry[2, qry[2] > 180] -= 360
+            return qry
+
         sql_query = ' AND '.join(['SELECT hycom_water_u.val, hycom_water_u.lat, hycom_water_u.lon, hycom_water_u.time, hycom_water_u.depth, hycom_water_v.val FROM hycom_water_u '\
                 'INNER JOIN hycom_water_v '\
                 'ON hycom_water_u.lat == hycom_water_v.lat',
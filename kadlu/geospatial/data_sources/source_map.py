@@ -60,6 +60,10 @@ load_map = dict(
     #turbidity_nemo      = nemo .Nemo().load_fraserturbidity,
 )
 
+# data sources whose loaders accept `gridded=True`, returning the data 
+# on a dense grid instead of as flattened rows
+gridded_sources = ('hycom', 'era5')
+
 precip_type_era5_map = {
     0: 'Reserved',
     1: 'Rain',
@@ -26,18 +26,27 @@ else:
     import pygrib
 
 from kadlu import index
+from kadlu.geospatial.data_sources import array_store, compact_store
 from kadlu.geospatial.data_sources.data_util import (
     Boundary,
+    backend_kwargs,
     database_cfg,
+    database_transaction,
     dt_2_epoch,
+    load_tiles,
     logmsg,
     logmsg_nodata,
+    range_query,
+    rtree_index,
     storage_cfg,
     str_def,
 )
 
 wwiii_tables = ['hs', 'dp', 'tp', 'windU', 'windV']
 
+# dimensions of the arrays in the array store
+wwiii_dims = ('epoch', 'lat', 'lon')
+
 wwiii_src = "https://data.nodc.noaa.gov/ncep/nww3/"
 
 # region boundaries as defined in WWIII docs:
@@ -55,30 +64,44 @@ wwiii_regions = [
 
 
 def initdb():
-    conn, db = database_cfg()
-    for var in wwiii_tables:
-        db.execute(f'CREATE TABLE IF NOT EXISTS {var}'
-                   '( val     REAL    NOT NULL, '
-                   '  lat     REAL    NOT NULL, '
-                   '  lon     REAL    NOT NULL, '
-                   '  time    INT     NOT NULL, '
-                   '  source  TEXT    NOT NULL) ')
-        db.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS '
-                   f'idx_{var} on {var}(time, lon, lat, val, source)')
-    conn.close()
+    with database_transaction() as db:
+        for var in wwiii_tables:
+            db.execute(f'CREATE TABLE IF NOT EXISTS {var}'
+                       '( val     REAL    NOT NULL, '
+                       '  lat     REAL    NOT NULL, '
+                       '  lon     REAL    NOT NULL, '
+                       '  time    INT     NOT NULL, '
+                       '  source  TEXT    NOT NULL) ')
+            db.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS '
+                       f'idx_{var} on {var}(time, lon, lat, val, source)')
+            rtree_index(db, var)
+
+
+def insert(table, agg, backend='sqlite', south=-90, north=90, west=-180, east=180, **_):
+    """ insert parsed data into local database
+
+        if backend is npz or compact, the data within the given boundaries
+        are placed on a dense grid and saved in the array store or using
+        the compact database schema instead
+
+        returns:
+            number of values saved in the array store, or None
+    """
+    if backend != 'sqlite':
+        val, lat, lon, epoch = agg[:4].astype(float)
+        idx = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+        values, axes = array_store.grid_points(val[idx], epoch=epoch[idx], lat=lat[idx], lon=lon[idx])
+        if backend == 'npz':
+            return array_store.save_tile(table, values, **axes)
+        return compact_store.save_tile(table, values, source='wwiii', **axes)
 
+    with database_transaction() as db:
+        db.executemany(
+            f"INSERT OR IGNORE INTO {table} VALUES (?,?,?,CAST(? AS INT),?)",
+            agg.T)
 
-def insert(table, agg):
-    """ insert parsed data into local database """
-    conn, db = database_cfg()
-    db.executemany(
-        f"INSERT OR IGNORE INTO {table} VALUES (?,?,?,CAST(? AS INT),?)",
-        agg.T)
-    conn.commit()
-    conn.close()
 
-
-def fetch_wwiii(var, **kwargs):
+def fetch_wwiii(var, backend='sqlite', **kwargs):
     """ download wwiii data and return associated filepaths
 
         args:
@@ -95,6 +118,10 @@ def fetch_wwiii(var, **kwargs):
                 the start of the desired time range
             end: datetime
                 the end of the desired time range
+            backend: str
+                storage backend. if `npz`, the data are stored as dense arrays
+                in the array store instead of the local database. if `compact`,
+                the data are stored using the compact database schema
 
         return:
             True if new data was fetched, else False
@@ -140,11 +167,12 @@ def fetch_wwiii(var, **kwargs):
     initdb()
     conn, db = database_cfg()
     n1 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
+    n = 0
 
     for msg, num in zip(grib, range(1, grib.messages)):
         if (msg['name'] != grbvar and md5(agg.tobytes()).hexdigest() != md5(
                 np.array([[], [], [], [], []]).tobytes()).hexdigest()):
-            insert(table, agg)
+            n += insert(table, agg, backend, **kwargs) or 0
             table = f'{var}{msg["name"][0]}' if var == 'wind' else var
             agg = np.array([[], [], [], [], []])
             grbvar = msg['name']
@@ -161,16 +189,43 @@ def fetch_wwiii(var, **kwargs):
                          for each in z[~z.mask].data]), src)).astype(object)
         agg = np.hstack((agg, grid))
         null += sum(sum(z.mask))
-    insert(table, agg)
+    n += insert(table, agg, backend, **kwargs) or 0
 
     n2 = db.execute(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
     conn.close()
 
-    logmsg('wwiii', var, (n1, n2), **kwargs)
+    logmsg('wwiii', var, (n1, n2) if backend == 'sqlite' else (0, n), **kwargs)
 
     return True
 
 
+def load_array(table, *, south, north, west, east, start, end, **_):
+    """ load wwiii data from the array store, or from the compact database
+        schema if the storage backend is `compact`
+
+        args:
+            table: string
+                table name, e.g. `hs`
+            south, north, west, east: float
+                coordinate boundaries
+            start, end: datetime
+                time range
+
+        return:
+            values: numpy array
+                data values with shape (time, lat, lon). missing values are NaN
+            axes: dict
+                the coordinate arrays epoch, lat, lon
+    """
+    return load_tiles(
+        table,
+        wwiii_dims,
+        lat=(south, north),
+        lon=(west, east),
+        epoch=(dt_2_epoch(start), dt_2_epoch(end)),
+    )
+
+
 def load_wwiii(var, kwargs):
     """ return downloaded wwiii data for specified wavevar according to given
         time, lat, lon boundaries
@@ -216,21 +271,27 @@ def load_wwiii(var, kwargs):
                    if k in ['south', 'north', 'west', 'east', 'start', 'end']
                }) as fetchmap:
         fetchvar = var if var not in ('windU', 'windV') else 'wind'
-        fetchmap(callback=fetch_wwiii, var=fetchvar)
+        fetchmap(callback=fetch_wwiii, var=fetchvar, **backend_kwargs())
+
+    if storage_cfg().backend() != 'sqlite':
+        slices = array_store.to_columns(*load_array(var, **kwargs), ('lat', 'lon', 'epoch'))
+        if slices.shape[1] == 0:
+            logmsg_nodata('wwiii', var, **kwargs)
+            return np.array([[], [], [], []])
 
+        return slices
+
+    initdb()
     conn, db = database_cfg()
-    db.execute(
-        ' AND '.join([
-            f'SELECT * FROM {var} WHERE lat >= ?', 'lat <= ?', 'lon >= ?',
-            'lon <= ?', 'time >= ?', 'time <= ? '
-        ]) + ' ORDER BY time, lat, lon ASC',
-        tuple(
-            map(str, [
-                kwargs['south'], kwargs['north'], kwargs['west'],
-                kwargs['east'],
-                dt_2_epoch(kwargs['start']),
-                dt_2_epoch(kwargs['end'])
-            ])))
+    db.execute(*range_query(
+        var,
+        bounds=dict(
+            lat=(kwargs['south'], kwargs['north']),
+            lon=(kwargs['west'], kwargs['east']),
+            time=(dt_2_epoch(kwargs['start']), dt_2_epoch(kwargs['end'])),
+        ),
+        order_by='time, lat, lon',
+    ))
 
     slices = np.array(db.fetchall(), dtype=object).T
     if len(slices) == 0:
@@ -261,13 +322,23 @@ class Wwiii():
         return load_wwiii('windV', kwargs)
 
     def load_wind_uv(self, **kwargs):
+        backend = storage_cfg().backend()
+
         with index(dx=180,
                    dy=90,
                    dz=5000,
                    dt=timedelta(days=1),
                    storagedir=storage_cfg(),
                    **kwargs) as fetchmap:
-            fetchmap(callback=fetch_wwiii, var='wind')
+            fetchmap(callback=fetch_wwiii, var='wind', **backend_kwargs())
+
+        if backend != 'sqlite':
+            wind_u, axes = load_array('windU', **kwargs)
+            wind_v, _ = load_array('windV', **kwargs)
+            assert wind_u.shape == wind_v.shape, 'windU and windV grids do not match'
+
+            val = np.sqrt(np.square(wind_u) + np.square(wind_v))
+            return array_store.to_columns(val, axes, ('lat', 'lon', 'epoch'))
 
         sql = ' AND '.join(['SELECT windU.val, windU.lat, windU.lon, windU.time, windV.val FROM windU '\
                 'INNER JOIN windV '\
@@ -3,10 +3,17 @@ import numpy as np
 import traceback
 import numpy as np
 from tqdm import tqdm
-from scipy.spatial import ConvexHull
+from scipy.spatial import ConvexHull, Delaunay
 from scipy.spatial._qhull import QhullError
-from scipy.interpolate import griddata, RectSphereBivariateSpline, RegularGridInterpolator
-from kadlu.utils import as_array, center_point, reverse_index_map, torad, deg2rad, XYtoLL, DLDL_over_DXDY
+from scipy.interpolate import (
+    griddata,
+    CloughTocher2DInterpolator,
+    LinearNDInterpolator,
+    NearestNDInterpolator,
+    RectSphereBivariateSpline,
+    RegularGridInterpolator,
+)
+from kadlu.utils import as_array, float_dtype, center_point, reverse_index_map, torad, deg2rad, XYtoLL, DLDL_over_DXDY, R1_IUGG
 
 
 '''
@@ -250,6 +257,12 @@ def _reshape(a, dims, coors, grid, scalar):
     return a
 
 
+def _same_grid(a, b):
+    """ Helper function for checking if two interpolators have the same grid and interpolation method """
+    return a.dims == b.dims and a.method == b.method \
+        and all(np.array_equal(a.coordinates[dim], b.coordinates[dim]) for dim in a.dims)
+
+
 def _complete_grid(**kwargs):
     """ Helper function for adding depth and time dimensions to a lat-lon grid
     
@@ -518,6 +531,9 @@ class RegularGridGeospatialInterpolator(BaseGeospatialInterpolator):
         else:
             self._interp = _ConstantInterpolator(values)
 
+        # min/max pyramids over the grid cells, see :meth:`max_value`
+        self._pyramids = {}
+
     @property
     def method(self):
         return self._interp.method
@@ -541,11 +557,398 @@ class RegularGridGeospatialInterpolator(BaseGeospatialInterpolator):
         # pass to interpolator
         v = self._interp(xi, grid=grid, **kwargs)
 
+        # return values with the precision of the data values
+        v = np.asarray(v, dtype=self.value.dtype)
+
         # reshape output to desired shape
         v = _reshape(v, dims=self.dims, coors=coors, grid=grid, scalar=scalar)
 
         return v
 
+    def prepare(self, grid=False, **kwargs):
+        """ Prepare the evaluation of the interpolation at a fixed set of coordinates.
+
+            The grid cell indices and interpolation weights are computed once, and can 
+            then be applied to this interpolator, or to any other interpolator or array 
+            of data values on the same grid. See :class:`PreparedQuery`.
+
+            Args:
+                lat: array-like
+                    Latitudes in degrees.
+                lon: array-like
+                    Longitudes in degrees.
+                depth: array-like
+                    Depths in meters below the sea surface. 
+                epoch: array-like
+                    Time in hours since 2000-01-01 00:00:00. 
+                grid: bool
+                    How to combine coordinate elements. If False (default) the coordinate arrays must have matching lengths.      
+
+            Returns:
+                query: PreparedQuery
+                    The prepared query
+
+            Example:
+                >>> query = ocean.temperature.prepare(lat=lats, lon=lons, depth=depths, grid=True) # doctest: +SKIP
+                >>> t, s = query(ocean.temperature), query(ocean.salinity) # doctest: +SKIP
+        """
+        return PreparedQuery(self, grid=grid, **kwargs)
+
+    def max_value(self, refine=False, **kwargs):
+        """ Upper bound on the data values within a disc or a lat-lon box.
+
+            The bound is the maximum of the data values at the corner nodes of the
+            grid cells overlapping the region, looked up in a min/max pyramid over
+            the grid cells, which is computed on the first query. By default, the
+            bound is taken over at most 2x2 blocks of the pyramid covering the region,
+            which may include cells some distance outside the region. With refine=True,
+            the blocks are subdivided down to the grid cells that actually overlap the
+            region, skipping blocks whose maximum cannot exceed the current bound.
+
+            Only data on a lat-lon grid is supported. The bound applies to the data
+            values, not to the interpolated values, which may slightly overshoot the
+            data if the interpolation is done with splines. Outside the grid, the
+            data values of the nearest grid cells are used.
+
+            Args:
+                south, north, west, east: float
+                    Boundaries of the lat-lon box in degrees. Boundaries that are not
+                    specified are unbounded.
+                radius: float
+                    Radius of the disc in meters. If specified, the box boundaries are
+                    ignored.
+                lat, lon: float
+                    Center of the disc in degrees.
+                x, y: float
+                    Center of the disc in meters, relative to the `origin` reference
+                    location. If neither lat,lon nor x,y are specified, the disc is
+                    centered at the origin.
+                origin: tuple(float,float)
+                    Reference location for XY coordinate system. If not specified, the
+                    reference location specified at initialisation is used.
+                refine: bool
+                    Subdivide the pyramid blocks down to the grid cells that overlap
+                    the region. Default is False.
+
+            Returns:
+                v: float
+                    Upper bound on the data values
+
+            Example:
+                >>> max_depth = ocean.interpolators['bathymetry'].max_value(radius=50e3) # doctest: +SKIP
+        """
+        return self._extremum("max", refine=refine, **kwargs)
+
+    def min_value(self, refine=False, **kwargs):
+        """ Lower bound on the data values within a disc or a lat-lon box.
+
+            Accepts the same arguments as :meth:`max_value`.
+
+            Returns:
+                v: float
+                    Lower bound on the data values
+        """
+        return self._extremum("min", refine=refine, **kwargs)
+
+    def _extremum(self, kind, refine=False, radius=None, lat=None, lon=None, x=None, y=None, origin=None,
+                  south=-np.inf, north=np.inf, west=-np.inf, east=np.inf):
+        assert not set(self.dims) - {"lat", "lon"}, f"[{self.name}] bounds are only available for data on a lat-lon grid"
+
+        values = np.squeeze(self.value)
+        if np.ndim(values) == 0:
+            return float(values)
+
+        # lat-lon box enclosing the disc, which is an ellipse in lat-lon coordinates
+        ellipse = radius is not None
+        if ellipse:
+            origin = self.origin if origin is None else origin
+            if x is not None or y is not None:
+                lat, lon = XYtoLL(x=0 if x is None else x, y=0 if y is None else y, lat_ref=origin[0], lon_ref=origin[1])
+
+            elif lat is None or lon is None:
+                lat, lon = origin
+
+            dlat = radius / (R1_IUGG * deg2rad)
+            dlon = radius / (R1_IUGG * np.cos(lat * deg2rad) * deg2rad)
+            south, north, west, east = lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+        # min/max pyramid, computed on the first query
+        if kind not in self._pyramids:
+            lats = self.coordinates.get("lat", np.zeros(1))
+            lons = self.coordinates.get("lon", np.zeros(1))
+            values = np.reshape(values, (len(lats), len(lons)))
+            self._pyramids[kind] = _MaxPyramid(values if kind == "max" else -values, lat=lats, lon=lons)
+
+        v = self._pyramids[kind](south, north, west, east, ellipse=ellipse, refine=refine)
+        return v if kind == "max" else -v
+
+
+class PreparedQuery():
+    """ Interpolation weights for a fixed set of coordinates on a regular grid.
+
+        Stores the indices of the grid nodes surrounding each coordinate and their 
+        interpolation weights, so the interpolation can be evaluated for any data 
+        values on the same grid by a weighted sum, without searching the grid again.
+
+        Precomputed weights are only available for the `linear`, `slinear`, and 
+        `nearest` methods. For other methods, e.g. the spline method used for 
+        lat-lon grids, the query evaluates the interpolator in the usual way.
+
+        Args:
+            interp: RegularGridGeospatialInterpolator
+                Interpolator whose grid and method are used for computing the weights
+            grid: bool
+                How to combine coordinate elements. If False (default) the coordinate arrays must have matching lengths.
+            kwargs: 
+                lat,lon,depth,epoch coordinates, as for :meth:`RegularGridGeospatialInterpolator.__call__`
+
+        Attrs:
+            index: numpy array
+                Flat indices of the grid nodes used for each coordinate; has shape 
+                (num_nodes, num_coordinates). None if weights are not available.
+            weight: numpy array
+                Interpolation weights; has the same shape as `index`.
+    """
+    methods = ["linear", "slinear", "nearest"]
+
+    def __init__(self, interp, grid=False, **kwargs):
+        self.name = self.__class__.__name__
+        self.logger = logging.getLogger("kadlu")
+
+        assert "x" not in kwargs and "y" not in kwargs, f"[{self.name}] coordinates must be specified as lat,lon"
+
+        self.dims = interp.dims.copy()
+        self.points = [interp.coordinates[dim] for dim in self.dims]
+        self.method = interp.method
+        self.grid = grid
+        self._kwargs = dict(kwargs, grid=grid)
+
+        # coordinates where interpolation is to be evaluated
+        self.coors, self.scalar = _coordinates_as_arrays(kwargs)
+
+        for dim in self.dims:
+            assert dim in self.coors, f"[{self.name}] `{dim}` required for evaluating interpolation"
+
+        if not grid:
+            _assert_same_size(*self.coors.values())
+
+        self.shape = None
+        self.index, self.weight = None, None
+
+        if not self._has_weights(interp):
+            debug_msg = f"[{self.name}] Interpolation weights not available for method `{self.method}`"
+            self.logger.debug(debug_msg)
+            return
+
+        xi = [v for k,v in self.coors.items() if k in self.dims]
+        if grid and len(xi) > 1:
+            xi = np.meshgrid(*xi, indexing="ij")
+            self.shape = xi[0].shape
+            xi = [x.flatten() for x in xi]
+
+        self.index, self.weight = self._weights(xi)
+
+    @classmethod
+    def _has_weights(cls, interp):
+        """ Helper function for checking if the weights can be used with a given interpolator """
+        return isinstance(interp, RegularGridGeospatialInterpolator) \
+            and isinstance(interp._interp, _RegularGridInterpolator) and interp.method in cls.methods
+
+    def _same_grid(self, interp):
+        """ Helper function for checking if an interpolator has the same grid and method as the query """
+        return interp.dims == self.dims and interp.method == self.method \
+            and all(np.array_equal(interp.coordinates[dim], p) for dim, p in zip(self.dims, self.points))
+
+    def _reshape(self, v):
+        """ Helper function for reshaping the weighted sums to the output shape """
+        if self.shape is not None:
+            v = np.reshape(v, self.shape)
+
+        return _reshape(v, dims=self.dims, coors=self.coors, grid=self.grid, scalar=self.scalar)
+
+    def _weights(self, xi):
+        """ Helper function for computing the grid node indices and weights 
+
+            Follows the conventions of scipy's RegularGridInterpolator, i.e., values 
+            outside the grid are linearly extrapolated from the nearest grid cell.
+
+            Args:
+                xi: list(numpy array)
+                    Flattened coordinate arrays, one for each interpolated dimension
+
+            Returns:
+                index: numpy array
+                    Flat indices of the grid nodes
+                weight: numpy array
+                    Interpolation weights
+        """
+        n = len(xi[0]) if len(xi) > 0 else 0
+        shape = [len(p) for p in self.points]
+        strides = np.cumprod([1] + shape[::-1])[::-1][1:]
+
+        index = np.zeros((1, n), dtype=np.int64)
+        weight = np.ones((1, n), dtype=float_dtype())
+
+        for p, x, stride in zip(self.points, xi, strides):
+            # lower grid node of the cell containing each coordinate
+            i = np.clip(np.searchsorted(p, x) - 1, 0, len(p) - 2)
+            t = ((x - p[i]) / (p[i + 1] - p[i])).astype(weight.dtype)
+
+            if self.method == "nearest":
+                index = index + np.where(t <= 0.5, i, i + 1) * stride
+
+            else:
+                index = np.concatenate([index + i * stride, index + (i + 1) * stride])
+                weight = np.concatenate([weight * (1 - t), weight * t])
+
+        return index, weight
+
+    def __call__(self, value):
+        """ Evaluate the interpolation at the prepared coordinates
+
+            Args:
+                value: RegularGridGeospatialInterpolator or array-like
+                    Interpolator, or data values on the grid of the interpolator 
+                    used to prepare the query. Interpolators on a different grid 
+                    are evaluated in the usual way.
+
+            Returns:
+                v: numpy array
+                    Interpolated values
+        """
+        if isinstance(value, BaseGeospatialInterpolator):
+            if self.index is None or not self._has_weights(value) or not self._same_grid(value):
+                return value(**self._kwargs)
+
+            value = value.value
+
+        assert self.index is not None, f"[{self.name}] Interpolation weights not available for method `{self.method}`"
+
+        value = np.squeeze(as_array(value))
+        assert value.shape == tuple(len(p) for p in self.points), \
+            f"[{self.name}] data values with shape {value.shape} do not match the grid of the query"
+
+        v = np.sum(value.ravel()[self.index] * self.weight, axis=0)
+
+        # reshape output to desired shape
+        return self._reshape(v)
+
+
+class StackedGridInterpolator():
+    """ Interpolation of several variables on the same regular grid.
+
+        The data values of all the variables are held in a single array with shape 
+        (num_vars, ...), so the grid cells and interpolation weights only need to be 
+        computed once per evaluation, regardless of the number of variables. 
+
+        Use :func:`stack_interpolators` to group a set of interpolators by grid.
+
+        Args:
+            interps: dict
+                Interpolators, with the variable names as keys. The interpolators must 
+                have the same grid and interpolation method, and use one of the 
+                methods `linear`, `slinear`, or `nearest`.
+            name: str
+                Name used to identify the interpolator. Optional.
+
+        Attrs:
+            names: list(str)
+                Variable names
+            value: numpy array
+                Data values; has shape (num_vars, ...)
+    """
+    def __init__(self, interps, name="StackedGridInterpolator"):
+        self.name = name
+        self.logger = logging.getLogger("kadlu")
+
+        self.names = list(interps.keys())
+        self.interpolators = interps
+
+        first = interps[self.names[0]]
+        for k,interp in interps.items():
+            assert PreparedQuery._has_weights(interp) and _same_grid(first, interp), \
+                f"[{self.name}] `{k}` is not on the grid of `{self.names[0]}` or uses a different method"
+
+        self.value = np.stack([np.squeeze(interp.value) for interp in interps.values()])
+        self._first = first
+
+        debug_msg = f"[{self.name}] Stacked {self.names} on grid with dimensions {first.dims} and shape {self.value.shape[1:]}"
+        self.logger.debug(debug_msg)
+
+    def __call__(self, names=None, grid=False, **kwargs):
+        """ Evaluate the interpolation of several variables at the given coordinate(s)
+
+            Args:
+                names: list(str)
+                    Names of the variables to be evaluated. If None (default), all 
+                    variables are evaluated.
+                lat: array-like
+                    Latitudes in degrees.
+                lon: array-like
+                    Longitudes in degrees.
+                depth: array-like
+                    Depths in meters below the sea surface. 
+                epoch: array-like
+                    Time in hours since 2000-01-01 00:00:00. 
+                grid: bool
+                    How to combine coordinate elements. If False (default) the coordinate arrays must have matching lengths.      
+
+            Returns:
+                values: dict
+                    Interpolated values, with the variable names as keys
+        """
+        if names is None:
+            names = self.names
+
+        # derivatives and x,y coordinates are handled by the individual interpolators
+        if "x" in kwargs or "y" in kwargs or np.sum(list(_derivative_orders(kwargs).values())) > 0:
+            return {k: self.interpolators[k](grid=grid, **kwargs) for k in names}
+
+        query = self._first.prepare(grid=grid, **kwargs)
+
+        rows = [self.names.index(k) for k in names]
+        value = self.value.reshape(len(self.names), -1)[rows]
+        v = np.sum(value[:, query.index] * query.weight, axis=1)
+
+        return {k: query._reshape(vi) for k,vi in zip(names, v)}
+
+
+def stack_interpolators(interps):
+    """ Group interpolators that share the same grid
+
+        Interpolators that do not support precomputed weights (see :class:`PreparedQuery`) 
+        are not grouped.
+
+        Args:
+            interps: dict
+                Interpolators, with the variable names as keys
+
+        Returns:
+            stacked: dict
+                Stacked interpolators, with the variable names as keys. Only contains 
+                variables that share their grid with at least one other variable.
+    """
+    groups = []
+    for k,interp in interps.items():
+        if not PreparedQuery._has_weights(interp):
+            continue
+
+        for group in groups:
+            if _same_grid(interps[group[0]], interp):
+                group.append(k)
+                break
+
+        else:
+            groups.append([k])
+
+    stacked = dict()
+    for group in groups:
+        if len(group) > 1:
+            interp = StackedGridInterpolator({k: interps[k] for k in group})
+            stacked.update({k: interp for k in group})
+
+    return stacked
+
 
 class IrregularGridGeospatialInterpolator(BaseGeospatialInterpolator):
     """
@@ -783,6 +1186,10 @@ class _IrregularGridInterpolator():
         self.fill_value = fill_value
         self.batch_size = batch_size
 
+        # triangulation and interpolation functions, built on first use
+        self._tri = None
+        self._interpolants = dict()
+
     def _validate_method(self, method):
         """ Helper function for validating the requested interpolation method
         
@@ -865,8 +1272,48 @@ class _IrregularGridInterpolator():
 
         return v
 
+    def _interpolant(self, method):
+        """ Helper function for getting the interpolation function for a given method.
+
+            The interpolation functions are built on first use and reused for all 
+            subsequent evaluations. The Delaunay triangulation of the data points is 
+            shared by the `linear` and `cubic` methods, while the `nearest` method 
+            uses a KD-tree.
+
+            Args:
+                method: str
+                    Interpolation method.
+
+            Returns:
+                interp: callable
+                    Interpolation function, or None for 1D data, which are 
+                    interpolated with scipy's griddata function.
+        """
+        if self.points.shape[1] == 1:
+            return None
+
+        if method not in self._interpolants:
+            if method == "nearest":
+                interp = NearestNDInterpolator(self.points, self.values)
+
+            else:
+                if self._tri is None:
+                    self.logger.debug(f"[{self.name}] Computing Delaunay triangulation of {self.points.shape[0]} data points")
+                    self._tri = Delaunay(self.points)
+
+                if method == "linear":
+                    interp = LinearNDInterpolator(self._tri, self.values, fill_value=self.fill_value)
+                else:
+                    interp = CloughTocher2DInterpolator(self._tri, self.values, fill_value=self.fill_value)
+
+            self._interpolants[method] = interp
+
+        return self._interpolants[method]
+
     def _batched_eval(self, pts, method):
-        """ Helper function for splitting evaluation of griddata function into multiple smaller requests"""
+        """ Helper function for splitting evaluation of the interpolation function into multiple smaller requests"""
+        interp = self._interpolant(method)
+
         n_batches = int(np.ceil(pts.shape[0] / self.batch_size))
         v = []
         if n_batches > 1:
@@ -877,7 +1324,10 @@ class _IrregularGridInterpolator():
         for i in tqdm(range(n_batches), disable = n_batches < 2):
             a = i * self.batch_size
             b = a + self.batch_size
-            vi = griddata(self.points, self.values, pts[a:b], method=method, fill_value=self.fill_value, rescale=False)
+            if interp is None:
+                vi = griddata(self.points, self.values, pts[a:b], method=method, fill_value=self.fill_value, rescale=False)
+            else:
+                vi = interp(pts[a:b])
             v.append(vi)
 
         v = np.concatenate(v, axis=0)
@@ -900,6 +1350,136 @@ class _ConstantInterpolator():
             return self.value
 
 
+class _MaxPyramid():
+    """ Pyramid of the maximum data values over blocks of grid cells on a 2d lat-lon grid.
+
+        Level 0 holds the maximum of the 4 corner nodes of every grid cell, and every
+        subsequent level the maximum over 2x2 blocks of the previous level, until a
+        single block covers the entire grid. For the minimum, use the negated values.
+
+        The outermost grid cells are extended to infinity, so every region overlaps
+        at least one cell. NaN values are ignored.
+
+        Args:
+            value: numpy array
+                Data values with shape (len(lat), len(lon))
+            lat: numpy array
+                Latitudes in degrees
+            lon: numpy array
+                Longitudes in degrees
+    """
+    def __init__(self, value, lat, lon):
+        value = np.array(value, dtype=np.float64)
+
+        # sort the grid in ascending order
+        if len(lat) > 1 and lat[0] > lat[-1]:
+            lat, value = lat[::-1], value[::-1]
+        if len(lon) > 1 and lon[0] > lon[-1]:
+            lon, value = lon[::-1], value[:, ::-1]
+
+        # cell boundaries along each axis
+        self.edges = []
+        for a in (lat, lon):
+            lo = np.concatenate([[-np.inf], a[1:-1]])
+            hi = np.concatenate([a[1:-1], [np.inf]])
+            self.edges.append((lo, hi))
+
+        # maximum over the corner nodes of every cell
+        for axis, a in enumerate((lat, lon)):
+            if len(a) > 1:
+                value = np.fmax(np.take(value, np.arange(len(a) - 1), axis=axis), np.take(value, np.arange(1, len(a)), axis=axis))
+
+        value[np.isnan(value)] = -np.inf
+
+        # maximum over 2x2 blocks, padding odd sizes with -inf
+        self.levels = [value]
+        while value.shape != (1, 1):
+            value = np.pad(value, [(0, n % 2) for n in value.shape], constant_values=-np.inf)
+            value = value.reshape(value.shape[0] // 2, 2, value.shape[1] // 2, 2).max(axis=(1, 3))
+            self.levels.append(value)
+
+    def _block_edges(self, level, i, j):
+        """ lat-lon boundaries of blocks at the given level """
+        edges = []
+        for (lo, hi), k in zip(self.edges, (i, j)):
+            edges.append(lo[k << level])
+            edges.append(hi[np.minimum(((k + 1) << level) - 1, len(lo) - 1)])
+
+        return edges
+
+    def __call__(self, south, north, west, east, ellipse=False, refine=False):
+        """ Upper bound on the data values within a lat-lon box, or within the ellipse inscribed in the box.
+
+            Args:
+                south, north, west, east: float
+                    Boundaries of the box in degrees
+                ellipse: bool
+                    Bound the values within the ellipse inscribed in the box
+                    instead of the box. Only relevant if refine is True.
+                refine: bool
+                    Subdivide the blocks down to the cells that overlap the region
+
+            Returns:
+                v: float
+                    Upper bound on the data values
+        """
+        # range of cells overlapping the box along each axis
+        (lat_lo, lat_hi), (lon_lo, lon_hi) = self.edges
+        i0, i1 = np.searchsorted(lat_hi, south, side="left"), np.searchsorted(lat_lo, north, side="right") - 1
+        j0, j1 = np.searchsorted(lon_hi, west, side="left"), np.searchsorted(lon_lo, east, side="right") - 1
+
+        # lowest level at which the box overlaps at most 2x2 blocks
+        level = 0
+        while (i1 >> level) - (i0 >> level) > 1 or (j1 >> level) - (j0 >> level) > 1:
+            level += 1
+
+        i = np.arange(i0 >> level, (i1 >> level) + 1)
+        j = np.arange(j0 >> level, (j1 >> level) + 1)
+        if not refine:
+            return float(np.max(self.levels[level][i[:, None], j]))
+
+        # overlap with the region, and containment in the region, of blocks with the given boundaries
+        if ellipse:
+            lat, lon = (south + north) / 2, (west + east) / 2
+            a, b = (north - south) / 2, (east - west) / 2
+            within = lambda y, x: ((y - lat) * b)**2 + ((x - lon) * a)**2 <= (a * b)**2
+            overlaps = lambda s, n, w, e: within(np.clip(lat, s, n), np.clip(lon, w, e))
+            contains = lambda s, n, w, e: within(s, w) & within(s, e) & within(n, w) & within(n, e)
+
+        else:
+            overlaps = lambda s, n, w, e: (s <= north) & (n >= south) & (w <= east) & (e >= west)
+            contains = lambda s, n, w, e: (s >= south) & (n <= north) & (w >= west) & (e <= east)
+
+        # branch and bound, starting from the blocks covering the box
+        i, j = [k.ravel() for k in np.meshgrid(i, j, indexing="ij")]
+        v_max = -np.inf
+        for level in range(level, -1, -1):
+            v = self.levels[level][i, j]
+            s, n, w, e = self._block_edges(level, i, j)
+
+            # keep blocks that overlap the region and may exceed the current bound
+            keep = overlaps(s, n, w, e) & (v > v_max)
+            i, j, v = i[keep], j[keep], v[keep]
+            s, n, w, e = s[keep], n[keep], w[keep], e[keep]
+
+            # blocks inside the region bound the maximum from below, as do all cells at the lowest level
+            inside = contains(s, n, w, e) | (level == 0)
+            if np.any(inside):
+                v_max = max(v_max, np.max(v[inside]))
+
+            if level == 0:
+                break
+
+            # subdivide the remaining blocks
+            i = (2 * i[~inside, None] + np.array([0, 0, 1, 1])).ravel()
+            j = (2 * j[~inside, None] + np.array([0, 1, 0, 1])).ravel()
+            shape = self.levels[level - 1].shape
+            valid = (i < shape[0]) & (j < shape[1])
+            i, j = i[valid], j[valid]
+
+        return float(v_max)
+
+
 def _create_regular_grid(max_size=100, grid_shape=None, bin_size=None, return_coverage=False, **kwargs):
     """ Creates regular grid with uniform spacing that covers a set of (lat,lon,depth,epoch) coordinates.
 
@@ -5,9 +5,9 @@ import logging
 import numpy as np
 from scipy.interpolate import NearestNDInterpolator
 import kadlu
-from kadlu.geospatial.interpolation import get_interpolator, GEOSPATIAL_DIMS
-from kadlu.geospatial.data_sources.data_util import fmt_coords, fmt_time
-from kadlu.geospatial.data_sources.source_map import load_map, precip_type_map
+from kadlu.geospatial.interpolation import get_interpolator, stack_interpolators, GEOSPATIAL_DIMS
+from kadlu.geospatial.data_sources.data_util import fill_nearest, fmt_coords, fmt_time
+from kadlu.geospatial.data_sources.source_map import gridded_sources, load_map, precip_type_map
 from kadlu.utils import center_point
 
 
@@ -130,6 +130,9 @@ class Ocean():
                 Bounding box for the ocean volume in space and time
             interpolators: dict
                 Dictionary of data interpolators
+            stacked: dict
+                Stacked interpolators for variables that share the same grid, 
+                e.g. HYCOM temperature and salinity. See :meth:`evaluate`.
     """
     def __init__(
         self,
@@ -194,7 +197,11 @@ class Ocean():
                 key = f'{vartype}_{load_arg.lower()}'
                 assert key in load_map.keys(), f"No entry found for {key} in Kadlu's load map:\n{load_map}"
 
-                data = load_map[key](**self.boundaries)
+                # load gridded data directly, where supported by the data source
+                if load_arg.lower() in gridded_sources:
+                    data = load_map[key](gridded=True, **self.boundaries)
+                else:
+                    data = load_map[key](**self.boundaries)
 
             elif isinstance(load_arg, (int, float)):
                 data = [load_arg]
@@ -216,6 +223,11 @@ class Ocean():
                 keys = ["value"] + GEOSPATIAL_DIMS
                 data = {keys[i]: arr for i,arr in enumerate(data)}
 
+            # fill grid points without data with the value of the nearest grid point
+            mask = data.pop("mask", None)
+            if mask is not None:
+                data["value"] = fill_nearest(data["value"], mask)
+
             # info message
             v = data["value"]
             if not v is default_value:
@@ -241,6 +253,44 @@ class Ocean():
         for vartype,interp in self.interpolators.items():
             setattr(self, vartype, interp)
 
+        # group variables that share the same grid
+        self.stacked = stack_interpolators(self.interpolators)
+
+    def evaluate(self, vartypes, **kwargs):
+        """ Interpolate several variables at the same coordinates.
+
+            Variables that share the same grid are evaluated together, 
+            locating the grid cells only once.
+
+            Args:
+                vartypes: list(str)
+                    Variable names, e.g. ['temperature', 'salinity']
+                **kwargs:
+                    Coordinates and options, as for the individual interpolators, 
+                    e.g. `lat`, `lon`, `depth`, `epoch`, `grid`
+
+            Returns:
+                values: dict
+                    Interpolated values, with the variable names as keys
+
+            Example:
+                >>> v = ocean.evaluate(['temperature', 'salinity'], lat=44, lon=-64, depth=10) # doctest: +SKIP
+        """
+        values = dict()
+        for vartype in vartypes:
+            if vartype in values:
+                continue
+
+            stacked = self.stacked.get(vartype)
+            if stacked is None:
+                values[vartype] = self.interpolators[vartype](**kwargs)
+
+            else:
+                names = [v for v in vartypes if v in stacked.names and v not in values]
+                values.update(stacked(names=names, **kwargs))
+
+        return {vartype: values[vartype] for vartype in vartypes}
+
 
 
 '''
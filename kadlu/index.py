@@ -2,11 +2,15 @@
 
 import os
 import json
+import time
 import pickle
 import sqlite3
 import logging
+import threading
 from hashlib import md5
+from itertools import product
 from multiprocessing import Pool
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 
 from numpy import arange
@@ -24,7 +28,30 @@ class index():
         Optionally can also store True/False instead of binary, segment
         a bounding-box coordinate region into smaller partitions, and
         run tasks in parallel
+
+        I/O-bound tasks can be split into a fetch function, which is run
+        concurrently for the missing bins in a bounded thread pool, and a
+        callback which receives the fetched data and is always called from
+        the calling thread, e.g.
+
+        >>> with index(source='hycom', **kwargs) as fetchmap: # doctest: +SKIP
+        ...     fetchmap(callback=write, fetch=download, var='salinity')
     '''
+    # maximum number of concurrent fetch requests per data source. the limits
+    # are shared by all index instances in the process
+    fetch_limits = dict(hycom=2, era5=4, cmems=4, gfs=4)
+
+    # maximum number of adjacent missing bins merged into a single fetch
+    # request per data source, along the (lon, lat, depth, time) axes.
+    # ERA5, GFS and CMEMS requests span a single day
+    coalesce_limits = dict(hycom=(4, 4, 1, 2), era5=(8, 8, 1, 1), cmems=(4, 4, 1, 1), gfs=(4, 4, 1, 1))
+
+    # fetch errors that are retried, e.g. connection errors and timeouts
+    retry_on = (OSError, )
+
+    _semaphores = {}
+    _semaphores_lock = threading.Lock()
+
     def hash_seed(self, callback, passkwargs={}):
         ''' Each data blob in the hashmap table is assumed to be uniquely
             described by a function and its input arguments.
@@ -71,6 +98,11 @@ class index():
                  dt=timedelta(days=1),
                  storagedir=os.getcwd(),
                  filename='checksums.db',
+                 source=None,
+                 threads=None,
+                 retries=2,
+                 backoff=1,
+                 coalesce=None,
                  **kwargs):
         """
             args:
@@ -83,10 +115,11 @@ class index():
                     function and input arguments will be stored to determine
                     whether the callback was called
                 inmemory:
-                    when store=True and inmemory=True, callback results can be
-                    stored to an in-memory database. this allows for faster
-                    read and update times for processing that requires frequent
-                    updates. will be copied to disk upon __exit__
+                    when inmemory=True, the hashmap is copied into an in-memory
+                    database upon __enter__, and callback results are stored
+                    there. this allows for faster read and update times for
+                    processing that requires frequent updates. new and updated
+                    hashes are copied back to disk upon __exit__
                 bins:
                     if True, boundary kwargs supplied to __init__ will be
                     split into multiple smaller area bins and passed to the
@@ -101,6 +134,24 @@ class index():
                     delta time bin size (timedelta)
                 storagedir:
                     directory to store spatial hashes and binary objects
+                source:
+                    name of the data source, e.g. 'hycom'. the number of
+                    concurrent fetch requests to a source is limited by
+                    index.fetch_limits
+                threads:
+                    number of threads used to fetch the missing bins when
+                    a fetch function is supplied. defaults to the fetch
+                    limit of the data source, or 1
+                retries:
+                    number of times a failed fetch is retried
+                backoff:
+                    delay in seconds before the first retry. the delay is
+                    doubled for each subsequent retry
+                coalesce:
+                    maximum number of adjacent missing bins merged into a
+                    single fetch request along the (lon, lat, depth, time)
+                    axes, e.g. (4, 4, 1, 1). defaults to the coalesce limit
+                    of the data source, or no merging
                 kwargs:
                     boundary arguments to split into bins, e.g.
                     (south, west, north, east, top, bottom, start, end)
@@ -112,8 +163,15 @@ class index():
         self.pool = pool
         self.storagedir = storagedir
         self.inmemory = inmemory
-        self.storage = (os.path.join(storagedir, filename)
-                        if not inmemory else ':memory:')
+        self.storage = os.path.join(storagedir, filename)
+        self._con = None
+        self._dirty = set()
+        self.source = source
+        self.threads = threads or self.fetch_limits.get(source, 1)
+        self.retries = retries
+        self.backoff = backoff
+        self.coalesce = coalesce or self.coalesce_limits.get(source, (1, 1, 1, 1))
+        self.deltas = (dx, dy, dz, dt) if bins else None
         self.kwargslist = list(self.bin_kwargs(
             dx,
             dy,
@@ -127,7 +185,7 @@ class index():
         assert os.path.isdir(str(
             self.storagedir)), f'invalid dir {self.storagedir}'
 
-        with sqlite3.connect(self.storage) as con:
+        with sqlite3.connect(self.storage, timeout=60) as con:
             db = con.cursor()
             db.execute('''
                 CREATE TABLE IF NOT EXISTS
@@ -146,33 +204,292 @@ class index():
                        (minval, pickle.dumps(None)))
             db.execute('INSERT OR IGNORE INTO hashmap VALUES (?,?)',
                        (maxval, pickle.dumps(None)))
-        # TODO:
-        # if self.inmemory: copy disk database into memory
-        # https://stackoverflow.com/questions/4019081/how-to-copy-a-sqlite-table-from-a-disk-database-to-a-memory-database-in-python
-        assert not self.inmemory, 'feature not yet implemented'
+
+
+        if self.inmemory:
+            # load the hashmap into memory using the sqlite backup API
+            self._con = sqlite3.connect(':memory:')
+            con.backup(self._con)
+            self._dirty = set()
+
+        con.close()
         return self
 
-    def __call__(self, *, callback, **passkwargs):
+    def __getstate__(self):
+        # connections cannot be pickled, e.g. when passing the index to a
+        # processing pool. a new connection is opened by the receiving process
+        state = self.__dict__.copy()
+        state['_con'] = None
+        return state
+
+    def connection(self):
+        """ connection to the hashmap database
+
+            the connection is opened on first use and reused for the duration
+            of the context. when inmemory=True, this is the in-memory copy of
+            the hashmap created upon __enter__
+        """
+        if self._con is None:
+            assert not self.inmemory, 'in-memory hashmap is only available within the index context'
+            self._con = sqlite3.connect(self.storage, timeout=60)
+        return self._con
+
+    def __call__(self, *, callback, fetch=None, **passkwargs):
+        if fetch is not None:
+            return self.schedule(callback=callback, fetch=fetch, **passkwargs)
         return list(self.__call_generator__(callback=callback, **passkwargs))
 
+    @classmethod
+    def _semaphore(cls, source, limit):
+        """ semaphore limiting the concurrent requests to a data source """
+        with cls._semaphores_lock:
+            return cls._semaphores.setdefault((source, limit), threading.BoundedSemaphore(limit))
+
+    def _fetch(self, fetch, passkwargs, kwargs):
+        """ call the fetch function, retrying with exponential backoff """
+        limit = self.fetch_limits.get(self.source, self.threads)
+        semaphore = self._semaphore(self.source, limit) if self.source else None
+        for attempt in range(self.retries + 1):
+            try:
+                if semaphore is None:
+                    return fetch(**passkwargs, **kwargs)
+                with semaphore:
+                    return fetch(**passkwargs, **kwargs)
+
+            except self.retry_on as err:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2**attempt
+                self.logger.warning('[%s] fetch failed (attempt %d/%d): %s. retrying in %g s',
+                                    self.name, attempt + 1, self.retries + 1, err, delay)
+                time.sleep(delay)
+
+    def blocks(self, todo):
+        """ merge adjacent bins into rectangular blocks
+
+            bins are merged greedily along the lon, lat, depth, and time axes,
+            up to the coalesce limits of the index
+
+            args:
+                todo:
+                    list of bin indices, e.g. the missing bins
+
+            returns:
+                list of blocks, each given as a list of bin indices
+        """
+        if self.deltas is None or len(todo) <= 1 or all(n == 1 for n in self.coalesce):
+            return [[i] for i in todo]
+
+        # position of the bins on the grid
+        keys = ('west', 'south', 'top', 'start')
+        origin = [min(self.kwargslist[i][k] for i in todo) for k in keys]
+        free = {}
+        for i in todo:
+            pos = tuple(
+                int(round((self.kwargslist[i][k] - o) / d))
+                for k, o, d in zip(keys, origin, self.deltas))
+            free[pos] = i
+
+        blocks = []
+        for pos in sorted(free, key=lambda p: p[::-1]):
+            if pos not in free:
+                continue
+
+            # grow the block along each axis while the adjacent slab is free
+            size = [1, 1, 1, 1]
+            for axis, limit in enumerate(self.coalesce):
+                while size[axis] < limit:
+                    ranges = [range(p, p + n) for p, n in zip(pos, size)]
+                    ranges[axis] = [pos[axis] + size[axis]]
+                    if not all(p in free for p in product(*ranges)):
+                        break
+                    size[axis] += 1
+
+            members = product(*[range(p, p + n) for p, n in zip(pos, size)])
+            blocks.append([free.pop(p) for p in members])
+
+        return blocks
+
+    def schedule(self, *, callback, fetch, **passkwargs):
+        """ fetch the missing bins concurrently and pass the data to the callback
+
+            adjacent missing bins are merged into larger rectangular blocks,
+            up to the coalesce limits of the index, and each block is fetched
+            with a single request. cached bins are not merged.
+
+            the fetch function is called for each block in a pool of worker
+            threads. the callback is called with the fetched data as keyword
+            argument `data` from the calling thread, so that all writes to the
+            database are made by a single writer. at most 2x threads blocks
+            are fetched ahead of the writer. every bin in a block is marked as
+            done with the result of the callback
+
+            the hash seed is computed from the callback, so bins that were
+            previously processed by calling the callback alone are not fetched
+            again
+
+            args:
+                callback:
+                    function called with the fetched data, e.g. to insert the
+                    data into the database. must accept the keyword argument
+                    `data`
+                fetch:
+                    function returning the data for a bin, e.g. by downloading
+                    and decoding it
+                passkwargs:
+                    keyword arguments passed to the fetch and callback functions
+
+            returns:
+                list of callback results, ordered by bin
+        """
+        seed = self.hash_seed(callback, passkwargs)
+        checksums = [self.hash_dict(kwargs, seed) for kwargs in self.kwargslist]
+        cached = self.lookup(checksums)
+        blobs = [cached.get(checksum) for checksum in checksums]
+
+        todo = [i for i, checksum in enumerate(checksums)
+                if checksum not in cached or self.inmemory]
+        blocks = [(block, self.merge_kwargs(block)) for block in self.blocks(todo)]
+        self.logger.debug('[%s] %d of %d bins cached, fetching %d bins in %d requests using %d threads, seed: %s',
+                          self.name, len(cached), len(checksums), len(todo), len(blocks), self.threads, seed)
+
+        def write(block, kwargs, data):
+            obj = callback(data=data, **passkwargs, **kwargs)
+            for i in block:
+                checksum = checksums[i]
+                blobs[i] = self._update(checksum, obj) if checksum in cached else self._insert(checksum, obj)
+
+        if self.threads == 1 or len(blocks) <= 1:
+            for block, kwargs in blocks:
+                write(block, kwargs, self._fetch(fetch, passkwargs, kwargs))
+            return [pickle.loads(blob) for blob in blobs]
+
+        queue = iter(blocks)
+        pending = {}
+        with ThreadPoolExecutor(self.threads, thread_name_prefix='kadlu-fetch') as pool:
+            try:
+                while True:
+                    # fetch ahead of the writer, up to twice the number of threads
+                    for block, kwargs in queue:
+                        pending[pool.submit(self._fetch, fetch, passkwargs, kwargs)] = (block, kwargs)
+                        if len(pending) >= 2 * self.threads:
+                            break
+
+                    if len(pending) == 0:
+                        break
+
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        write(*pending.pop(future), future.result())
+
+            except BaseException:
+                pool.shutdown(wait=True, cancel_futures=True)
+                raise
+
+        return [pickle.loads(blob) for blob in blobs]
+
+    def merge_kwargs(self, block):
+        """ boundaries spanning all bins in a block """
+        if len(block) == 1:
+            return self.kwargslist[block[0]]
+
+        bins = [self.kwargslist[i] for i in block]
+        kwargs = dict(bins[0])
+        for lo, hi in (('west', 'east'), ('south', 'north'), ('top', 'bottom'), ('start', 'end')):
+            kwargs[lo] = min(b[lo] for b in bins)
+            kwargs[hi] = max(b[hi] for b in bins)
+        return kwargs
+
     def __call_generator__(self, *, callback, **passkwargs):
         seed = self.hash_seed(callback, passkwargs)
         assert self.pool == 1, 'use parallelindex for processing pool'
 
-        for kwargs in self.kwargslist:
-            if not self.serialized(kwargs, seed):
-                self.insert_hash(kwargs, seed,
-                                 callback(**passkwargs, **kwargs))
+        # resolve the existing bins with a single lookup before calling back
+        checksums = [self.hash_dict(kwargs, seed) for kwargs in self.kwargslist]
+        cached = self.lookup(checksums)
+        self.logger.debug('[%s] %d of %d bins cached, seed: %s',
+                          self.name, len(cached), len(checksums), seed)
+
+        for kwargs, checksum in zip(self.kwargslist, checksums):
+            if checksum not in cached:
+                self.logger.debug('[%s] bin: kwargs = %s', self.name, kwargs)
+                blob = self._insert(checksum, callback(**passkwargs, **kwargs))
             elif self.inmemory:
-                self.update_hash(kwargs, seed,
-                                 callback(**passkwargs, **kwargs))
-            yield pickle.loads(self.serialized(kwargs, seed))
+                blob = self._update(checksum, callback(**passkwargs, **kwargs))
+            else:
+                blob = cached[checksum]
+            yield pickle.loads(blob)
 
     def __exit__(self, exc_type, exc_value, tb):
-        # TODO:
-        # if self.inmemory: copy in-memory database back to disk
-        # https://stackoverflow.com/questions/4019081/how-to-copy-a-sqlite-table-from-a-disk-database-to-a-memory-database-in-python
-        assert not self.inmemory, 'feature not yet implemented'
+        if self._con is None:
+            return
+
+        if self.inmemory and len(self._dirty) > 0:
+            self.flush()
+
+        self._con.close()
+        self._con = None
+
+    def flush(self):
+        """ copy hashes that were inserted, updated, or dropped in the
+            in-memory hashmap back to disk
+
+            changes are written in a single transaction, so the hashmap on disk
+            is updated atomically. hashes written to disk by other processes in
+            the meantime are kept
+        """
+        assert self.inmemory and self._con is not None, 'no in-memory hashmap to flush'
+        self.logger.debug(f'[{self.name}] flush {len(self._dirty)} hashes to {self.storage}')
+
+        con = self._con
+        con.execute('ATTACH DATABASE ? AS disk', (self.storage, ))
+        try:
+            with con:
+                con.execute('CREATE TEMP TABLE IF NOT EXISTS dirty(hash INTEGER PRIMARY KEY)')
+                con.execute('DELETE FROM dirty')
+                con.executemany('INSERT INTO dirty VALUES (?)', ((h, ) for h in self._dirty))
+                con.execute('DELETE FROM disk.hashmap WHERE hash IN (SELECT hash FROM dirty)')
+                con.execute('INSERT INTO disk.hashmap SELECT * FROM main.hashmap '
+                            'WHERE hash IN (SELECT hash FROM dirty)')
+        finally:
+            con.execute('DETACH DATABASE disk')
+
+        self._dirty = set()
+
+    def lookup(self, checksums):
+        """ find which hashes exist in the hashmap
+
+            args:
+                checksums:
+                    list of hashes, as computed by hash_dict
+
+            returns:
+                dictionary mapping each existing hash to its binary object
+        """
+        found = {}
+        chunk = 999  # stay below the sqlite limit on query parameters
+        for i in range(0, len(checksums), chunk):
+            part = checksums[i:i + chunk]
+            found.update(self.connection().execute(
+                f'SELECT hash, bytes FROM hashmap WHERE hash IN ({",".join("?" * len(part))})',
+                part).fetchall())
+        return found
+
+    def _insert(self, checksum, obj):
+        blob = pickle.dumps(obj) if self.store else pickle.dumps(None)
+        with self.connection() as con:
+            con.execute('INSERT OR REPLACE INTO hashmap VALUES (?,?)', (checksum, blob))
+        if self.inmemory:
+            self._dirty.add(checksum)
+        return blob
+
+    def _update(self, checksum, obj):
+        blob = pickle.dumps(obj)
+        with self.connection() as con:
+            con.execute('UPDATE hashmap SET bytes = ? WHERE hash = ?', (blob, checksum))
+        if self.inmemory:
+            self._dirty.add(checksum)
+        return blob
 
     def insert_hash(self, kwargs={}, seed='', obj=None):
         """ create a checksum of the arguments in the hashmap
@@ -187,16 +504,10 @@ class index():
                     arbitrary binary data that will be attributed to the hash
                     in the hashmap db table
         """
-        self.logger.debug(f'[{self.name}] insert hash {self.hash_dict(kwargs, seed)}\n'
-                      f'[{self.name}] seed: {seed}\n'
-                      f'[{self.name}] bin: kwargs = {kwargs}')
-        with sqlite3.connect(self.storage) as con:
-            db = con.cursor()
-            db.execute(
-                'INSERT INTO hashmap VALUES (?,?)',
-                (self.hash_dict(kwargs, seed),
-                 bytes(
-                     pickle.dumps(obj) if self.store else pickle.dumps(None))))
+        checksum = self.hash_dict(kwargs, seed)
+        self.logger.debug('[%s] insert hash %d, seed: %s, bin: kwargs = %s',
+                          self.name, checksum, seed, kwargs)
+        self._insert(checksum, obj)
 
     def update_hash(self, kwargs={}, seed='', obj=None):
         """ update hashmap checksum value
@@ -211,13 +522,10 @@ class index():
                     arbitrary binary data that will be attributed to the hash
                     in the hashmap db table
         """
-        self.logger.debug(f'[{self.name}] update hash {self.hash_dict(kwargs, seed)}\n'
-                      f'[{self.name}] seed: {seed}\n'
-                      f'[{self.name}] bin: kwargs = {kwargs}')
-        with sqlite3.connect(self.storage) as con:
-            db = con.cursor()
-            db.execute('UPDATE hashmap SET bytes = ? WHERE hash = ?',
-                       (pickle.dumps(obj), self.hash_dict(kwargs, seed)))
+        checksum = self.hash_dict(kwargs, seed)
+        self.logger.debug('[%s] update hash %d, seed: %s, bin: kwargs = %s',
+                          self.name, checksum, seed, kwargs)
+        self._update(checksum, obj)
 
     def drop_hash(self, kwargs={}, seed=''):
         """
@@ -228,13 +536,13 @@ class index():
                 seed:
                     additional salt added to the hash
         """
-        self.logger.debug(f'[{self.name}] drop hash {self.hash_dict(kwargs, seed)}\n'
-                      f'[{self.name}] seed: {seed }\n'
-                      f'[{self.name}] bin: kwargs = {kwargs}')
-        with sqlite3.connect(self.storage) as con:
-            db = con.cursor()
-            db.execute('DELETE FROM hashmap WHERE hash = ?',
-                       (self.hash_dict(kwargs, seed), ))
+        checksum = self.hash_dict(kwargs, seed)
+        self.logger.debug('[%s] drop hash %d, seed: %s, bin: kwargs = %s',
+                          self.name, checksum, seed, kwargs)
+        with self.connection() as con:
+            con.execute('DELETE FROM hashmap WHERE hash = ?', (checksum, ))
+        if self.inmemory:
+            self._dirty.add(checksum)
 
     def serialized(self, kwargs={}, seed=''):
         """
@@ -248,23 +556,14 @@ class index():
             returns:
                 binary object or True if hash exists in database, else False
         """
-        with sqlite3.connect(self.storage) as con:
-            db = con.cursor()
-            db.execute('SELECT * FROM hashmap WHERE hash == ?',
-                       (self.hash_dict(kwargs, seed), ))
-            res = db.fetchone()
-
-        self.logger.debug(f'[{self.name}] check hash {self.hash_dict(kwargs, seed)}'
-                      f': {"exists" if res is not None else "missing" }\n'
-                      f'[{self.name}] seed: {seed}\n'
-                      f'[{self.name}] bin: kwargs = {kwargs}')
+        checksum = self.hash_dict(kwargs, seed)
+        res = self.lookup([checksum]).get(checksum, False)
+        self.logger.debug('[%s] check hash %d: %s, seed: %s, bin: kwargs = %s',
+                          self.name, checksum, 'missing' if res is False else 'exists', seed, kwargs)
 
         if res is None:
-            return False
-        if res[1] is None:
             return True
-        if res[1] is not None:
-            return res[1]
+        return res
 
     def bin_kwargs(self, dx, dy, dz, dt, **kwargs):
         """ generate argument sets as area subsets of boundary kwargs
@@ -341,28 +640,34 @@ class parallelindex(index):
     def __call__(self, *, callback, **passkwargs):
         assert len(
             self.kwargslist) > 1, 'nothing to parallelize when bins=False'
-        with Pool(self.pool) as p:
-            return list(
-                p.map(
-                    self.__call_generator__,
-                    zip(
-                        (callback for _ in self.kwargslist),
-                        self.kwargslist,
-                        (passkwargs for _ in self.kwargslist),
-                    ),
-                ))
-
-    def __call_generator__(self, args):
-        callback, kwargs, passkwargs = args
         seed = self.hash_seed(callback, passkwargs)
+        checksums = [self.hash_dict(kwargs, seed) for kwargs in self.kwargslist]
+        cached = self.lookup(checksums)
 
-        if not self.serialized(kwargs, seed):
-            self.insert_hash(kwargs, seed, callback(**passkwargs, **kwargs))
-
-        elif self.inmemory:
-            self.update_hash(kwargs, seed, callback(**passkwargs, **kwargs))
+        # only the missing bins are passed to the processing pool
+        todo = [i for i, checksum in enumerate(checksums)
+                if checksum not in cached or self.inmemory]
+        with Pool(self.pool) as p:
+            res = p.map(
+                self.__call_generator__,
+                zip(
+                    (callback for _ in todo),
+                    (self.kwargslist[i] for i in todo),
+                    (passkwargs for _ in todo),
+                    (checksums[i] for i in todo),
+                    (checksums[i] in cached for i in todo),
+                ),
+            )
+
+        blobs = [cached.get(checksum) for checksum in checksums]
+        for i, blob in zip(todo, res):
+            blobs[i] = blob
+        return [pickle.loads(blob) for blob in blobs]
 
-        return pickle.loads(self.serialized(kwargs, seed))
+    def __call_generator__(self, args):
+        callback, kwargs, passkwargs, checksum, exists = args
+        obj = callback(**passkwargs, **kwargs)
+        return self._update(checksum, obj) if exists else self._insert(checksum, obj)
 
 
 '''
@@ -8,7 +8,7 @@ from scipy.interpolate import LinearNDInterpolator, NearestNDInterpolator
 from kadlu.geospatial.ocean import Ocean
 from kadlu.sound.sound_speed import SoundSpeed
 from kadlu.sound.parabolic_equation import TransmissionLoss
-from kadlu.utils import xdist, ydist, LLtoXY, XYtoLL, DLDL_over_DXDY, deg2rad
+from kadlu.utils import xdist, ydist, LLtoXY, XYtoLL, DLDL_over_DXDY, deg2rad, float_dtype
 """ Wind source level parametrization of Kewley et al. 1990.
     Values inferred from Fig. 5.7, Ocean Ambient Noise p. 114.
 
@@ -194,11 +194,26 @@ def transmission_loss(
     def sound_speed_func(x,y,z,grid=False):
         return ss(x=x, y=y, depth=z, grid=grid)
 
+    def sound_speed_profile_func(x,y,z):
+        return ss.profile(x=x, y=y, depth=z)
+
+    # the refractive propagation matrix only needs to be computed once if 
+    # neither the bathymetry nor the sound speed vary horizontally
+    dims = ocean.interpolators['bathymetry'].dims + ss.dims
+    k.setdefault('range_independent', 'lat' not in dims and 'lon' not in dims)
+
+    # bound the depth within the propagation range from the bathymetry data values,
+    # instead of searching the interpolated bathymetry
+    bathy = ocean.interpolators['bathymetry']
+    if 'max_depth' not in k.keys() and set(bathy.dims) <= {'lat', 'lon'}:
+        k['max_depth'] = bathy.max_value(radius=1e3 * propagation_range, refine=True)
+
     transm_loss = TransmissionLoss(
         freq=freq,
         bathy_func=bathy_func,
         bathy_deriv_func=bathy_deriv_func,
         sound_speed_func=sound_speed_func,
+        sound_speed_profile_func=sound_speed_profile_func,
         bottom=seafloor,
         propagation_range=propagation_range,
         **k
@@ -220,6 +235,7 @@ def geophony(freq,
              },
              below_seafloor=False,
              progress_bar=True,
+             dry_run=False,
              **kwargs):
     """ Calculate ocean ambient noise levels.
 
@@ -260,10 +276,18 @@ def geophony(freq,
                 Compute the noise below the seafloor. Default is False.
             progress_bar: bool
                 Display calculation progress bar. Default is True.
+            dry_run: bool
+                If True, the noise levels are not computed. Instead, the estimated cost 
+                of the transmission loss computation at each location is returned, 
+                for capacity planning. See :meth:`kadlu.sound.parabolic_equation.TransmissionLoss.estimate`.
+                Default is False.
 
         Returns:
             g: dict
                 Model output: spl,lats,lons,x,y,z,bathy.
+                If dry_run is True, spl is replaced by flops,memory,time, each a numpy.array 
+                with shape (nx,ny), containing the estimated number of floating-point operations, 
+                memory in bytes, and wall time in seconds at each location.
 
                     * spl: numpy.array with shape (nx,ny,nz)
                         Sound pressure levels in dB re 1 uPa^2 / Hz
@@ -321,6 +345,7 @@ def geophony(freq,
     N = len(lats)
     spl = None
     bathy = []
+    cost = []
     if N == 1:
         progress_bar = False
         progress_bar_transm = True
@@ -347,14 +372,21 @@ def geophony(freq,
         if below_seafloor: z = depth
         else: z = depth[depth <= b]
 
+        # set receiver depth to 1/4 of the characteristic wave length
+        rec_depth = 0.25 * kwargs['c0'] / freq
+
+        if dry_run:
+            # estimated cost of the transmission loss computation
+            c = transm_loss.estimate(source_depth=z, rec_depth=rec_depth) if len(z) > 0 else dict(flops=0, memory=0, time=0)
+            cost.append([c['flops'], c['memory'], c['time']])
+            continue
+
         if len(z) == 0:
             dB = np.empty((1, len(depth)), dtype=float)
             dB[:, :] = np.nan
 
         else:
             # transmission loss
-            rec_depth = 0.25 * kwargs[
-                'c0'] / freq  # set receiver depth to 1/4 of the characteristic wave length
             tl, ax = transm_loss.calc(source_depth=z,
                                       rec_depth=rec_depth,
                                       progress_bar=progress_bar_transm)
@@ -368,7 +400,8 @@ def geophony(freq,
                                           sl_func=sl_func)
 
             # integrate SL-TL to obtain sound pressure level
-            p = np.power(10, (sl - tl) / 10)
+            # (in the precision of the transmission loss)
+            p = np.power(10, (np.asarray(sl, dtype=tl.dtype) - tl) / 10)
             p = np.squeeze(np.apply_over_axes(np.sum, p, range(
                 1, p.ndim)))  # sum over all but the first axis
             dB = 10 * np.log10(p)
@@ -386,8 +419,22 @@ def geophony(freq,
         if spl is None: spl = dB
         else: spl = np.concatenate((spl, dB), axis=0)
 
+    if dry_run:
+        cost = np.swapaxes(np.reshape(np.array(cost, dtype=float), newshape=(len(y), len(x), 3)), 0, 1)
+        return {
+            'flops': cost[:, :, 0],
+            'memory': cost[:, :, 1],
+            'time': cost[:, :, 2],
+            'lats': lats,
+            'lons': lons,
+            'x': x,
+            'y': y,
+            'z': depth,
+            'bathy': bathy
+        }
+
     # transform output array to desired shape
-    spl = np.reshape(spl, newshape=(len(y), len(x), spl.shape[1]))
+    spl = np.reshape(spl.astype(float_dtype(), copy=False), newshape=(len(y), len(x), spl.shape[1]))
     spl = np.swapaxes(spl, 0, 1)
 
     return {
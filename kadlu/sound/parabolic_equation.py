@@ -1,13 +1,25 @@
 """ This module contains methods for numerically solving the parabolic wave
     equation of Thomson and Chapman.
 """
+import copy
 import logging
+import threading
+import time
+import netCDF4
 import numpy as np
+import scipy.fft
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from numpy.lib import scimath
-from kadlu.utils import toarray, deg2rad
+from kadlu.utils import toarray, deg2rad, complex_dtype
 from tqdm import tqdm
 from kadlu.plot_util import plot_transm_loss_horiz, plot_transm_loss_vert
 
+# pyFFTW is optional
+try:
+    import pyfftw
+except ImportError:
+    pyfftw = None
+
 
 def thomson_starter(k0, kz, dz, zs, theta1):
     """ Compute Thomson starter field :math:`\psi (0, k_z)` as defined in
@@ -204,6 +216,82 @@ class Grid():
         return z, dz, idx_pos, idx_neg, idx_mirror
 
 
+def plan_grid(freq,
+              max_depth,
+              r_max,
+              c0=1500,
+              aperture=86,
+              accuracy=1,
+              angular_bin=10,
+              cross_range=None):
+    """ Size the computational grid for the transmission loss computation.
+
+        The grid spacings are set by the wavelength, c0/freq,
+
+            * dz: the vertical wavenumbers of the starter field, up to k0*sin(aperture), 
+              are sampled at the Nyquist rate, i.e., dz = wavelength / (2*sin(aperture))
+            * dr: one wavelength
+
+        Both spacings are divided by the accuracy factor. With an aperture of 90 degrees 
+        and accuracy 1, the spacings are those of the default grid of :class:`TransmissionLoss`.
+
+        The vertical range is 4/3 of the physical depth, i.e., the maximum seafloor 
+        depth plus three wavelengths, leaving room for the artificial absorption layer. 
+        It is rounded up so the number of vertical grid points is a fast FFT length. 
+
+        The angular bin is reduced, if necessary, so the distance between adjacent 
+        azimuthal bins at the maximum range does not exceed cross_range.
+
+        Args:
+            freq: float
+                Frequency in Hz
+            max_depth: float
+                Maximum seafloor depth in meters within the propagation range
+            r_max: float
+                Radial range in meters
+            c0: float
+                Reference sound speed in m/s
+            aperture: float
+                Half-beamwidth of the starter field in degrees. Default is 86 degrees.
+            accuracy: float
+                Refinement factor for the radial and vertical grid spacings. 
+                Default is 1. The computational cost scales as roughly accuracy squared.
+            angular_bin: float
+                Angular bin size in degrees. Default is 10 degrees.
+            cross_range: float
+                Maximum distance in meters between adjacent azimuthal bins 
+                at the maximum range. Optional.
+
+        Returns:
+            grid_kwargs: dict
+                Keyword arguments for :class:`Grid`, i.e., dr, r_max, dz, z_max, dq and q.
+    """
+    assert accuracy > 0, 'accuracy must be positive'
+    wavelength = c0 / freq
+
+    dz = wavelength / (2 * np.sin(min(aperture, 90) * deg2rad)) / accuracy
+    dr = wavelength / accuracy
+
+    # vertical range, with a fast FFT length
+    z_max = 4. / 3 * (max_depth + 3 * wavelength)
+    nz = scipy.fft.next_fast_len(int(round(z_max / dz)) * 2)
+    while nz % 2 == 1:
+        nz = scipy.fft.next_fast_len(nz + 1)
+
+    dq = angular_bin * deg2rad
+    if cross_range is not None:
+        dq = min(dq, cross_range / r_max)
+
+    return {
+        'dr': dr,
+        'r_max': r_max,
+        'dz': dz,
+        'z_max': nz / 2 * dz,
+        'dq': dq,
+        'q': None
+    }
+
+
 def prop_defr(x, k0, kz, nq):
     """ Compute the defractive propagation matrix, :math:`U_D`.
 
@@ -399,7 +487,8 @@ def eff_index_refr_sq(z,
                       n2b,
                       r,
                       rb,
-                      return_density=False):
+                      return_density=False,
+                      smooth=True):
     """ Compute the effective index of refraction squared.
 
         Args:
@@ -423,6 +512,10 @@ def eff_index_refr_sq(z,
                 Bottom density in g/cm^3
             return_density: bool
                 Return the smoothened density array. Default is False.
+            smooth: bool
+                Smoothen the index of refraction from the water column to the bottom 
+                layer. Set to False if n2 already includes the bottom layer, as computed 
+                with :func:`smooth_index_refr`, in which case n2b is ignored. Default is True.
 
         Returns:
             n2e: numpy.array
@@ -431,13 +524,166 @@ def eff_index_refr_sq(z,
                 Smoothened density. Only returned if return_density is True.
 
     """
-    n2s = smooth_index_refr(z, zb, n2, n2b, np.finfo(float).eps)
+    n2s = smooth_index_refr(z, zb, n2, n2b, np.finfo(float).eps) if smooth else n2
     rs, dr2, d2r = smooth_density(z, zb, dzb2, L, r, rb)
     n2e = n2s + 1 / (2 * k0**2) * (1 / rs * d2r - 3 / (2 * rs**2) * dr2)
     if return_density: return n2e, rs
     else: return n2e
 
 
+class VerticalFFT():
+    """ Forward and inverse FFTs along the vertical axis of the PE field.
+
+        The transforms are computed in place on a preallocated buffer of 
+        shape (ns,nz,nq), so no new arrays are allocated during the PE marching.
+
+        Two backends are available,
+
+            * scipy: scipy.fft, which caches its plans internally. The transforms 
+              can be split across several threads with `workers`.
+            * pyfftw: FFTW plans created once for the buffer. Requires pyFFTW 
+              to be installed.
+
+        Args:
+            shape: tuple(int)
+                Shape of the buffer, (ns,nz,nq)
+            dtype: 
+                Complex data type of the buffer
+            workers: int
+                Number of threads used for computing the transforms. Default is 1.
+            backend: str
+                FFT backend. Options are `scipy` (default) and `pyfftw`.
+
+        Attrs:
+            buffer: numpy.array
+                The field to be transformed
+    """
+    backends = ['scipy', 'pyfftw']
+
+    def __init__(self, shape, dtype, workers=1, backend='scipy'):
+        assert backend in self.backends, f'invalid FFT backend {backend}. Valid options are: {self.backends}'
+        assert backend != 'pyfftw' or pyfftw is not None, 'pyFFTW must be installed to use the pyfftw backend'
+
+        self.workers = 1 if workers is None else workers
+        self.backend = backend
+
+        if backend == 'pyfftw':
+            self.buffer = pyfftw.empty_aligned(shape, dtype=dtype)
+            kwargs = dict(axes=(1,), threads=self.workers, flags=('FFTW_MEASURE',))
+            self._fft = pyfftw.FFTW(self.buffer, self.buffer, direction='FFTW_FORWARD', **kwargs)
+            self._ifft = pyfftw.FFTW(self.buffer, self.buffer, direction='FFTW_BACKWARD', **kwargs)
+
+        else:
+            self.buffer = np.empty(shape, dtype=dtype)
+
+    def fft(self):
+        """ Forward transform of the buffer, in place """
+        if self.backend == 'pyfftw':
+            self._fft()
+        else:
+            self._copy(scipy.fft.fft(self.buffer, axis=1, overwrite_x=True, workers=self.workers))
+
+        return self.buffer
+
+    def ifft(self):
+        """ Inverse transform of the buffer, in place """
+        if self.backend == 'pyfftw':
+            self._ifft()
+        else:
+            self._copy(scipy.fft.ifft(self.buffer, axis=1, overwrite_x=True, workers=self.workers))
+
+        return self.buffer
+
+    def _copy(self, x):
+        """ Copy the output of scipy.fft into the buffer, if it was not computed in place """
+        if not np.may_share_memory(x, self.buffer):
+            self.buffer[...] = x
+
+
+class VerticalPlaneFile():
+    """ Chunked netCDF file for streaming the transmission loss in the vertical plane to disk.
+
+        The transmission loss is written in dB, one radial bin at a time as the PE marching 
+        proceeds, to the variable `transmission_loss` with dimensions (source_depth, 
+        vertical_axis, radial_axis, azimuthal_axis). The azimuthal axis is re-ordered 
+        in the same way as for the in-memory output of :meth:`TransmissionLoss.calc`. 
+        Values where the field vanishes are stored as NaN.
+
+        The file is chunked by radial bin, with chunks of about 1 MB.
+
+        Args:
+            path: str
+                Path to the netCDF file. An existing file is overwritten.
+            source_depth, vertical_axis, radial_axis: numpy.array
+                Coordinate axes
+            azimuthal_axis: numpy.array
+                Azimuthal coordinates, in the order of the computational grid.
+            dtype: 
+                Data type of the transmission loss. Default is float32.
+    """
+    def __init__(self, path, source_depth, vertical_axis, radial_axis, azimuthal_axis, dtype=np.float32):
+        self.path = path
+        self.lock = threading.Lock()  # the file may be written from several threads
+        self._shift = len(azimuthal_axis) // 2
+
+        self._ds = netCDF4.Dataset(path, 'w', format='NETCDF4')
+        axes = {
+            'source_depth': source_depth,
+            'vertical_axis': vertical_axis,
+            'radial_axis': radial_axis,
+            'azimuthal_axis': np.fft.fftshift(azimuthal_axis),
+        }
+        for name, ax in axes.items():
+            self._ds.createDimension(name, len(ax))
+            self._ds.createVariable(name, 'f8', (name, ))[:] = ax
+
+        nz, nq = len(vertical_axis), len(azimuthal_axis)
+        nq_chunk = int(np.clip(2**20 // (np.dtype(dtype).itemsize * nz), 1, nq))
+        self._var = self._ds.createVariable('transmission_loss', dtype, tuple(axes.keys()),
+                                            fill_value=np.nan, chunksizes=(1, nz, 1, nq_chunk))
+        self._var.units = 'dB'
+
+    def write(self, field, r, q=0):
+        """ Convert a complex field to transmission loss and write it to the file.
+
+            Args:
+                field: numpy.array
+                    Complex field; has shape (ns,nz,nr,nq), or (ns,nz,nq) for a single radial bin.
+                r: int or slice
+                    Radial bin(s)
+                q: int
+                    Index of the first azimuthal bin of the field on the computational grid. 
+                    Default is 0.
+        """
+        with np.errstate(divide='ignore'):
+            tl = -20 * np.log10(np.abs(field))
+
+        tl[np.isinf(tl)] = np.nan
+        tl = tl.astype(self._var.dtype, copy=False)
+
+        # positions of the azimuthal bins in the file, split where they wrap around
+        nq = self._var.shape[3]
+        pos = (np.arange(q, q + field.shape[-1]) + self._shift) % nq
+        splits = np.nonzero(np.diff(pos) != 1)[0] + 1
+        with self.lock:
+            for idx in np.split(np.arange(len(pos)), splits):
+                self._var[:, :, r, pos[idx[0]]:pos[idx[-1]] + 1] = tl[..., idx[0]:idx[-1] + 1]
+
+    def close(self):
+        """ Close the file """
+        self._ds.close()
+
+    def open(self):
+        """ Open the file for reading.
+
+            Returns:
+                tl: netCDF4.Variable
+                    Transmission loss in dB. Data are only read from disk when the 
+                    variable is sliced.
+        """
+        return netCDF4.Dataset(self.path, 'r')['transmission_loss']
+
+
 class TransmissionLoss():
     """ Compute the transmission loss by solving the parabolic wave
         equation.
@@ -461,6 +707,12 @@ class TransmissionLoss():
                 Bathymetry derivative interpolation function in variables x,y
             sound_speed_func: function
                 Sound speed interpolation function in variables x,y,z
+            sound_speed_profile_func: function
+                Sound speed profile function in variables x,y,z, returning the sound 
+                speed on the depth axis z at each of the horizontal locations x,y, 
+                as an array with shape (len(x),len(z)). Optional. If specified, it is 
+                used instead of sound_speed_func to update the sound speed at every 
+                range step. See :meth:`kadlu.sound.sound_speed.SoundSpeed.profile`.
             bottom: dict
                 Seafloor acoutic properties. Must contain the keys 'sound_speed',
                 'density', and 'attenuation'.
@@ -472,11 +724,65 @@ class TransmissionLoss():
                 Reference sound speed in m/s
             source_depth: array-like
                 Source depths in meters.
+            fft_workers: int
+                Number of threads used for computing the FFTs in the PE marching. Default is 1.
+            fft_backend: str
+                FFT backend, `scipy` (default) or `pyfftw`. See :class:`VerticalFFT`.
+            workers: int
+                Number of workers used for the PE marching. The azimuthal bins are split 
+                into contiguous slices, which are marched independently, each with its 
+                own environment evaluations. Default is 1.
+            pool: str
+                Type of worker pool, `thread` (default) or `process`. Threads write directly 
+                to the output arrays, but the environment evaluations only run concurrently 
+                where they release the GIL. Processes scale better with the number of cores, 
+                but require the interpolation functions to be picklable.
+            range_independent: bool
+                If True, the acoustic environment is assumed to be the same at all 
+                ranges, and the refractive propagation matrix is only computed once.
+                Default is False. Set automatically by :func:`kadlu.sound.geophony.transmission_loss` 
+                when both the bathymetry and the sound speed are independent of lat,lon.
+            env_step: int
+                Maximum number of range steps between updates of the acoustic environment 
+                and the refractive propagation matrix. Between updates, the environment 
+                is held constant. Default is 1, i.e., the environment is updated at 
+                every step. Larger values trade accuracy for speed in environments 
+                that change slowly with range.
+            env_tol: float
+                Seafloor depth tolerance in meters. If specified, the bathymetry is 
+                checked at every step, and the environment is updated before env_step is 
+                reached if the seafloor depth has changed by more than env_tol in any 
+                azimuthal bin since the last update. Default is None.
+            accuracy: float
+                If specified, the grid is sized for the frequency, the maximum depth, 
+                the aperture of the starter field, and the target accuracy, with 
+                :func:`plan_grid`. The aperture is specified with the keyword argument 
+                `aperture` (default 86 degrees), and should not be smaller than that 
+                passed to :meth:`calc`. Grid arguments, e.g. dr or dz, take precedence 
+                over the planned grid. Default is None, i.e., the default grid is used.
+            cross_range: float
+                Maximum distance in meters between adjacent azimuthal bins at the 
+                maximum range. Only used if accuracy is specified. Optional.
+
+        The precision of the computation is set with :func:`kadlu.set_precision`, at the 
+        time the TransmissionLoss object is created. In single precision, the acoustic 
+        field is propagated and stored as complex64.
+
+        To compute the transmission loss at several frequencies, see 
+        :class:`MultiFrequencyTransmissionLoss`.
 
         Attributes:
+            max_depth: float
+                Maximum seafloor depth in meters within the propagation range. 
+                May be specified with the keyword argument `max_depth`, in which
+                case the bathymetry is not searched for the maximum depth. For
+                bathymetry data on a lat-lon grid, an upper bound is obtained from
+                the data values with
+                :meth:`kadlu.geospatial.interpolation.RegularGridGeospatialInterpolator.max_value`.
 
         Example:
     """
+    pools = ['thread', 'process']
 
     def __init__(self,
                  freq,
@@ -487,6 +793,16 @@ class TransmissionLoss():
                  propagation_range=50,
                  angular_bin=10,
                  c0=1500,
+                 fft_workers=1,
+                 fft_backend='scipy',
+                 workers=1,
+                 pool='thread',
+                 range_independent=False,
+                 env_step=1,
+                 env_tol=None,
+                 sound_speed_profile_func=None,
+                 accuracy=None,
+                 cross_range=None,
                  **kwargs):
 
         self.logger = logging.getLogger("kadlu")
@@ -499,12 +815,31 @@ class TransmissionLoss():
         self.c0 = c0
         self.k0 = 2 * np.pi / c0 * freq
         self.water_density = 1.0
+        self.dtype = complex_dtype()
+
+        # FFT work buffer, created on first use and reused for subsequent computations
+        self.fft_workers = fft_workers
+        self.fft_backend = fft_backend
+        self._fft = None
+
+        # parallel PE marching, and index of the first azimuthal bin of the solver on the full grid
+        self._q_offset = 0
+        assert pool in self.pools, f'invalid pool {pool}. Valid options are: {self.pools}'
+        self.workers = max(1, workers)
+        self.pool = pool
+
+        # updates of the acoustic environment
+        assert int(env_step) >= 1, 'env_step must be a positive integer'
+        self.range_independent = range_independent
+        self.env_step = int(env_step)
+        self.env_tol = env_tol
 
         r_max = 1e3 * propagation_range
         dq = angular_bin * deg2rad
 
         #depth of physical domain
-        max_depth = self._max_depth(bathy_func, r_max)
+        max_depth = kwargs['max_depth'] if 'max_depth' in kwargs.keys() else self._max_depth(bathy_func, r_max)
+        self.max_depth = max_depth
 
         if max_depth > 0.01:
             debug_msg = f"[{self.name}] Max depth in computational domain: {max_depth:.1f}m"
@@ -528,6 +863,19 @@ class TransmissionLoss():
             'z_max': z_max
         }
 
+        # grid sized for the aperture and the target accuracy
+        self._aperture = None
+        if accuracy is not None:
+            self._aperture = kwargs['aperture'] if 'aperture' in kwargs.keys() else 86
+            grid_kwargs = plan_grid(freq=freq,
+                                    max_depth=max_depth,
+                                    r_max=r_max,
+                                    c0=c0,
+                                    aperture=self._aperture,
+                                    accuracy=accuracy,
+                                    angular_bin=angular_bin,
+                                    cross_range=cross_range)
+
         # replace defaults with input args, if any
         for key in grid_kwargs:
             if key in kwargs.keys(): grid_kwargs[key] = kwargs[key]
@@ -558,6 +906,7 @@ class TransmissionLoss():
         self._bathy = bathy_func
         self._bathy_deriv = bathy_deriv_func
         self._sound_speed = sound_speed_func
+        self._sound_speed_profile = sound_speed_profile_func
 
         self._do_vertical = False  # compute transmission loss on vertical plane
 
@@ -574,10 +923,18 @@ class TransmissionLoss():
              nz_max=250,
              nr_max=250,
              size_limit=True,
-             return_field=False):
+             return_field=False,
+             output_file=None,
+             output_dtype=np.float32,
+             dry_run=False):
         """ Calculate the transmission loss in the horizontal plane at
             the specified depth(s).
 
+            The estimated cost of the computation is logged before it starts, 
+            see :meth:`estimate`. The wall time is only estimated, by timing the 
+            first 4 range steps, if debug messages are logged. Otherwise, it is 
+            available through :meth:`estimate` or with dry_run=True.
+
             Args:
                 source_depth: array-like
                     Source depths in meters
@@ -602,6 +959,17 @@ class TransmissionLoss():
                     Instead of returning the transmission loss, TL, return
                     the complex pressure field, f, where TL = 20 * np.log10(np.abs(f)).
                     Default is False.
+                output_file: str
+                    Path to a netCDF file. If specified, the transmission loss in the vertical 
+                    plane is written to the file as the computation proceeds, instead of being 
+                    kept in memory, and is returned as a lazy handle to the file. 
+                    See :class:`VerticalPlaneFile`. Only relevant if vertical is True. 
+                    Cannot be combined with return_field.
+                output_dtype:
+                    Data type of the transmission loss in the output file. Default is float32.
+                dry_run: bool
+                    If True, the transmission loss is not computed. Instead, the estimated 
+                    cost of the computation is returned, see :meth:`estimate`. Default is False.
 
             Returns:
                 tl_h: numpy.array
@@ -613,7 +981,8 @@ class TransmissionLoss():
                 tl_v: numpy.array
                     Transmission loss in dB in the vertical plane; has shape
                     (len(source_depth), len(z), len(r), len(q)).
-                    Only returned if vertical is True.
+                    Only returned if vertical is True. If output_file is specified, 
+                    a netCDF4.Variable, which reads the data from disk when sliced.
                 ax_v: dict
                     Axes of the vertical transmission loss array, (source_depth, z, r, q).
                     z and r are the vertical and radial coordinate axes.
@@ -624,18 +993,49 @@ class TransmissionLoss():
         if source_depth is None: source_depth = self._source_depth
         assert source_depth is not None, 'source depth must be specified'
 
-        self._do_vertical = vertical
         source_depth = toarray(source_depth)
         rec_depth = toarray(rec_depth)
+
+        # estimated cost. timing the first steps evaluates the acoustic environment, 
+        # so the wall time is only estimated for dry runs or if it is logged
+        steps = 16 if dry_run else (4 if self.logger.isEnabledFor(logging.DEBUG) else 0)
+        cost = self.estimate(source_depth=source_depth,
+                             rec_depth=rec_depth,
+                             vertical=vertical,
+                             aperture=aperture,
+                             nz_max=nz_max,
+                             nr_max=nr_max,
+                             size_limit=size_limit,
+                             steps=steps)
+        if dry_run: return cost
+
+        debug_msg = f"[{self.name}] Estimated cost: {cost['flops']:.2e} FLOPs, {cost['memory'] / 1e6:.1f} MB"
+        if cost['time'] is not None: debug_msg += f", {cost['time']:.1f} s"
+        self.logger.debug(debug_msg)
+
+        if self._aperture is not None and self._aperture < aperture:
+            warn_msg = f"[{self.name}] The grid was sized for an aperture of {self._aperture} degrees, " \
+                + f"but the starter field has an aperture of {aperture} degrees"
+            self.logger.warning(warn_msg)
+
+        self._do_vertical = vertical
+        output_file = output_file if vertical else None
+        assert output_file is None or not return_field, 'the complex field cannot be written to the output file'
         self._init_output(num_sources=len(source_depth),
                           rec_depth=rec_depth,
                           nz_max=nz_max,
                           nr_max=nr_max,
-                          size_limit=size_limit)
-        psi = self._solve_pe(source_depth=source_depth,
-                             rec_depth=rec_depth,
-                             aperture=aperture,
-                             progress_bar=progress_bar)
+                          size_limit=size_limit,
+                          source_depth=source_depth,
+                          output_file=output_file,
+                          output_dtype=output_dtype)
+        try:
+            psi = self._solve_pe(source_depth=source_depth,
+                                 rec_depth=rec_depth,
+                                 aperture=aperture,
+                                 progress_bar=progress_bar)
+        finally:
+            if self._vert_file is not None: self._vert_file.close()
 
         # transmission loss, horizontal plane
         field_h = np.fft.fftshift(self._field_horiz[:, :, :, 1:],
@@ -656,20 +1056,117 @@ class TransmissionLoss():
         if not self._do_vertical:
             return res_h, ax_h
 
-        else:  # transmission loss, vertical plane
+        # transmission loss, vertical plane
+        if self._vert_file is not None:
+            # lazy handle to the transmission loss on disk
+            field_v = tl_v = self._vert_file.open()
+
+        else:
             field_v = np.fft.fftshift(self._field_vert[:, :, :, :],
                                       axes=3)  #re-order q axis
             tl_v = -20 * np.ma.log10(
                 np.abs(field_v))  # OBS: this computation is rather slow
-            ax_v = {
-                'source_depth': source_depth,
-                'vertical_axis': self._field_z_ax,
-                'radial_axis': self._field_r_ax,
-                'azimuthal_axis': q
-            }
-            self.tl_v, self.ax_v = tl_v, ax_v
-            res_v = field_v if return_field else tl_v
-            return res_h, ax_h, res_v, ax_v
+
+        ax_v = {
+            'source_depth': source_depth,
+            'vertical_axis': self._field_z_ax,
+            'radial_axis': self._field_r_ax,
+            'azimuthal_axis': q
+        }
+        self.tl_v, self.ax_v = tl_v, ax_v
+        res_v = field_v if return_field else tl_v
+        return res_h, ax_h, res_v, ax_v
+
+    def estimate(self,
+                 source_depth=None,
+                 rec_depth=[.1],
+                 vertical=False,
+                 aperture=86,
+                 nz_max=250,
+                 nr_max=250,
+                 size_limit=True,
+                 steps=16):
+        """ Estimate the cost of the transmission loss computation, without running it.
+
+            The number of floating-point operations and the memory are estimated from 
+            the grid and output sizes. The wall time is estimated by timing the first 
+            steps of the PE marching, including the updates of the acoustic environment, 
+            and extrapolating to the full range. The estimate assumes that the azimuthal 
+            workers, if any, scale perfectly.
+
+            Args:
+                source_depth, rec_depth, vertical, aperture, nz_max, nr_max, size_limit:
+                    See :meth:`calc`
+                steps: int
+                    Number of range steps timed to estimate the wall time. 
+                    If 0, the wall time is not estimated. Default is 16.
+
+            Returns:
+                cost: dict
+                    Estimated cost, with keys
+
+                        * nr, nz, nq: int
+                            Number of radial, vertical and azimuthal grid points
+                        * flops: float
+                            Number of floating-point operations
+                        * memory: float
+                            Memory in bytes used by the field, the propagation matrices, 
+                            the acoustic environment and the output arrays
+                        * time: float
+                            Wall time in seconds. None if steps is 0.
+        """
+        if source_depth is None: source_depth = self._source_depth
+        assert source_depth is not None, 'source depth must be specified'
+
+        source_depth = toarray(source_depth)
+        rec_depth = toarray(rec_depth)
+        nr, nz, nq = self.grid.nr, self.grid.nz, self.grid.nq
+        ns, nd = len(source_depth), len(rec_depth)
+        itemsize = np.dtype(self.dtype).itemsize
+
+        # number of environment updates and output bins
+        n_env = 1 if self.range_independent else int(np.ceil((nr - 1) / self.env_step))
+        r_step, z_step = self._output_steps(nz_max, nr_max, size_limit)
+        n_out = int(np.ceil(nr / r_step))
+
+        # two FFTs and three complex multiplications per step, and roughly 200 operations 
+        # per grid point for an environment update, dominated by the transcendental functions
+        fft = 5 * nz * np.log2(nz)
+        flops = (nr - 1) * ns * nq * (2 * fft + 3 * 6 * nz) + n_env * 200 * nz * nq
+        flops += n_out * ns * nq * (8 * nd * nz + (fft if vertical else 0))
+
+        # field and propagation matrices, environment updates in double precision, and output, 
+        # of which about two more copies are made when converting to transmission loss
+        memory = (ns + 2) * nz * nq * itemsize + 12 * nz * nq * 16
+        output = ns * nd * nq * n_out * itemsize
+        if vertical: output += ns * int(np.ceil(nz / 2 / z_step)) * n_out * nq * itemsize
+        memory += 3 * output
+
+        cost = {'nr': nr, 'nz': nz, 'nq': nq, 'flops': flops, 'memory': memory, 'time': None}
+        if steps == 0: return cost
+
+        # time the first steps on a copy of the solver, truncated in range
+        tl = copy.copy(self)
+        tl.grid = copy.copy(self.grid)
+        tl.grid.r = self.grid.r[:steps + 1]
+        tl.grid.nr = len(tl.grid.r)
+        tl.workers, tl._fft, tl._do_vertical = 1, None, vertical
+        tl._init_output(num_sources=ns, rec_depth=rec_depth, r_step=r_step, z_step=z_step)
+        kwargs = dict(source_depth=source_depth, rec_depth=rec_depth, aperture=aperture, progress_bar=False)
+        tl._solve_pe(**kwargs)  # warm-up
+        t0 = time.perf_counter()
+        tl._solve_pe(**kwargs)
+        t_march = time.perf_counter() - t0
+
+        # time of an environment update
+        t0 = time.perf_counter()
+        tl._update_env(tl.grid.dr / 2)
+        t_env = time.perf_counter() - t0
+
+        n_env_steps = 1 if self.range_independent else int(np.ceil((tl.grid.nr - 1) / self.env_step))
+        t_step = max(0, t_march - n_env_steps * t_env) / (tl.grid.nr - 1)
+        cost['time'] = ((nr - 1) * t_step + n_env * t_env) / min(self.workers, nq)
+        return cost
 
     def plot_horiz(self, source_depth_idx=0, rec_depth_idx=0):
         """ Plot the transmission loss on a horizontal plane in polar coordinates.
@@ -756,7 +1253,8 @@ class TransmissionLoss():
                   rec_depth,
                   aperture,
                   progress_bar,
-                  return_field=False):
+                  return_field=False,
+                  solvers=None):
         """ Solve the parabolic wave equation of Thomson and Chapman by means
             of a split-step Fourier algorithm.
 
@@ -766,6 +1264,13 @@ class TransmissionLoss():
             Optionally, the field may also be computed on a vertical plane intersecting
             the source position.
 
+            Several frequencies may be propagated together on the same grid, by passing 
+            the solvers of the other frequencies with `solvers`. The fields are then 
+            stacked in one FFT work buffer and transformed in a single batch at every 
+            step, and the bathymetry, sound speed, and index of refraction are only 
+            evaluated once, by this solver. The output is saved by each solver in its 
+            own output arrays.
+
             Args:
                 source_depth: array-like
                     Source depths in meters
@@ -779,53 +1284,196 @@ class TransmissionLoss():
                     Return the displacement field :math:`\psi (r, k_z)` after propagation to
                     :math:`r=r_{max}`. Primarily for diagnostics/debugging purposes.
                     Default is False.
+                solvers: list(TransmissionLoss)
+                    Solvers for other frequencies on the same grid, which are 
+                    propagated together with this one. Optional.
 
             Returns:
                 psi: numpy.array
                     Displacement field :math:`\psi (r, k_z)` at :math:`r=r_{max}`.
+                    If solvers is specified, the fields of all the solvers, 
+                    stacked along a leading frequency axis.
                     Only returned if return_field is True.
         """
+        if self.workers > 1 and self.grid.nq > 1 and not solvers:
+            return self._solve_pe_parallel(source_depth=source_depth,
+                                           rec_depth=rec_depth,
+                                           aperture=aperture,
+                                           progress_bar=progress_bar,
+                                           return_field=return_field)
+
+        solvers = [self] + list(solvers or [])
+        nf = len(solvers)
         dr = self.grid.dr
         dz = self.grid.dz
-        k0 = self.k0
         kz = self.grid.kz
         nq = self.grid.nq
         nr = self.grid.nr
         rec_depth = toarray(rec_depth)
-
-        UD = prop_defr(x=dr / 2, k0=k0, kz=kz,
-                       nq=nq)  #diffractive propagation matrix
-
-        psi = thomson_starter(k0=k0,
-                              kz=kz,
-                              dz=dz,
-                              zs=source_depth,
-                              theta1=aperture * deg2rad)  # starter field
-        psi = psi * np.ones((1, 1, nq))
-
-        self._save_output(step_no=0,
-                          r=0,
-                          psi=psi,
-                          sqrt_rho=0,
-                          rec_depth=rec_depth)  #save output
+        ns = len(toarray(source_depth))
+
+        UD = np.stack([prop_defr(x=dr / 2, k0=tl.k0, kz=kz, nq=nq) 
+                       for tl in solvers]).astype(self.dtype)  #diffractive propagation matrix
+
+        # the field is propagated in place in the FFT work buffer, with the frequencies 
+        # stacked along the first axis
+        shape = (nf * ns, len(kz), nq)
+        if self._fft is None or self._fft.buffer.shape != shape:
+            self._fft = VerticalFFT(shape, dtype=self.dtype, workers=self.fft_workers, backend=self.fft_backend)
+
+        fft = self._fft
+        psi = fft.buffer.reshape((nf, ns) + shape[1:])
+        for f, tl in enumerate(solvers):
+            psi[f] = thomson_starter(k0=tl.k0,
+                                     kz=kz,
+                                     dz=dz,
+                                     zs=source_depth,
+                                     theta1=aperture * deg2rad)  # starter field
+
+        UR = np.empty((nf, 1) + shape[1:], dtype=self.dtype)  # refractive propagation matrix
+        sqrt_rho = [0] * nf
+
+        # number of steps between updates of the acoustic environment
+        env_step = nr if self.range_independent else self.env_step
+        env_tol = None if self.range_independent else self.env_tol
+
+        for f, tl in enumerate(solvers):
+            tl._save_output(step_no=0,
+                            r=0,
+                            psi=psi[f],
+                            sqrt_rho=0,
+                            rec_depth=rec_depth)  #save output
 
         r = 0
         for i in tqdm(range(nr - 1), disable=not progress_bar):  # PE marching
-            psi = UD * psi  # diffractive propagation, half-step
-            n, sqrt_rho = self._update_env(
-                r + dr / 2)  # update acoustic environment
-            UR = prop_refr(x=dr, k0=k0, n=n)  # refractive propagation
-            psi = np.fft.fft(UR * np.fft.ifft(psi, axis=1),
-                             axis=1)  # refractive propagation, full step
-            psi = UD * psi  # diffractive propagation, half-step
+            psi *= UD  # diffractive propagation, half-step
+            update = (i % env_step == 0)
+            if not update and env_tol is not None:  # check if the seafloor depth has changed
+                update = np.max(np.abs(self._seafloor_depth(r + dr / 2) - zb)) > env_tol
+
+            if update:
+                n, sqrt_rho = self._update_env(
+                    r + dr / 2, solvers=solvers)  # update acoustic environment
+                if env_tol is not None: zb = self._seafloor_depth(r + dr / 2)
+                # refractive propagation matrix, exp(i dr k0 (n-1)), computed in place
+                for f, tl in enumerate(solvers):
+                    np.subtract(n[f], 1, out=UR[f, 0])
+                    UR[f] *= 1j * dr * tl.k0
+
+                np.exp(UR, out=UR)
+
+            fft.ifft()
+            psi *= UR  # refractive propagation, full step
+            fft.fft()
+            psi *= UD  # diffractive propagation, half-step
             r += dr  # increment distance
-            self._save_output(step_no=i + 1,
-                              r=r,
-                              psi=psi,
-                              sqrt_rho=sqrt_rho,
-                              rec_depth=rec_depth)  # collect output
+            for f, tl in enumerate(solvers):
+                tl._save_output(step_no=i + 1,
+                                r=r,
+                                psi=psi[f],
+                                sqrt_rho=sqrt_rho[f],
+                                rec_depth=rec_depth)  # collect output
+
+        if return_field: return psi if nf > 1 else psi[0]
+
+    def _solve_pe_parallel(self,
+                           source_depth,
+                           rec_depth,
+                           aperture,
+                           progress_bar,
+                           return_field=False):
+        """ Solve the parabolic wave equation with the azimuthal bins split 
+            across a pool of workers.
+
+            The azimuthal bins are only coupled through the shared acoustic 
+            environment, so each slice of bins is marched independently 
+            by a solver restricted to that slice. See :meth:`_solve_pe` 
+            for a description of the arguments.
+        """
+        nq = self.grid.nq
+        bounds = np.linspace(0, nq, min(self.workers, nq) + 1).astype(int)
+        slices = [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+
+        self.logger.debug(f"[{self.name}] Splitting {nq} azimuthal bins across {len(slices)} {self.pool} workers")
+
+        kwargs = dict(source_depth=source_depth, rec_depth=rec_depth, aperture=aperture)
+
+        if self.pool == 'thread':
+            # the solvers write directly to their slice of the output arrays
+            with ThreadPoolExecutor(len(slices), thread_name_prefix='kadlu-pe') as executor:
+                futures = [
+                    executor.submit(self._azimuthal_slice(q)._solve_pe,
+                                    progress_bar=progress_bar and i == 0,
+                                    return_field=True,
+                                    **kwargs) for i, q in enumerate(slices)
+                ]
+                psi = [f.result() for f in futures]
+
+        else:
+            # the output of each slice is computed in a worker process and copied back
+            with ProcessPoolExecutor(len(slices)) as executor:
+                futures = [
+                    executor.submit(_solve_pe_slice,
+                                    self._azimuthal_slice(q, output=False),
+                                    progress_bar=progress_bar and i == 0,
+                                    **kwargs) for i, q in enumerate(slices)
+                ]
+                psi = []
+                for q, f in zip(slices, futures):
+                    psi_q, field_horiz, field_vert = f.result()
+                    self._field_horiz[:, :, q] = field_horiz
+                    if self._vert_file is not None: self._vert_file.write(field_vert, r=slice(None), q=q.start)
+                    elif self._do_vertical: self._field_vert[..., q] = field_vert
+                    psi.append(psi_q)
+
+        if return_field: return np.concatenate(psi, axis=2)
+
+    def _azimuthal_slice(self, q, output=True):
+        """ Create a solver restricted to a slice of the azimuthal bins.
+
+            The solver is a shallow copy sharing the acoustic environment 
+            and the output settings, but with its own FFT work buffer.
+
+            Args:
+                q: slice
+                    Azimuthal bins
+                output: bool
+                    If True (default), the output arrays of the solver are views of 
+                    the corresponding slice of the output arrays. If False, the solver 
+                    has no output arrays, which must be allocated before solving.
+
+            Returns:
+                tl: TransmissionLoss
+                    Solver for the azimuthal bins in the slice
+        """
+        tl = copy.copy(self)
+        tl.workers = 1
+        tl._fft = None
+        tl._q_offset = self._q_offset + q.start
+
+        # computational grid and environment restricted to the slice
+        grid = copy.copy(self.grid)
+        grid.q = grid.q[q]
+        grid.nq = len(grid.q)
+        grid.q_qz, grid.z_qz = grid.q_qz[:, q], grid.z_qz[:, q]
+        grid.below_qz = np.nonzero(grid.z_qz >= 0)
+        tl.grid = grid
+        tl.costheta = self.costheta[q]
+        tl.sintheta = self.sintheta[q]
+        tl.absorp = self.absorp[:, q]
+
+        if output:
+            # the vertical-plane output file, if any, is shared by the solvers
+            tl._field_horiz = self._field_horiz[:, :, q]
+            tl._field_vert = self._field_vert[..., q] if self._field_vert is not None else None
+
+        else:
+            tl._field_horiz, tl._field_vert, tl._vert_file = None, None, None
+            # results of previous computations are not needed by the solver
+            for attr in ['tl_h', 'ax_h', 'tl_v', 'ax_v']:
+                tl.__dict__.pop(attr, None)
 
-        if return_field: return psi
+        return tl
 
     def _max_depth(self, bathy, r_max, return_xy=False):
         """ Find the maximum depth in the computational domain.
@@ -873,9 +1521,9 @@ class TransmissionLoss():
         dzdy = self._bathy_deriv(x=x, y=y, axis='y')
         return (self.costheta * dzdx)**2 + (self.sintheta * dzdy)**2
 
-    def _update_bathy(self, r):
-        """ Update the bathymetry to reflect conditions at a
-            specified distance from the source.
+    def _seafloor_depth(self, r):
+        """ Compute the seafloor depth at a specified distance
+            from the source in the radial direction.
 
             Args:
                 r: float
@@ -883,9 +1531,7 @@ class TransmissionLoss():
 
             Returns:
                 zb: numpy.array
-                    Seafloor depth in meters
-                dzb2: numpy.array
-                    Seafloor gradient squared
+                    Seafloor depth in meters in all angular bins
         """
         x = self.costheta * r
         y = self.sintheta * r
@@ -894,6 +1540,23 @@ class TransmissionLoss():
         # temp fix to ensure that bathy returns array even when x and y have length 1
         if np.ndim(zb) == 0: zb = np.array([zb])
 
+        return zb
+
+    def _update_bathy(self, r):
+        """ Update the bathymetry to reflect conditions at a
+            specified distance from the source.
+
+            Args:
+                r: float
+                    Radial coordinate in meters
+
+            Returns:
+                zb: numpy.array
+                    Seafloor depth in meters
+                dzb2: numpy.array
+                    Seafloor gradient squared
+        """
+        zb = self._seafloor_depth(r)  #bathymetry
         dzb2 = self._bathy_grad_sq(r=r)  #gradient squared
         nz = self.grid.nz
         zb = np.ones((nz, 1)) * zb[np.newaxis, :]
@@ -915,6 +1578,12 @@ class TransmissionLoss():
         x = self.costheta * r
         y = self.sintheta * r
         z = self.grid.z[self.grid.below]
+
+        # sound speed profiles, shape (nq,nz) -> (nz,nq)
+        if self._sound_speed_profile is not None:
+            c = self._sound_speed_profile(x=x, y=y, z=z)
+            return np.ravel(np.transpose(c))
+
         x, _ = np.meshgrid(x, z)
         y, z = np.meshgrid(y, z)
         x = x.flatten()
@@ -923,15 +1592,38 @@ class TransmissionLoss():
         c = self._sound_speed(x=x, y=y, z=z)
         return c
 
-    def _eff_index_refr(self, c, zb, dzb2):
-        """ Compute the effective index of refraction,
-            including the artificial bottom absorption term.
+    def _index_refr_sq(self, c, zb):
+        """ Compute the index of refraction squared in the water column 
+            and the bottom layer.
+
+            The index of refraction does not depend on the frequency, and 
+            is shared by the solvers of different frequencies on the same grid.
 
             Args:
                 c: numpy.array
                     Sound speed in m/s
                 zb: numpy.array
                     Seafloor depth in meters
+
+            Returns:
+                n2: numpy.array
+                    Index of refraction squared
+        """
+        n2 = np.zeros((self.grid.nz, self.grid.nq))
+        n2[self.grid.below_qz] = index_refr_sq(self.c0, c)
+        n2 = self.grid.mirror(n2)
+        return smooth_index_refr(self.grid.z_qz, zb, n2, self.n2b, np.finfo(float).eps)
+
+    def _eff_index_refr(self, n2, zb, dzb2):
+        """ Compute the effective index of refraction,
+            including the artificial bottom absorption term.
+
+            Args:
+                n2: numpy.array
+                    Index of refraction squared in the water column and 
+                    the bottom layer. See :meth:`_index_refr_sq`.
+                zb: numpy.array
+                    Seafloor depth in meters
                 dzb2: numpy.array
                     Seafloor gradient squared
 
@@ -941,11 +1633,6 @@ class TransmissionLoss():
                 : numpy.array
                     Square root of density
         """
-        # refractive index squared
-        n2 = np.zeros((self.grid.nz, self.grid.nq))
-        n2[self.grid.below_qz] = index_refr_sq(self.c0, c)
-        n2 = self.grid.mirror(n2)
-
         # effective refr. index squared
         n2, rho = eff_index_refr_sq(z=self.grid.z_qz,
                                     zb=zb,
@@ -956,31 +1643,44 @@ class TransmissionLoss():
                                     n2b=self.n2b,
                                     r=self.water_density,
                                     rb=self.bottom['density'],
-                                    return_density=True)
+                                    return_density=True,
+                                    smooth=False)
 
         # add absorption
         n2 += self.absorp
 
-        return scimath.sqrt(n2), scimath.sqrt(rho)
+        # the index of refraction is complex, and the density is positive, 
+        # so the square roots do not need scimath
+        return np.sqrt(n2), np.sqrt(rho)
 
-    def _update_env(self, r):
+    def _update_env(self, r, solvers=None):
         """ Update the acoustic environment to reflect
             the conditions at a specified distance from the source.
 
             Args:
                 r: float
                     Radial coordinate in meters
+                solvers: list(TransmissionLoss)
+                    Solvers on the same grid for which the effective refractive 
+                    index is computed, e.g., for different frequencies. The bathymetry, 
+                    sound speed, and index of refraction are only evaluated once, 
+                    by this solver. Optional.
 
             Returns:
                 n: numpy.array
-                    Refractive index
+                    Refractive index. If solvers is specified, a list with 
+                    the refractive index for each solver.
                 sqrt_rho: numpy.array
-                    Square root of density
+                    Square root of density. If solvers is specified, a list with 
+                    the square root of density for each solver.
         """
         zb, dzb2 = self._update_bathy(r)
         c = self._update_sound_speed(r)
-        n, sqrt_rho = self._eff_index_refr(c, zb, dzb2)
-        return n, sqrt_rho
+        n2 = self._index_refr_sq(c, zb)
+        if solvers is None: return self._eff_index_refr(n2, zb, dzb2)
+
+        n, sqrt_rho = zip(*[tl._eff_index_refr(n2, zb, dzb2) for tl in solvers])
+        return list(n), list(sqrt_rho)
 
     def _save_output(self, step_no, r, psi, sqrt_rho, rec_depth):
         """ Post-processe and save output data at specified distance from the source.
@@ -1001,30 +1701,59 @@ class TransmissionLoss():
 
         bin_no = int(step_no / self._r_step)
 
-        if step_no > 0:
-            dz = self.grid.dz
-            idx = np.squeeze(np.round(rec_depth / dz).astype(int))
-            if np.ndim(idx) == 0: idx = np.array([idx])
-            F = np.matmul(self._ifft_kernel, psi)
-            G = sqrt_rho[idx][np.newaxis, :, :]
-            # inverse fourier transform and multiply by sqrt(density)
-            self._field_horiz[:, :, :, bin_no] = F * G * np.exp(
-                1j * self.k0 * r) / np.sqrt(r)
+        if r > 0: scale = np.exp(1j * self.k0 * r) / np.sqrt(r)
 
         if self._do_vertical:
-            # inverse fourier transform and multiply by sqrt(density)
-            psi_z = np.fft.ifft(psi, axis=1)
-            if r > 0: psi_z *= np.exp(1j * self.k0 * r) / np.sqrt(r) * sqrt_rho
-            # only save values below sea surface
-            n = int(self.grid.nz / 2)
-            self._field_vert[:, :, bin_no, :] = psi_z[:, :n:self._z_step, :]
+            # inverse fourier transform, computed once for both the vertical and horizontal output
+            psi_z = scipy.fft.ifft(psi, axis=1, workers=self.fft_workers)
+            # only save values below sea surface, and multiply by sqrt(density)
+            rows = slice(0, int(self.grid.nz / 2), self._z_step)
+            if r > 0: field_v = psi_z[:, rows, :] * (scale * sqrt_rho[rows])
+            else: field_v = psi_z[:, rows, :]
+
+            if self._vert_file is not None: self._vert_file.write(field_v, r=bin_no, q=self._q_offset)
+            else: self._field_vert[:, :, bin_no, :] = field_v
+
+        if step_no > 0:
+            # field at the receiver depths. If the field is available in the spatial domain, 
+            # it is read directly at the receiver depths on the grid, or else computed with 
+            # the spatial-domain kernel. Otherwise, the inverse fourier transform is evaluated 
+            # at the receiver depths only.
+            if not self._do_vertical: F = np.matmul(self._ifft_kernel, psi)
+            elif self._rec_kernel is None: F = psi_z[:, self._rec_idx, :]
+            else: F = np.matmul(self._rec_kernel, psi_z)
+            # multiply by sqrt(density)
+            G = sqrt_rho[self._rec_idx][np.newaxis, :, :]
+            self._field_horiz[:, :, :, bin_no] = F * (G * scale)
+
+    def _output_steps(self, nz_max, nr_max, size_limit):
+        """ Compute the number of grid points per output bin.
+
+            Args:
+                nz_max, nr_max, size_limit:
+                    See :meth:`calc`
+
+            Returns:
+                r_step, z_step: int
+                    Number of radial and vertical grid points per output bin
+        """
+        if not size_limit: return 1, 1
+
+        r_step = int(self.grid.nr / nr_max) + 1
+        z_step = int(self.grid.nz / 2 / nz_max) + 1
+        return r_step, z_step
 
     def _init_output(self,
                      num_sources,
                      rec_depth,
                      nz_max=250,
                      nr_max=250,
-                     size_limit=False):
+                     size_limit=False,
+                     source_depth=None,
+                     output_file=None,
+                     output_dtype=np.float32,
+                     r_step=None,
+                     z_step=None):
         """ Initialize output containers and compute inverse fourier transform kernel.
 
             Args:
@@ -1040,6 +1769,17 @@ class TransmissionLoss():
                     Limit of the size of the output arrays to the dimensions
                     specified in nz_max and nr_max. If False, nz_max and nr_max
                     have no effect
+                source_depth: array-like
+                    Source depths in meters. Only required if output_file is specified.
+                output_file: str
+                    Path to a netCDF file for the vertical-plane output. If specified, 
+                    the vertical-plane output is written to the file instead of being 
+                    kept in memory. See :class:`VerticalPlaneFile`.
+                output_dtype:
+                    Data type of the transmission loss in the output file
+                r_step, z_step: int
+                    Number of radial and vertical grid points per output bin. 
+                    If specified, size_limit, nz_max, and nr_max are ignored.
         """
         nr = self.grid.nr
         nq = self.grid.nq
@@ -1047,23 +1787,282 @@ class TransmissionLoss():
         ns = num_sources
         nd = len(rec_depth)
         kz = self.grid.kz
+        # receiver depths on the vertical grid
+        dz = self.grid.dz
+        self._rec_idx = np.round(rec_depth / dz).astype(int)
+        on_grid = np.all(np.abs(rec_depth / dz - self._rec_idx) < 1e-6)
         rec_depth = rec_depth[:, np.newaxis]
         # ifft kernel
         self._ifft_kernel = np.exp(
             1j * np.matmul(rec_depth, kz[np.newaxis, :])) / len(kz)
-        self._ifft_kernel = self._ifft_kernel[np.newaxis, :, :]
+        self._ifft_kernel = self._ifft_kernel[np.newaxis, :, :].astype(self.dtype)
+        # the same kernel applied to the field in the spatial domain; not needed if the receivers are on the grid
+        self._rec_kernel = None if on_grid else scipy.fft.fft(self._ifft_kernel, axis=-1)
         # output arrays
-        if size_limit:
-            self._r_step = int(nr / nr_max) + 1
-            self._z_step = int(nz / 2 / nz_max) + 1
+        if r_step is not None and z_step is not None:
+            self._r_step = r_step
+            self._z_step = z_step
         else:
-            self._r_step = 1
-            self._z_step = 1
+            self._r_step, self._z_step = self._output_steps(nz_max, nr_max, size_limit)
 
         self._field_r_ax = self.grid.r[::self._r_step]  #output r axis
         self._field_z_ax = self.grid.z[:int(nz /
                                             2):self._z_step]  #output z axis
         nr = len(self._field_r_ax)
         nz = len(self._field_z_ax)
-        self._field_horiz = np.empty(shape=(ns, nd, nq, nr), dtype=complex)
-        self._field_vert = np.empty(shape=(ns, nz, nr, nq), dtype=complex)
+        self._field_horiz = np.empty(shape=(ns, nd, nq, nr), dtype=self.dtype)
+
+        # the vertical-plane output is only allocated if requested, as it is by far the largest array,
+        # and is written to disk instead if an output file is specified
+        self._field_vert, self._vert_file = None, None
+        if self._do_vertical and output_file is not None:
+            q = self.grid.q
+            if len(q) > 1: q = np.squeeze(q)
+            self._vert_file = VerticalPlaneFile(output_file,
+                                                source_depth=toarray(source_depth),
+                                                vertical_axis=self._field_z_ax,
+                                                radial_axis=self._field_r_ax,
+                                                azimuthal_axis=q,
+                                                dtype=output_dtype)
+
+        elif self._do_vertical:
+            self._field_vert = np.empty(shape=(ns, nz, nr, nq), dtype=self.dtype)
+
+
+class MultiFrequencyTransmissionLoss():
+    """ Compute the transmission loss at several frequencies by solving the 
+        parabolic wave equation.
+
+        The frequencies are propagated on nested grids. The lowest frequency, f0, 
+        is propagated on the default grid of :class:`TransmissionLoss`, while a 
+        frequency f is propagated on a grid with the radial and vertical spacings 
+        divided by m = ceil(f/f0). All the grids thus span the same range and depth, 
+        and share the output axes, so the transmission loss is returned with a leading 
+        frequency axis.
+
+        Frequencies with the same m, e.g., the third-octave bands within an octave, 
+        are propagated together on the same grid: the FFTs are computed in a single batch, 
+        and the bathymetry, sound speed, and index of refraction are only evaluated once 
+        at every step. The maximum depth in the computational domain is only searched for 
+        once, for all the frequencies.
+
+        Since the frequencies are propagated on finer grids than their default grids, 
+        and the vertical range of the grids is set by the lowest frequency, the 
+        transmission loss differs slightly from that computed with :class:`TransmissionLoss` 
+        for each frequency separately. If the grid spacings `dr` and `dz` are specified, 
+        all the frequencies are propagated together on the same grid.
+
+        Args:
+            freq: array-like
+                Frequencies in Hz
+            bathy_func: function
+                Bathymetry interpolation function in variables x,y
+            bathy_deriv_func: function
+                Bathymetry derivative interpolation function in variables x,y
+            sound_speed_func: function
+                Sound speed interpolation function in variables x,y,z
+            bottom: dict
+                Seafloor acoutic properties. Must contain the keys 'sound_speed',
+                'density', and 'attenuation'.
+            propagation_range: float
+                Propagation range in km. Default is 50 km.
+            angular_bin: float
+                Angular bin size in degrees. Default is 10 degrees.
+            c0: float
+                Reference sound speed in m/s
+
+        Other keyword arguments, e.g. sound_speed_profile_func, fft_workers, or env_step, 
+        are passed on to the :class:`TransmissionLoss` solver of each frequency. Azimuthal 
+        workers are only used for frequencies that are propagated alone on their grid.
+
+        Attributes:
+            freq: numpy.array
+                Frequencies in Hz, in ascending order
+            solvers: list(TransmissionLoss)
+                Solver of each frequency
+    """
+
+    def __init__(self,
+                 freq,
+                 bathy_func,
+                 bathy_deriv_func,
+                 sound_speed_func,
+                 bottom,
+                 propagation_range=50,
+                 angular_bin=10,
+                 c0=1500,
+                 **kwargs):
+
+        self.logger = logging.getLogger("kadlu")
+
+        self.name = self.__class__.__name__
+
+        self.freq = np.unique(toarray(freq))
+
+        solver_kwargs = dict(bathy_func=bathy_func,
+                             bathy_deriv_func=bathy_deriv_func,
+                             sound_speed_func=sound_speed_func,
+                             bottom=bottom,
+                             propagation_range=propagation_range,
+                             angular_bin=angular_bin,
+                             c0=c0)
+
+        # lowest frequency, on the default grid
+        base = TransmissionLoss(freq=self.freq[0], **solver_kwargs, **kwargs)
+        grid = base.grid
+        self.solvers = [base]
+        self._grid_ratio = [(1, 1)]
+
+        # higher frequencies, on nested grids with the same range and depth
+        for f in self.freq[1:]:
+            m = int(np.ceil(f / self.freq[0] - 1e-6))
+            m_r = 1 if 'dr' in kwargs.keys() else m
+            m_z = 1 if 'dz' in kwargs.keys() else m
+            grid_kwargs = dict(kwargs,
+                               dr=grid.dr / m_r,
+                               dz=grid.dz / m_z,
+                               r_max=grid.r[-1],
+                               z_max=np.max(grid.z),
+                               max_depth=base.max_depth)
+            self.solvers.append(TransmissionLoss(freq=f, **solver_kwargs, **grid_kwargs))
+            self._grid_ratio.append((m_r, m_z))
+
+        # frequencies propagated together on the same grid
+        self._groups = dict()
+        for i, m in enumerate(self._grid_ratio):
+            self._groups.setdefault(m, []).append(i)
+
+        for i in self._groups.values():
+            tl = self.solvers[i[0]]
+            debug_msg = f"[{self.name}] {self.freq[i]} Hz on grid with dr={tl.grid.dr:.2f}m, dz={tl.grid.dz:.2f}m"
+            self.logger.debug(debug_msg)
+
+    def calc(self,
+             source_depth=None,
+             rec_depth=[.1],
+             vertical=False,
+             aperture=86,
+             progress_bar=True,
+             nz_max=250,
+             nr_max=250,
+             size_limit=True,
+             return_field=False):
+        """ Calculate the transmission loss at all the frequencies in the 
+            horizontal plane at the specified depth(s).
+
+            The output arrays are sized for the grid of the lowest frequency.
+
+            Args:
+                source_depth, rec_depth, vertical, aperture, progress_bar, 
+                nz_max, nr_max, size_limit, return_field:
+                    See :meth:`TransmissionLoss.calc`
+
+            Returns:
+                tl_h: numpy.array
+                    Transmission loss in dB in the horizontal plane; has shape
+                    (len(freq), len(source_depth), len(rec_depth), len(q), len(r)).
+                ax_h: dict
+                    Axes of the horizontal transmission loss array, 
+                    (frequency, source_depth, rec_depth, q, r).
+                tl_v: numpy.array
+                    Transmission loss in dB in the vertical plane; has shape
+                    (len(freq), len(source_depth), len(z), len(r), len(q)).
+                    Only returned if vertical is True.
+                ax_v: dict
+                    Axes of the vertical transmission loss array, 
+                    (frequency, source_depth, z, r, q).
+                    Only returned if vertical is True.
+        """
+        base = self.solvers[0]
+
+        # source depth
+        if source_depth is None: source_depth = base._source_depth
+        assert source_depth is not None, 'source depth must be specified'
+
+        source_depth = toarray(source_depth)
+        rec_depth = toarray(rec_depth)
+
+        # the output bins of the lowest frequency are subdivided on the finer grids
+        for tl, (m_r, m_z) in zip(self.solvers, self._grid_ratio):
+            tl._do_vertical = vertical
+            steps = dict() if tl is base else dict(r_step=m_r * base._r_step, z_step=m_z * base._z_step)
+            tl._init_output(num_sources=len(source_depth),
+                            rec_depth=rec_depth,
+                            nz_max=nz_max,
+                            nr_max=nr_max,
+                            size_limit=size_limit,
+                            **steps)
+
+        for i in self._groups.values():
+            tl, *others = [self.solvers[j] for j in i]
+            tl._solve_pe(source_depth=source_depth,
+                         rec_depth=rec_depth,
+                         aperture=aperture,
+                         progress_bar=progress_bar,
+                         solvers=others)
+
+        # transmission loss, horizontal plane
+        field_h = np.stack([tl._field_horiz[:, :, :, 1:] for tl in self.solvers])
+        field_h = np.fft.fftshift(field_h, axes=3)  #re-order q axis
+        tl_h = -20 * np.log10(np.abs(field_h))
+        q = base.grid.q
+        if len(q) > 1: q = np.squeeze(q)
+        q = np.fft.fftshift(q)
+        ax_h = {
+            'frequency': self.freq,
+            'source_depth': source_depth,
+            'receiver_depth': rec_depth,
+            'azimuthal_axis': q,
+            'radial_axis': base._field_r_ax[1:]
+        }
+        res_h = field_h if return_field else tl_h
+        self.tl_h, self.ax_h = tl_h, ax_h
+
+        if not vertical:
+            return res_h, ax_h
+
+        # transmission loss, vertical plane
+        field_v = np.stack([tl._field_vert for tl in self.solvers])
+        field_v = np.fft.fftshift(field_v, axes=4)  #re-order q axis
+        tl_v = -20 * np.ma.log10(np.abs(field_v))
+        ax_v = {
+            'frequency': self.freq,
+            'source_depth': source_depth,
+            'vertical_axis': base._field_z_ax,
+            'radial_axis': base._field_r_ax,
+            'azimuthal_axis': q
+        }
+        self.tl_v, self.ax_v = tl_v, ax_v
+        res_v = field_v if return_field else tl_v
+        return res_h, ax_h, res_v, ax_v
+
+
+def _solve_pe_slice(tl, source_depth, rec_depth, aperture, progress_bar):
+    """ Solve the parabolic wave equation for a slice of the azimuthal bins in a worker process.
+
+        Args:
+            tl: TransmissionLoss
+                Solver restricted to the slice, without output arrays. 
+                See :meth:`TransmissionLoss._azimuthal_slice`.
+            source_depth, rec_depth, aperture, progress_bar:
+                See :meth:`TransmissionLoss._solve_pe`
+
+        Returns:
+            psi: numpy.array
+                Displacement field at the maximum range
+            field_horiz, field_vert: numpy.array
+                Output arrays of the slice. field_vert is None if the 
+                vertical plane is not computed.
+    """
+    ns, nd, nq, nr = len(source_depth), len(rec_depth), tl.grid.nq, len(tl._field_r_ax)
+    tl._field_horiz = np.empty(shape=(ns, nd, nq, nr), dtype=tl.dtype)
+    if tl._do_vertical:
+        tl._field_vert = np.empty(shape=(ns, len(tl._field_z_ax), nr, nq), dtype=tl.dtype)
+
+    psi = tl._solve_pe(source_depth=source_depth,
+                       rec_depth=rec_depth,
+                       aperture=aperture,
+                       progress_bar=progress_bar,
+                       return_field=True)
+
+    return psi, tl._field_horiz, tl._field_vert
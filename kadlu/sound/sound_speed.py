@@ -4,7 +4,8 @@ import gsw
 import numpy as np
 import logging
 from datetime import datetime
-from kadlu.utils import interp_grid_1d
+from scipy.interpolate import RegularGridInterpolator
+from kadlu.utils import interp_grid_1d, XYtoLL, as_array
 from kadlu.geospatial.interpolation import get_interpolator
 
 
@@ -52,6 +53,11 @@ class SoundSpeed():
         The interp and interp_xyz method may be used to obtain the interpolated
         sound speed at any set of coordinates.
 
+        The profile method may be used to obtain the sound speed on a fixed 
+        depth axis at a set of horizontal locations. This is considerably 
+        faster than evaluating the 3D interpolation when the same depth axis 
+        is used repeatedly, e.g., at every range step of the PE solver.
+
         TODO: provide proper implementation of time/epoch handling.
         TODO: SoundSpeed should inherit from BaseGeospatialInterpolator
 
@@ -77,6 +83,10 @@ class SoundSpeed():
         self.logger = logging.getLogger("kadlu")
         self.name = self.__class__.__name__
 
+        # depth-weight matrices and horizontal interpolator used by the profile method
+        self._depth_weights = dict()
+        self._column_interp = None
+
         if ssp is not None:
             self.logger.debug(f"[{self.name}] Initializing {self.name} instance with SSP = {ssp}")
 
@@ -129,8 +139,8 @@ class SoundSpeed():
             self.logger.debug(debug_msg)
 
             # interpolate temperature and salinity on lat,lon,epoch,depth grid
-            t = ocean.temperature(lat=lats, lon=lons, depth=depths, epoch=epoch, grid=True)
-            s = ocean.salinity(lat=lats, lon=lons, depth=depths, epoch=epoch, grid=True)
+            v = ocean.evaluate(['temperature', 'salinity'], lat=lats, lon=lons, depth=depths, epoch=epoch, grid=True)
+            t, s = v['temperature'], v['salinity']
 
             # drop time axis with size 1
             t = t[:,:,0,:]
@@ -229,8 +239,8 @@ class SoundSpeed():
 
         # compute temperature, salinity and sound speed for every 1 meter
         z = np.arange(0, int(np.ceil(max_depth)) + 1)
-        t = ocean.temperature(lat=lat, lon=lon, depth=z, epoch=epoch, grid=True)
-        s = ocean.salinity(lat=lat, lon=lon, depth=z, epoch=epoch, grid=True)
+        v = ocean.evaluate(['temperature', 'salinity'], lat=lat, lon=lon, depth=z, epoch=epoch, grid=True)
+        t, s = v['temperature'], v['salinity']
         c = sound_speed_teos10(lats=lat, lons=lon, z=z, t=t, SP=s)
 
         # determine grid
@@ -245,6 +255,99 @@ class SoundSpeed():
 
         return depths
 
+    @property
+    def dims(self):
+        """ Names of the dimensions along which the sound speed varies """
+        return self._interp.dims
+
+    def profile(self, depth, lat=None, lon=None, x=None, y=None):
+        """ Evaluate the sound speed on a fixed depth axis at a set of horizontal locations.
+
+            The sound speed profiles at the depth nodes of the interpolation grid are 
+            interpolated horizontally once per location. The profiles are then mapped 
+            to the requested depths with a matrix of linear interpolation weights, which 
+            is computed once per depth axis and cached. For linear interpolation, 
+            the result is the same as evaluating the 3D interpolation on the 
+            (location, depth) grid.
+
+            Locations can be specified either as (lat,lon) or as (x,y), see 
+            :meth:`kadlu.geospatial.interpolation.BaseGeospatialInterpolator.__call__`.
+
+            Args:
+                depth: array-like
+                    Depths in meters below the sea surface
+                lat, lon: array-like
+                    Latitudes and longitudes in degrees
+                x, y: array-like
+                    x and y coordinates in meters
+
+            Returns:
+                c: numpy array
+                    Sound speed in m/s; has shape (num_locations, len(depth))
+        """
+        interp = self._interp
+        depth = np.atleast_1d(np.asarray(depth, dtype=float))
+
+        # map x,y to lat,lon
+        if x is not None or y is not None:
+            lat, lon = XYtoLL(x=0 if x is None else x, y=0 if y is None else y,
+                              lat_ref=interp.origin[0], lon_ref=interp.origin[1])
+
+        num = max(np.size(lat), np.size(lon))
+        hdims = [dim for dim in interp.dims if dim in ('lat', 'lon')]
+        hcoors = {'lat': lat, 'lon': lon}
+        hpts = np.array([np.broadcast_to(hcoors[dim], num) for dim in hdims]).T
+
+        # uniform or horizontally varying sound speed without depth dependence
+        if 'depth' not in interp.dims:
+            if len(hdims) == 0: c = np.full(num, interp.value.item())
+            else: c = interp(**{dim: hpts[:, i] for i, dim in enumerate(hdims)})
+            return as_array(np.repeat(np.reshape(c, (num, 1)), len(depth), axis=1), dtype=interp.value.dtype)
+
+        # sound speed profiles at the depth nodes of the interpolation grid, shape (num, num_nodes)
+        rgi = interp._interp
+        if len(hdims) == 0:
+            columns = rgi.values[np.newaxis, :]
+        else:
+            if self._column_interp is None:
+                self._column_interp = RegularGridInterpolator(points=rgi.grid[:-1], values=rgi.values,
+                                                              method='linear', bounds_error=False, fill_value=None)
+            columns = self._column_interp(hpts)
+
+        # linear interpolation in depth
+        key = depth.tobytes()
+        if key not in self._depth_weights:
+            self._depth_weights[key] = _depth_weight_matrix(rgi.grid[-1], depth)
+
+        c = np.matmul(columns, self._depth_weights[key].T)
+        if len(hdims) == 0: c = np.repeat(c, num, axis=0)
+
+        return as_array(c, dtype=interp.value.dtype)
 
     def __call__(self, **kwargs):
         return self._interp(**kwargs)
+
+
+def _depth_weight_matrix(nodes, depth):
+    """ Compute the weights for linear interpolation between depth nodes.
+
+        Depths outside the range of the nodes are extrapolated linearly, 
+        consistent with the sound speed interpolator.
+
+        Args:
+            nodes: numpy array
+                Depth nodes, in ascending order
+            depth: numpy array
+                Depths where the interpolation is to be evaluated
+
+        Returns:
+            w: numpy array
+                Weight matrix with shape (len(depth), len(nodes))
+    """
+    idx = np.clip(np.searchsorted(nodes, depth) - 1, 0, len(nodes) - 2)
+    t = (depth - nodes[idx]) / (nodes[idx + 1] - nodes[idx])
+    w = np.zeros((len(depth), len(nodes)))
+    rows = np.arange(len(depth))
+    w[rows, idx] = 1 - t
+    w[rows, idx + 1] += t
+    return w
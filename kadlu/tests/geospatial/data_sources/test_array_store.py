@@ -0,0 +1,70 @@
+import os
+import pytest
+import numpy as np
+import kadlu
+from kadlu.geospatial.data_sources import array_store
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """ Use a temporary folder for the array store """
+    monkeypatch.setattr(array_store, "storage_cfg", lambda: str(tmp_path))
+    return tmp_path
+
+
+def test_storage_backend():
+    """ Check that sqlite is the default storage backend and that invalid backends are rejected """
+    assert kadlu.storage_cfg().backend() in ('sqlite', 'npz', 'compact')
+    with pytest.raises(AssertionError):
+        kadlu.storage_cfg().backend('hdf5')
+
+
+def test_grid_points():
+    """ Check that scattered data points are placed on a dense grid """
+    val = np.array([1., 2., 3.])
+    lat = np.array([45., 44., 45.])
+    lon = np.array([-60., -60., -59.])
+    values, axes = array_store.grid_points(val, lat=lat, lon=lon)
+
+    assert np.all(axes["lat"] == [44, 45])
+    assert np.all(axes["lon"] == [-60, -59])
+    assert np.allclose(values, [[2, np.nan], [1, 3]], equal_nan=True)
+
+
+def test_save_and_load_tiles(storage):
+    """ Check that adjacent tiles are sliced by index and merged into a single dense array """
+    lat1, lat2 = np.arange(44, 45.01, 0.25), np.arange(45, 46.01, 0.25)
+    lon = np.arange(-60, -58.99, 0.5)
+    epoch = np.array([1., 2.])
+    v1 = np.random.random((2, len(lat1), len(lon)))
+    v2 = np.random.random((2, len(lat2), len(lon)))
+    v2[:, 0] = v1[:, -1]  # adjacent tiles share the boundary at 45 degrees
+    v2[0, -1, -1] = np.nan
+
+    # second tile is stored with descending latitudes
+    array_store.save_tile("test", v1, epoch=epoch, lat=lat1, lon=lon)
+    n = array_store.save_tile("test", v2[:, ::-1], epoch=epoch, lat=lat2[::-1], lon=lon)
+    assert n == v2.size - 1
+    assert len(os.listdir(os.path.join(storage, "arrays", "test"))) == 2
+
+    values, axes = array_store.load_tiles("test", ("epoch", "lat", "lon"), lat=(44.5, 45.5), epoch=(2, 2))
+    assert np.all(axes["lat"] == [44.5, 44.75, 45, 45.25, 45.5])
+    assert np.all(axes["lon"] == lon)
+    assert np.all(axes["epoch"] == [2])
+    assert np.allclose(values[0, :3], v1[1, 2:])
+    assert np.allclose(values[0, 2:], v2[1, :3])
+
+    # query outside the stored tiles
+    values, axes = array_store.load_tiles("test", ("epoch", "lat", "lon"), lat=(50, 51))
+    assert values.size == 0 and len(axes["lat"]) == 0
+
+
+def test_to_columns(storage):
+    """ Check that dense arrays are flattened to columns, with NaN values removed """
+    values = np.array([[1., np.nan], [3., 4.]])
+    axes = dict(lat=np.array([44., 45.]), lon=np.array([-60., -59.]))
+    val, lat, lon = array_store.to_columns(values, axes, ("lat", "lon"))
+
+    assert np.all(val == [1, 3, 4])
+    assert np.all(lat == [44, 45, 45])
+    assert np.all(lon == [-60, -60, -59])
@@ -1,5 +1,41 @@
+import threading
+import pytest
 import kadlu
 
 
 def test_storage_cfg():
     print(kadlu.storage_cfg())
+
+
+def test_database_connection_is_reused():
+    conn1, _ = kadlu.database_cfg()
+    conn2, _ = kadlu.database_cfg()
+    assert conn1 is conn2
+    assert conn1.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+    # connections are not shared between threads
+    conns = []
+    thread = threading.Thread(target=lambda: conns.append(kadlu.database_cfg()[0]))
+    thread.start()
+    thread.join()
+    assert conns[0] is not conn1
+
+
+def test_database_transaction():
+    conn, db = kadlu.database_cfg()
+    db.execute('CREATE TABLE IF NOT EXISTS test_transaction (val INT)')
+    db.execute('DELETE FROM test_transaction')
+    conn.commit()
+
+    with kadlu.database_transaction() as db:
+        db.executemany('INSERT INTO test_transaction VALUES (?)', [(i, ) for i in range(10)])
+
+    # changes are rolled back if an exception is raised
+    with pytest.raises(ValueError):
+        with kadlu.database_transaction() as db:
+            db.execute('INSERT INTO test_transaction VALUES (10)')
+            raise ValueError
+
+    assert db.execute('SELECT COUNT(*) FROM test_transaction').fetchone()[0] == 10
+    db.execute('DROP TABLE test_transaction')
+    conn.close()
@@ -0,0 +1,70 @@
+import pytest
+import numpy as np
+from kadlu.geospatial.data_sources import compact_store
+from kadlu.geospatial.data_sources.data_util import database_transaction, storage_backends
+
+
+@pytest.fixture
+def table():
+    """ Name of a compact test table, dropped after the test """
+    name = "test_compact"
+    yield name
+    with database_transaction() as db:
+        db.execute(f"DROP TABLE IF EXISTS {name}_compact")
+        db.execute("DELETE FROM compact_tables WHERE name = ?", (name, ))
+        db.execute("DELETE FROM compact_axes WHERE name = ?", (name, ))
+
+
+def test_storage_backend_compact():
+    """ Check that compact is accepted as a storage backend """
+    assert "compact" in storage_backends
+
+
+def test_save_and_load_quantized(table):
+    """ Check that values quantized with a scale and offset are merged across adjacent
+        tiles and rehydrated to within half the scale factor
+    """
+    lat1, lat2 = np.arange(44, 45.01, 0.25), np.arange(45, 46.01, 0.25)
+    lon = np.arange(-60, -58.99, 0.5)
+    epoch = np.array([1., 2.])
+    v1 = np.random.uniform(0, 35, (2, len(lat1), len(lon)))
+    v2 = np.random.uniform(0, 35, (2, len(lat2), len(lon)))
+    v2[:, 0] = v1[:, -1]  # adjacent tiles share the boundary at 45 degrees
+    v2[0, -1, -1] = np.nan
+
+    n1 = compact_store.save_tile(table, v1, source="test", scale=0.001, offset=20, epoch=epoch, lat=lat1, lon=lon)
+    n2 = compact_store.save_tile(table, v2, source="test", scale=0.001, offset=20, epoch=epoch, lat=lat2, lon=lon)
+    assert n1 == v1.size
+    assert n2 == v2.size - 1 - 2 * len(lon)  # shared boundary is stored once
+
+    values, axes = compact_store.load_tiles(table, ("epoch", "lat", "lon"), lat=(44.5, 45.5), epoch=(2, 2))
+    assert np.all(axes["lat"] == [44.5, 44.75, 45, 45.25, 45.5])
+    assert np.all(axes["lon"] == lon)
+    assert np.all(axes["epoch"] == [2])
+    assert np.allclose(values[0, :3], v1[1, 2:], atol=0.0005)
+    assert np.allclose(values[0, 2:], v2[1, :3], atol=0.0005)
+
+    # missing values are returned as NaN
+    values, axes = compact_store.load_tiles(table, ("epoch", "lat", "lon"), epoch=(1, 1))
+    assert np.isnan(values[0, -1, -1])
+    assert np.sum(np.isnan(values)) == 1
+
+    # a different scaling cannot be mixed into an existing table
+    with pytest.raises(AssertionError):
+        compact_store.save_tile(table, v1, source="test", scale=0.01, epoch=epoch, lat=lat1, lon=lon)
+
+    # query outside the stored data
+    values, axes = compact_store.load_tiles(table, ("epoch", "lat", "lon"), lat=(50, 51))
+    assert values.size == 0 and len(axes["lat"]) == 0
+
+
+def test_save_and_load_float(table):
+    """ Check that values are stored without loss of precision if no scale factor is given """
+    lat = np.array([44., 44.5, 45.])
+    lon = np.array([-60., -59.5])
+    values = np.random.random((len(lat), len(lon)))
+
+    compact_store.save_tile(table, values, source="test", lat=lat, lon=lon)
+    answ, axes = compact_store.load_tiles(table, ("lat", "lon"))
+    assert np.all(answ == values)
+    assert np.all(axes["lat"] == lat) and np.all(axes["lon"] == lon)
@@ -0,0 +1,192 @@
+import sqlite3
+import pytest
+import numpy as np
+from kadlu.geospatial.data_sources import data_util
+from kadlu.geospatial.data_sources.data_util import (
+    as_grid,
+    database_cfg,
+    database_transaction,
+    fill_nearest,
+    range_query,
+    reshape_3D_gridded,
+    reshape_4D,
+    rtree_index,
+)
+
+
+def test_range_query_with_rtree_index():
+    """ Check that range queries using the R*Tree index return the same rows as a
+        plain range query, for rows inserted both before and after the index was created
+    """
+    db = sqlite3.connect(':memory:').cursor()
+    db.execute('CREATE TABLE test (val REAL, lat REAL, lon REAL, time INT, source TEXT)')
+
+    rng = np.random.default_rng(1)
+    rows = lambda n: [(v, y, x, int(t), 'test') for v, y, x, t in zip(
+        rng.random(n), rng.uniform(40, 50, n), rng.uniform(-70, -60, n), rng.integers(0, 48, n))]
+
+    # existing rows are indexed when the index is created
+    db.executemany('INSERT INTO test VALUES (?,?,?,?,?)', rows(5000))
+    rtree_index(db, 'test')
+    assert db.execute('SELECT COUNT(*) FROM rtree_test').fetchone()[0] == 5000
+
+    # new rows are indexed by the insert trigger
+    db.executemany('INSERT INTO test VALUES (?,?,?,?,?)', rows(5000))
+    assert db.execute('SELECT COUNT(*) FROM rtree_test').fetchone()[0] == 10000
+
+    bounds = dict(lat=(44.25, 44.7), lon=(-64.5, -63.33), time=(12, 24))
+    sql, values = range_query('test', bounds, order_by='time, lat, lon')
+    answ = db.execute(sql, values).fetchall()
+
+    expected = db.execute(
+        'SELECT * FROM test WHERE lat >= ? AND lat <= ? AND lon >= ? AND lon <= ? '
+        'AND time >= ? AND time <= ? ORDER BY time, lat, lon',
+        (44.25, 44.7, -64.5, -63.33, 12, 24)).fetchall()
+
+    assert len(answ) > 0
+    assert answ == expected
+
+    # the query plan uses the R*Tree
+    plan = ' '.join(str(r) for r in db.execute(f'EXPLAIN QUERY PLAN {sql}', values).fetchall())
+    assert 'rtree_test' in plan
+
+
+def test_rtree_index_migration(tmp_path, monkeypatch):
+    """ Check that existing tables are indexed within the transaction of the caller,
+        and that the index is only checked once per process
+    """
+    monkeypatch.setattr(data_util, 'storage_cfg', lambda: f'{tmp_path}/')
+    monkeypatch.setattr(data_util, '_rtree_tables', set())
+    with sqlite3.connect(tmp_path / 'geospatial.db') as con:
+        con.execute('CREATE TABLE test (val REAL, lat REAL, lon REAL, time INT)')
+        con.executemany('INSERT INTO test VALUES (?,?,?,?)', [(1., 44., -60., 0), (2., 45., -61., 1)])
+
+    con = sqlite3.connect(tmp_path / 'geospatial.db')
+
+    # the index is not committed before the transaction of the caller
+    with database_transaction() as db:
+        rtree_index(db, 'test')
+        assert con.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'rtree_test'").fetchone()[0] == 0
+
+    assert con.execute('SELECT COUNT(*) FROM rtree_test').fetchone()[0] == 2
+
+    queries = []
+    with database_transaction() as db:
+        db.connection.set_trace_callback(queries.append)
+        rtree_index(db, 'test')
+        db.connection.set_trace_callback(None)
+
+    assert not any('rtree_test' in q for q in queries)
+
+
+def test_database_transaction_nested(tmp_path, monkeypatch):
+    """ Check that nested transactions and calls to close() on the pooled connection
+        do not end the enclosing transaction, and that transactions opened while an
+        unmanaged transaction is pending leave it to be ended by its owner
+    """
+    monkeypatch.setattr(data_util, 'storage_cfg', lambda: f'{tmp_path}/')
+    count = lambda: sqlite3.connect(tmp_path / 'geospatial.db').execute('SELECT COUNT(*) FROM test').fetchone()[0]
+
+    with database_transaction() as db:
+        db.execute('CREATE TABLE test (val INT)')
+
+    with database_transaction() as db:
+        db.execute('INSERT INTO test VALUES (1)')
+        with database_transaction() as db2:
+            db2.execute('INSERT INTO test VALUES (2)')
+
+        # helpers that close the pooled connection do not roll back the transaction
+        conn, _ = database_cfg()
+        conn.close()
+        conn.commit()
+        assert count() == 0
+
+        # changes in a failed nested transaction are rolled back
+        with pytest.raises(ValueError):
+            with database_transaction() as db2:
+                db2.execute('INSERT INTO test VALUES (3)')
+                raise ValueError()
+
+    assert count() == 2
+
+    # a pending unmanaged transaction is not committed
+    conn, db = database_cfg()
+    db.execute('INSERT INTO test VALUES (4)')
+    with database_transaction() as db2:
+        db2.execute('INSERT INTO test VALUES (5)')
+
+    assert conn.in_transaction and count() == 2
+    conn.commit()
+    assert count() == 4
+
+
+def test_reshape_4D():
+    """ Check that row data are placed on a 4D grid, and that missing values are filled
+        along each depth column, or with the depth plane average for empty columns
+    """
+    lat, lon, depth, time = np.meshgrid([44., 45.], [-60., -59.], [0., 10., 20.], [1., 2.], indexing='ij')
+    val = depth + time
+    val[0, 0, 2] = np.nan  # below the seafloor
+    val[0, 1, 0] = np.nan  # above the first value in the column
+    val[1, 1] = np.nan  # land
+    keep = ~np.isnan(val)
+
+    # rows are given in random order, as (val, lat, lon, time, depth)
+    cols = np.array([val[keep], lat[keep], lon[keep], time[keep], depth[keep]])
+    cols = cols[:, np.random.default_rng(0).permutation(cols.shape[1])]
+
+    data = reshape_4D(cols)
+    assert np.all(data['lats'] == [44, 45]) and np.all(data['lons'] == [-60, -59])
+    assert np.all(data['depths'] == [0, 10, 20]) and np.all(data['times'] == [1, 2])
+
+    values = data['values']
+    assert values.shape == (2, 2, 3, 2)
+    assert np.all(values[0, 0, 2] == values[0, 0, 1])
+    assert np.all(values[0, 1, 0] == values[0, 1, 1])
+    assert np.all(values[1, 0] == val[1, 0])
+
+    # the empty column is filled with the mean of each depth plane
+    expected = np.mean(values.reshape(4, 3, 2)[:3], axis=(0, 2))
+    assert np.allclose(values[1, 1].mean(axis=1), expected)
+
+
+def test_reshape_3D_gridded():
+    """ Check that row data for a single time are placed on a 3D grid """
+    lat, lon, depth = np.meshgrid([44., 45.], [-60., -59.], [0., 10.], indexing='ij')
+    val = lat + depth
+    val[1, 1, 1] = np.nan
+    keep = ~np.isnan(val)
+    cols = np.array([val[keep], lat[keep], lon[keep], np.zeros(keep.sum()), depth[keep]])
+
+    data = reshape_3D_gridded(cols)
+    assert data['values'].shape == (2, 2, 2)
+    assert np.all(data['depths'] == [0, 10])
+    assert data['values'][1, 1, 1] == val[1, 1, 0]
+    assert np.all(data['values'][keep] == val[keep])
+
+
+def test_as_grid():
+    """ Check that row data are placed on a dense grid, with missing values masked """
+    lat, lon, epoch = np.meshgrid([44., 45.], [-60., -59., -58.], [1., 2.], indexing='ij')
+    val = lat + lon + epoch
+    val[1, 2] = np.nan  # land
+    keep = ~np.isnan(val)
+    cols = np.array([val[keep], lat[keep], lon[keep], epoch[keep]])
+
+    data = as_grid(cols[:, ::-1], dims=('lat', 'lon', 'epoch'))
+    assert np.all(data['lat'] == [44, 45]) and np.all(data['lon'] == [-60, -59, -58])
+    assert np.all(data['epoch'] == [1, 2])
+    assert np.all(data['mask'] == ~keep)
+    assert np.all(data['value'][keep] == val[keep])
+
+
+def test_fill_nearest():
+    """ Check that masked values are replaced by the value at the nearest grid point """
+    values = np.array([[1., 2., np.nan], [4., np.nan, np.nan], [7., 8., 9.]])
+    filled = fill_nearest(values)
+    assert filled[0, 2] == 2 and filled[1, 2] == 9
+    assert filled[1, 1] in (2, 4, 8)  # equidistant neighbours
+    assert np.all(filled[~np.isnan(values)] == values[~np.isnan(values)])
+
+    # nothing to fill
+    assert fill_nearest(filled) is filled
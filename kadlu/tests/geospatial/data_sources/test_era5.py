@@ -139,3 +139,46 @@ def test_era5_load_wind():
     assert np.all(np.logical_and(val >= 0, val <= 100))
 
 
+
+
+def test_era5_same_day_blocks_download_once(tmp_path, monkeypatch):
+    """ Check that concurrent blocks on the same day download the global
+        ERA5 file only once, and never read it while it is being written
+    """
+    import time
+    import threading
+    from types import SimpleNamespace
+    from kadlu.index import index
+    from kadlu.geospatial.data_sources import era5
+
+    retrieved = []
+    lock = threading.Lock()
+
+    class Client():
+        def retrieve(self, dataset, request, target):
+            with lock:
+                retrieved.append(target)
+            with open(target, 'wb') as f:
+                f.write(b'GRIB')
+                time.sleep(0.1)
+                f.write(b'7777')
+
+    def grib_open(target):
+        with open(target, 'rb') as f:
+            assert f.read() == b'GRIB7777'
+        return []
+
+    monkeypatch.setattr(era5.cdsapi, 'Client', Client)
+    monkeypatch.setattr(era5, 'pygrib', SimpleNamespace(open=grib_open), raising=False)
+    monkeypatch.setattr(era5, 'storage_cfg', lambda: f'{tmp_path}/')
+
+    def write(data, **kwargs):
+        return data.shape[1]
+
+    bounds = dict(south=44, north=46, west=-64, east=-60, start=datetime(2015, 1, 1), end=datetime(2015, 1, 2))
+    with index(storagedir=str(tmp_path), store=True, source='era5', threads=2, coalesce=(1, 1, 1, 1), **bounds) as fetchmap:
+        assert len(fetchmap.kwargslist) == 2
+        assert fetchmap(callback=write, fetch=era5.download_era5, var='mean_wave_period') == [0, 0]
+
+    assert len(retrieved) == 1
+    assert os.listdir(tmp_path).count('ERA5_reanalysis_mean_wave_period_2015-01-01.grb2') == 1
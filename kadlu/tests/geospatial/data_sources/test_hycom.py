@@ -1,9 +1,147 @@
+import os
+import threading
 import pytest
 import kadlu
 import numpy as np
 from datetime import datetime
-from kadlu.geospatial.data_sources.hycom import Hycom
-from kadlu.geospatial.data_sources.data_util import reshape_4D
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import kadlu.geospatial.data_sources.hycom as hycom
+from kadlu.geospatial.data_sources.hycom import Hycom, parse_ascii, parse_dods, grid_columns
+from kadlu.geospatial.data_sources.data_util import as_grid, reshape_4D
+
+path_to_assets = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "assets")
+
+
+def test_parse_ascii_payload():
+    """ Check that the vectorized parser reproduces a row-by-row parse of a recorded 
+        HYCOM ASCII response, and that null values are removed from the coordinate columns
+    """
+    with open(os.path.join(path_to_assets, "hycom_salinity.ascii")) as f:
+        text = f.read()
+
+    cube = parse_ascii(text)
+    assert cube.shape == (1, 40, 13, 13)
+    assert cube.dtype == np.int16
+
+    # reference: parse one row at a time
+    payload = text.split("---------------------------------------------\n")[1].split("\n\n")[0]
+    answ = np.empty(cube.shape)
+    for row in payload.split("\n")[1:]:
+        ix_str, row_csv = row.split(", ", 1)
+        a, b, c = [int(x) for x in ix_str[1:-1].split("][")]
+        answ[a][b][c] = np.array(row_csv.split(", "), dtype=int)
+
+    assert np.all(cube == answ)
+
+    epoch = np.array([175536.])
+    depth = np.arange(40, dtype=float)
+    lat = 44 + 0.04 * np.arange(13)
+    lon = 296 + 0.08 * np.arange(13)
+    val, y, x, t, d = grid_columns(cube, epoch=epoch, depth=depth, lat=lat, lon=lon, var="salinity")
+
+    n = np.sum(cube != -30000)
+    assert len(val) == len(y) == len(x) == len(t) == len(d) == n
+    assert np.all(np.isclose(val, 33, atol=3))
+    assert np.all(t == 175536.)
+
+    # first row of the payload is land for the three westernmost longitudes
+    assert y[0] == lat[0] and x[0] == lon[3] and d[0] == 0
+
+
+def encode_dods(cube, var="salinity"):
+    """ Encode a (time, depth, lat, lon) int16 array as a DAP2 binary response,
+        including the coordinate maps that follow the array in a Grid """
+    dims = ["time", "depth", "lat", "lon"]
+    decl = "".join(f"[{d} = {n}]" for d, n in zip(dims, cube.shape))
+    dds = "\n".join(["Dataset {", "    Grid {", "     ARRAY:", f"        Int16 {var}{decl};", "     MAPS:"]
+        + [f"        Float64 {d}[{d} = {n}];" for d, n in zip(dims, cube.shape)]
+        + [f"    }} {var};", "} GLBy0.08/expt_93.0;", ""])
+
+    def xdr(arr, dtype):
+        n = np.array([arr.size, arr.size], dtype=">u4").tobytes()
+        return n + np.ascontiguousarray(arr, dtype=dtype).tobytes()
+
+    data = xdr(cube, ">i4") + b"".join(xdr(np.arange(n, dtype=float), ">f8") for n in cube.shape)
+    return dds.encode("ascii") + b"\nData:\n" + data
+
+
+@pytest.fixture
+def hycom_stand_in(monkeypatch):
+    """ Local HTTP server with canned ASCII and binary responses for HYCOM data requests """
+    with open(os.path.join(path_to_assets, "hycom_salinity.ascii")) as f:
+        text = f.read()
+
+    responses = {
+        ".ascii": text.encode("ascii"),
+        ".dods": encode_dods(parse_ascii(text)),
+    }
+    requested = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            ext = path[path.rfind("."):]
+            requested.append(ext)
+            body = responses[ext]
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(hycom, "hycom_src", f"http://127.0.0.1:{server.server_port}/GLBy0.08/expt_93.0")
+
+    yield responses, requested
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_parse_dods_payload():
+    """ Check that a binary response decodes to the same array as the ASCII response """
+    with open(os.path.join(path_to_assets, "hycom_salinity.ascii")) as f:
+        cube = parse_ascii(f.read())
+
+    content = encode_dods(cube)
+    answ = parse_dods(content)
+    assert answ.dtype == np.int16
+    assert np.all(answ == cube)
+
+    # binary response is considerably smaller than the ASCII response
+    assert len(content) < os.path.getsize(os.path.join(path_to_assets, "hycom_salinity.ascii"))
+
+
+def test_fetch_cube_with_binary_transport(hycom_stand_in):
+    """ Check that the binary and ASCII transports return identical data from the HYCOM stand-in server """
+    responses, requested = hycom_stand_in
+    slices = [(0, 0), (0, 39), (0, 12), (0, 12)]
+
+    cube_ascii = Hycom().fetch_cube("salinity", slices)
+    cube_dods = Hycom(transport="dods").fetch_cube("salinity", slices)
+
+    assert requested == [".ascii", ".dods"]
+    assert np.all(cube_ascii == cube_dods)
+
+
+def test_binary_transport_falls_back_to_ascii(hycom_stand_in):
+    """ Check that a malformed binary response is re-requested with ASCII encoding """
+    responses, requested = hycom_stand_in
+    responses[".dods"] = b"Error {\n    code = 500;\n};\n"
+
+    cube = Hycom(transport="dods").fetch_cube("salinity", [(0, 0), (0, 39), (0, 12), (0, 12)])
+
+    assert requested == [".dods", ".ascii"]
+    assert cube.shape == (1, 40, 13, 13)
+
+
+def test_invalid_transport():
+    with pytest.raises(AssertionError):
+        Hycom(transport="netcdf")
 
 
 @pytest.mark.hycom_access
@@ -150,3 +288,58 @@ def test_no_data_on_land():
     plt.scatter(lon, lat)
     plt.show()
 '''
+
+
+def test_store_and_load_array(hycom_stand_in, tmp_path, monkeypatch):
+    """ Check that data stored with the `npz` backend are loaded as a dense array 
+        with the same values as the columns stored in the local database
+    """
+    monkeypatch.setattr(hycom.array_store, "storage_cfg", lambda: str(tmp_path))
+
+    bounds = dict(south=44, north=44.48, west=296, east=296.96, top=0, bottom=5000,
+        start=datetime(2020, 1, 10), end=datetime(2020, 1, 10, 12))
+
+    source = Hycom()
+    source.epoch = np.array([175536.])
+    source.depth = np.arange(40, dtype=float)
+    source.ygrid = 44 + 0.04 * np.arange(13)
+    source.xgrid = 296 + 0.08 * np.arange(13)
+    source.callback("salinity", backend="npz", **bounds)
+
+    values, axes = hycom.load_array("hycom_salinity", bounds)
+    assert values.shape == (1, 40, 13, 13)
+    assert np.all(axes["lon"] == source.xgrid)
+
+    cube = source.fetch_cube("salinity", [(0, 0), (0, 39), (0, 12), (0, 12)])
+    cols = grid_columns(cube, epoch=source.epoch, depth=source.depth, lat=source.ygrid, lon=source.xgrid, var="salinity")
+    answ = hycom.array_store.to_columns(values, axes, ("lat", "lon", "epoch", "depth"))
+    assert np.allclose(answ, cols)
+
+
+def test_load_gridded_array(hycom_stand_in, tmp_path, monkeypatch):
+    """ Check that data stored with the `npz` backend are returned on a dense grid 
+        without flattening, if requested
+    """
+    monkeypatch.setattr(hycom.array_store, "storage_cfg", lambda: str(tmp_path))
+    monkeypatch.setattr(hycom.storage_cfg, "backend", lambda self, *args: "npz")
+
+    bounds = dict(south=44, north=44.48, west=-64, east=-63.04, top=0, bottom=5000,
+        start=datetime(2020, 1, 10), end=datetime(2020, 1, 10, 12))
+
+    source = Hycom()
+    source.epoch = np.array([175536.])
+    source.depth = np.arange(40, dtype=float)
+    source.ygrid = 44 + 0.04 * np.arange(13)
+    source.xgrid = 296 + 0.08 * np.arange(13)
+    monkeypatch.setattr(source, "fetch_hycom", lambda *args, **kwargs: None)
+    source.callback("salinity", backend="npz", **dict(bounds, west=296, east=296.96))
+
+    data = source.load_salinity(gridded=True, **bounds)
+    assert data["value"].shape == (13, 13, 1, 40)
+    assert np.allclose(data["lon"], source.xgrid - 360)
+    assert np.all(data["mask"] == np.isnan(data["value"]))
+
+    # same values as the flattened rows
+    rows = source.load_salinity(**bounds)
+    answ = as_grid(rows)
+    assert np.allclose(answ["value"][~answ["mask"]], data["value"][~data["mask"]])
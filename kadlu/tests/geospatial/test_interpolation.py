@@ -494,6 +494,138 @@ def test_reg_interp_lat_lon_arrays():
     assert np.all(np.isclose(v[0, :, 0], np.array(v0)[2:,1], rtol=1E-3))
 
 
+def test_reg_interp_prepared_query():
+    """Check that a prepared query gives the same result as evaluating the interpolators,
+       for interpolators on the same grid as well as on a different grid"""
+    rng = np.random.default_rng(0)
+    lat = np.linspace(40, 45, 6)
+    lon = np.linspace(-60, -55, 5)
+    depth = np.array([0., 10., 50., 100.])
+    v, w = rng.random((2, 6, 5, 4))
+    qlat, qlon, qdepth = rng.uniform(39, 46, 8), rng.uniform(-61, -54, 7), rng.uniform(-5, 120, 9)
+
+    for method in ["linear", "nearest"]:
+        ip_v = ki.get_interpolator(v, lat=lat, lon=lon, depth=depth, method=method)
+        ip_w = ki.get_interpolator(w, lat=lat, lon=lon, depth=depth, method=method)
+
+        query = ip_v.prepare(lat=qlat, lon=qlon, depth=qdepth, grid=True)
+        assert query.index is not None
+        assert np.allclose(query(ip_v), ip_v(lat=qlat, lon=qlon, depth=qdepth, grid=True))
+        assert np.allclose(query(ip_w), ip_w(lat=qlat, lon=qlon, depth=qdepth, grid=True))
+        assert np.allclose(query(w), query(ip_w))
+
+        query = ip_v.prepare(lat=qlat[:7], lon=qlon, depth=qdepth[:7])
+        assert np.allclose(query(ip_v), ip_v(lat=qlat[:7], lon=qlon, depth=qdepth[:7]))
+
+    # interpolators on a different grid are evaluated in the usual way
+    ip_u = ki.get_interpolator(v[:, :, :2], lat=lat, lon=lon, depth=depth[:2], method="linear")
+    assert np.allclose(query(ip_u), ip_u(lat=qlat[:7], lon=qlon, depth=qdepth[:7]))
+
+    with pytest.raises(AssertionError):
+        query(v[:, :, :2])
+
+
+def test_reg_interp_max_value():
+    """Check that the bounds on the data values within a disc or a box enclose the
+       interpolated values, and that the refined bound is the maximum over the
+       grid cells overlapping the region"""
+    rng = np.random.default_rng(0)
+    lat = np.linspace(44, 46, 41)
+    lon = np.linspace(-61, -59, 57)
+    v = rng.uniform(100, 2000, (41, 57))
+    ip = ki.get_interpolator(v, lat=lat, lon=lon, method="linear")
+
+    # interpolated values within a disc of radius 40 km
+    x = np.linspace(-40e3, 40e3, 401)
+    b = ip(x=x, y=x, grid=True)
+    inside = (x[:, None]**2 + x[None, :]**2) <= 40e3**2
+    b_max, b_min = np.max(b[inside]), np.min(b[inside])
+
+    v_max = ip.max_value(radius=40e3, refine=True)
+    assert b_max <= v_max <= ip.max_value(radius=40e3) <= np.max(v)
+    v_min = ip.min_value(radius=40e3, refine=True)
+    assert np.min(v) <= ip.min_value(radius=40e3) <= v_min <= b_min
+
+    # maximum over the corner nodes of the cells overlapping the disc
+    lat0, lon0 = center_point(lat, lon)
+    lat_c = np.clip(lat0, lat[:-1], lat[1:])
+    lon_c = np.clip(lon0, lon[:-1], lon[1:])
+    xc, yc = LLtoXY(lat=lat_c, lon=lon_c, lat_ref=lat0, lon_ref=lon0, grid=True)
+    overlap = (xc**2 + yc**2).T <= 40e3**2
+    cells = np.max([v[:-1, :-1], v[1:, :-1], v[:-1, 1:], v[1:, 1:]], axis=0)
+    assert v_max == pytest.approx(np.max(cells[overlap]))
+
+    # disc centered at a different location
+    assert ip.max_value(radius=40e3, lat=lat0, lon=lon0) == ip.max_value(radius=40e3, x=0, y=0)
+
+    # lat-lon box
+    answ = np.max(v[(lat >= 44.45) & (lat <= 45.55)][:, (lon >= -60.45) & (lon <= -59.55)])
+    assert ip.max_value(south=44.45, north=45.55, west=-60.45, east=-59.55, refine=True) == answ
+    assert ip.max_value(south=44.45, north=45.55, west=-60.45, east=-59.55) >= answ
+    assert ip.max_value(refine=True) == np.max(v)
+
+    # constant data
+    assert ki.get_interpolator(2000.).max_value(radius=40e3) == 2000
+
+    # only data on a lat-lon grid are supported
+    ip = ki.get_interpolator(rng.random((6, 5)), lat=lat[:6], depth=[0, 10, 20, 30, 40])
+    with pytest.raises(AssertionError):
+        ip.max_value(radius=40e3)
+
+
+def test_reg_interp_single_precision():
+    """Check that data values are stored and interpolated in single precision, if requested"""
+    lat = np.linspace(40, 45, 6)
+    lon = np.linspace(-60, -55, 5)
+    depth = np.array([0., 10., 50., 100.])
+    v = np.random.default_rng(0).random((6, 5, 4))
+    ip64 = ki.get_interpolator(v, lat=lat, lon=lon, depth=depth)
+    try:
+        kadlu.set_precision("float32")
+        ip32 = ki.get_interpolator(v, lat=lat, lon=lon, depth=depth)
+    finally:
+        kadlu.set_precision("float64")
+
+    assert ip32.value.dtype == np.float32
+    assert ip32.coordinates["lat"].dtype == np.float64
+    w = ip32(lat=[41.3, 44.2], lon=[-58.1, -55.5], depth=[5, 75])
+    assert w.dtype == np.float32
+    assert np.allclose(w, ip64(lat=[41.3, 44.2], lon=[-58.1, -55.5], depth=[5, 75]), atol=1e-6)
+
+
+def test_stacked_interp():
+    """Check that stacked interpolators give the same results as the individual interpolators,
+       and that only interpolators on the same grid are grouped"""
+    rng = np.random.default_rng(0)
+    lat = np.linspace(40, 45, 6)
+    lon = np.linspace(-60, -55, 5)
+    depth = np.array([0., 10., 50., 100.])
+    interps = {
+        "temperature": ki.get_interpolator(rng.random((6, 5, 4)), lat=lat, lon=lon, depth=depth),
+        "salinity": ki.get_interpolator(rng.random((6, 5, 4)), lat=lat, lon=lon, depth=depth),
+        "water_u": ki.get_interpolator(rng.random((6, 5, 3)), lat=lat, lon=lon, depth=depth[:3]),
+        "bathymetry": ki.get_interpolator(rng.random((6, 5)), lat=lat, lon=lon),
+    }
+    stacked = ki.stack_interpolators(interps)
+    assert list(stacked.keys()) == ["temperature", "salinity"]
+    assert stacked["temperature"] is stacked["salinity"]
+
+    interp = stacked["temperature"]
+    assert interp.value.shape == (2, 6, 5, 4)
+
+    qlat, qlon, qdepth = rng.uniform(39, 46, 8), rng.uniform(-61, -54, 7), rng.uniform(-5, 120, 9)
+    v = interp(lat=qlat, lon=qlon, depth=qdepth, grid=True)
+    for k in ["temperature", "salinity"]:
+        assert np.allclose(v[k], interps[k](lat=qlat, lon=qlon, depth=qdepth, grid=True))
+
+    v = interp(names=["salinity"], lat=44, lon=-58, depth=20)
+    assert list(v.keys()) == ["salinity"]
+    assert np.isclose(v["salinity"], interps["salinity"](lat=44, lon=-58, depth=20))
+
+    with pytest.raises(AssertionError):
+        ki.StackedGridInterpolator({k: interps[k] for k in ["temperature", "water_u"]})
+
+
 def test_create_regular_grid():
     """ Check that the _create_regular_grid helper function returns grids of expected shape and range
     """
@@ -655,6 +787,34 @@ def test_irregular_interp_3d():
         assert tii == pytest.approx(t, rel=1e-3)
 
 
+def test_irregular_interp_reuses_triangulation(monkeypatch):
+    """Check that the Delaunay triangulation is computed once and reused across 
+       batches and calls, giving the same result as scipy's griddata function"""
+    calls = []
+    Delaunay = ki.Delaunay
+    def delaunay(points):
+        calls.append(points)
+        return Delaunay(points)
+
+    monkeypatch.setattr(ki, "Delaunay", delaunay)
+
+    rng = np.random.default_rng(1)
+    points = rng.uniform(0, 1, (200, 3))
+    values = np.sum(points, axis=1)
+    itp = ki._IrregularGridInterpolator(points, values, method="linear", batch_size=100)
+
+    xi = rng.uniform(-0.1, 1.1, (3, 1000))
+    v = itp(xi)
+    assert len(calls) == 1 and itp.method == "linear"
+    assert np.allclose(v, itp(xi))
+    assert len(calls) == 1
+
+    answ = ki.griddata(points, values, xi.T, method="linear")
+    nearest = ki.griddata(points, values, xi.T, method="nearest")
+    answ[np.isnan(answ)] = nearest[np.isnan(answ)]
+    assert np.allclose(v, answ)
+
+
 def test_interp_2x2_grid():
     values = np.array([[0, 2], [0, 2]])
     lats = np.array([0, 1])
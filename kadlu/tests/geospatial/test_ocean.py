@@ -88,6 +88,48 @@ def test_load_as_array_on_irregular_grid():
     assert np.isclose(s, 0.23, rtol=1e-5)
 
 
+def test_load_gridded_with_mask():
+    """ Test that ocean can be initialized with gridded data returned by a loader together 
+        with a mask, and that masked grid points are filled with the nearest values
+    """
+    lats = np.linspace(bounds["south"], bounds["north"], 5)
+    lons = np.linspace(bounds["west"], bounds["east"], 5)
+    depths = np.array([0., 100., 200.])
+    sal = np.ones((5, 5, 3)) * 0.23
+    sal[-1, -1] = np.nan  # land
+    sal[:, :, -1] = np.nan  # below the seafloor
+
+    def load_salinity(**kwargs):
+        return {"value":sal.copy(), "lat":lats, "lon":lons, "depth":depths, "mask":np.isnan(sal)}
+
+    o = Ocean(load_salinity=load_salinity, **bounds)
+    assert "mask" not in o.salinity.coordinates
+
+    s = o.salinity(lat=lats[-1], lon=lons[-1], depth=200)
+    assert np.isclose(s, 0.23)
+
+
+def test_evaluate_co_gridded_variables():
+    """ Test that variables on the same grid are grouped, and that evaluating them together 
+        gives the same result as evaluating them one at a time
+    """
+    lats = np.linspace(bounds["south"], bounds["north"], 5)
+    lons = np.linspace(bounds["west"], bounds["east"], 4)
+    depths = np.array([0., 100., 200.])
+    temp = {"value":np.random.random((5, 4, 3)), "lat":lats, "lon":lons, "depth":depths}
+    sal = {"value":np.random.random((5, 4, 3)), "lat":lats, "lon":lons, "depth":depths}
+
+    o = Ocean(load_temperature=temp, load_salinity=sal, load_bathymetry=100, **bounds)
+    assert o.stacked["temperature"] is o.stacked["salinity"]
+    assert "bathymetry" not in o.stacked
+
+    v = o.evaluate(["salinity", "bathymetry", "temperature"], lat=[42.5, 43.1], lon=[-61, -62], depth=[10, 150])
+    assert list(v.keys()) == ["salinity", "bathymetry", "temperature"]
+    assert np.allclose(v["temperature"], o.temperature(lat=[42.5, 43.1], lon=[-61, -62], depth=[10, 150]))
+    assert np.allclose(v["salinity"], o.salinity(lat=[42.5, 43.1], lon=[-61, -62], depth=[10, 150]))
+    assert np.allclose(v["bathymetry"], 100)
+
+
 @pytest.mark.hycom_access
 def test_small_full_ocean():
     """ Test that the ocean can be initialized for a very small region 
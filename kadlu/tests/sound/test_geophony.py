@@ -95,6 +95,32 @@ def test_geophony_flat_seafloor():
     geo = geophony(freq=100, lat=45, lon=-59, depth=[100, 2000], **kwargs)
 
 
+def test_geophony_dry_run():
+    """ Check that the cost of the geophony computation can be estimated 
+        at every location without computing the noise levels """
+    kwargs = {
+        'load_bathymetry': 10000,
+        'load_wind_uv': 1.0,
+        'ssp': 1480,
+        'angular_bin': 90,
+        'dr': 1000,
+        'dz': 1000
+    }
+    geo = geophony(freq=100,
+                   south=44,
+                   north=46,
+                   west=-60,
+                   east=-58,
+                   depth=[100, 2000],
+                   xy_res=71,
+                   dry_run=True,
+                   **kwargs)
+    assert 'spl' not in geo.keys()
+    for key in ['flops', 'memory', 'time']:
+        assert geo[key].shape == (3, 5)
+        assert np.all(geo[key] > 0)
+
+
 def test_geophony_in_canyon(bathy_canyon):
     """ Check that we can execute the geophony method for a
         canyon-shaped bathymetry and uniform sound speed profile"""
@@ -240,3 +266,25 @@ def test_transmission_loss_flat_seafloor():
     np.testing.assert_array_almost_equal(-tl_v[0, 1:, :, 0],
                                          answ[1:, :],
                                          decimal=3)
+
+def test_transmission_loss_range_independent(bathy_canyon):
+    """ Check that the transmission loss calculator is flagged as range 
+        independent if the bathymetry and sound speed do not vary horizontally """
+    kwargs = dict(freq=100, source_depth=75, propagation_range=0.5, angular_bin=10)
+    transm_loss = transmission_loss(load_bathymetry=2000, ssp=([1480, 1490], [0, 100]), **kwargs)
+    assert transm_loss.range_independent
+
+    transm_loss = transmission_loss(load_bathymetry=bathy_canyon, ssp=1480, lat=45.0, lon=61.0, **kwargs)
+    assert not transm_loss.range_independent
+
+
+def test_transmission_loss_max_depth(bathy_canyon):
+    """ Check that the maximum depth within the propagation range is bounded
+        from above by the bathymetry data values """
+    kwargs = dict(freq=100, source_depth=75, propagation_range=20, angular_bin=10)
+    transm_loss, ocean = transmission_loss(load_bathymetry=bathy_canyon, ssp=1480, lat=44.6, lon=61.0, return_ocean=True, **kwargs)
+    x = np.linspace(-25e3, 25e3, 501)
+    b = ocean.bathymetry(x=x, y=x, grid=True)
+    r = np.sqrt(x[:, None]**2 + x[None, :]**2)
+    # the bound is the maximum over the grid cells (~3.3 x 2.2 km) overlapping the propagation range
+    assert np.max(b[r <= 20e3]) <= transm_loss.max_depth <= np.max(b[r <= 24e3])
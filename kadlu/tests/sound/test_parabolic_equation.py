@@ -1,9 +1,10 @@
 """ Unit tests for the the 'sound.parabolic_equation' module"""
 import pytest
 import os
+import logging
 import numpy as np
 import kadlu.sound.parabolic_equation as pe 
-from kadlu.utils import deg2rad
+from kadlu.utils import deg2rad, set_precision
 
 def test_prop_defr():
     """ Check that defractive propagation matrix is computed correctly """
@@ -250,3 +251,349 @@ def test_compute_transm_loss_multiple_sources():
     tl01, ax = transm_loss.calc(source_depth=[9900,8800], rec_depth=[.1], aperture=88, progress_bar=False)
     np.testing.assert_array_almost_equal(tl01[0,0], tl0[0,0], decimal=3) 
     np.testing.assert_array_almost_equal(tl01[1,0], tl1[0,0], decimal=3) 
+
+def test_compute_transm_loss_single_precision():
+    """ Check that the transmission loss computed in single precision agrees 
+        with the double precision result to within 0.05 dB, and that the 
+        output arrays take up half the memory"""
+    bottom = {'sound_speed':1700,'density':1.5,'attenuation':0.5}
+    def bathy_func(x,y,grid=False):
+        if grid: x,y = np.meshgrid(x,y)
+        return 200 + 0.01*x
+    def bathy_deriv_func(x,y,axis): return (0.01 if axis=='x' else 0)*np.ones(x.shape)
+    def sound_speed_func(x,y,z): return 1490 + 0.05*z
+
+    def calc():
+        transm_loss = pe.TransmissionLoss(freq=200, bathy_func=bathy_func, 
+            bathy_deriv_func=bathy_deriv_func, sound_speed_func=sound_speed_func, 
+            bottom=bottom, propagation_range=2, angular_bin=45)
+        return transm_loss.calc(source_depth=[20,80], rec_depth=[10,50], vertical=True, progress_bar=False)
+
+    tl_h64, _, tl_v64, _ = calc()
+    try:
+        set_precision('float32')
+        tl_h32, _, tl_v32, _ = calc()
+    finally:
+        set_precision('float64')
+
+    assert tl_h32.dtype == np.float32 and tl_v32.dtype == np.float32
+    assert tl_h32.nbytes == tl_h64.nbytes / 2
+
+    # compare away from the deep interference nulls
+    mask = tl_h64 < 100
+    assert np.max(np.abs(tl_h32 - tl_h64)[mask]) < 0.05
+    mask = tl_v64 < 100
+    assert np.max(np.abs(tl_v32 - tl_v64)[mask]) < 0.05
+
+def test_vertical_fft_in_place():
+    """ Check that the vertical FFT work buffer is transformed in place,
+        in agreement with numpy's FFT """
+    x = np.random.random((2,16,3)) + 1j * np.random.random((2,16,3))
+    fft = pe.VerticalFFT(x.shape, dtype=np.complex128, workers=2)
+    fft.buffer[...] = x
+    ptr = fft.buffer.ctypes.data
+    y = fft.fft()
+    assert y is fft.buffer and fft.buffer.ctypes.data == ptr
+    np.testing.assert_allclose(fft.buffer, np.fft.fft(x, axis=1), atol=1e-12)
+    fft.ifft()
+    np.testing.assert_allclose(fft.buffer, x, atol=1e-12)
+
+    with pytest.raises(AssertionError):
+        pe.VerticalFFT(x.shape, dtype=np.complex128, backend='fftpack')
+
+def test_vertical_fft_pyfftw():
+    """ Check that the pyFFTW backend agrees with numpy's FFT """
+    pytest.importorskip('pyfftw')
+    x = np.random.random((1,16,4)) + 1j * np.random.random((1,16,4))
+    fft = pe.VerticalFFT(x.shape, dtype=np.complex128, backend='pyfftw')
+    fft.buffer[...] = x
+    np.testing.assert_allclose(fft.fft(), np.fft.fft(x, axis=1), atol=1e-12)
+    np.testing.assert_allclose(fft.ifft(), x, atol=1e-12)
+
+def test_compute_transm_loss_fft_workers():
+    """ Check that the transmission loss does not depend on the number of FFT 
+        threads, and that the FFT work buffer is reused between calls """
+    bottom = {'sound_speed':1700,'density':1.5,'attenuation':0.5}
+    def bathy_func(x,y,grid=False):
+        if grid: x,y = np.meshgrid(x,y)
+        return 200 + 0.01*x
+    def bathy_deriv_func(x,y,axis): return (0.01 if axis=='x' else 0)*np.ones(x.shape)
+    def sound_speed_func(x,y,z): return 1490 + 0.05*z
+
+    tl = []
+    for workers in [1, 2]:
+        transm_loss = pe.TransmissionLoss(freq=200, bathy_func=bathy_func, 
+            bathy_deriv_func=bathy_deriv_func, sound_speed_func=sound_speed_func, 
+            bottom=bottom, propagation_range=2, angular_bin=45, fft_workers=workers)
+        tl.append(transm_loss.calc(source_depth=[20,80], rec_depth=[10,50], progress_bar=False)[0])
+
+    buffer = transm_loss._fft.buffer
+    transm_loss.calc(source_depth=[20,80], rec_depth=[10,50], progress_bar=False)
+    assert transm_loss._fft.buffer is buffer
+    np.testing.assert_allclose(tl[0], tl[1], atol=1e-8)
+
+def sloping_bathy(x,y,grid=False):
+    if grid: x,y = np.meshgrid(x,y)
+    return 200 + 0.01*x + 0.005*y
+
+def sloping_bathy_deriv(x,y,axis): return (0.01 if axis=='x' else 0.005)*np.ones(x.shape)
+
+def linear_sound_speed(x,y,z): return 1490 + 0.05*z + 0.001*x
+
+@pytest.mark.parametrize('pool', ['thread', 'process'])
+def test_compute_transm_loss_parallel(pool):
+    """ Check that splitting the azimuthal bins across several workers 
+        gives the same transmission loss as the serial computation """
+    bottom = {'sound_speed':1700,'density':1.5,'attenuation':0.5}
+    res = []
+    for workers in [1, 3]:
+        transm_loss = pe.TransmissionLoss(freq=200, bathy_func=sloping_bathy, 
+            bathy_deriv_func=sloping_bathy_deriv, sound_speed_func=linear_sound_speed, 
+            bottom=bottom, propagation_range=2, angular_bin=30, workers=workers, pool=pool)
+        res.append(transm_loss.calc(source_depth=[20,80], rec_depth=[10,50], vertical=True, 
+            progress_bar=False, return_field=True))
+        psi = transm_loss._solve_pe(source_depth=[20,80], rec_depth=[10,50], aperture=86,
+            progress_bar=False, return_field=True)
+        res[-1] += (psi,)
+
+    (fh1, _, fv1, _, psi1), (fh3, _, fv3, _, psi3) = res
+    assert psi3.shape == psi1.shape
+    np.testing.assert_allclose(fh3, fh1, rtol=1e-10)
+    np.testing.assert_allclose(fv3, fv1, rtol=1e-10)
+    np.testing.assert_allclose(psi3, psi1, rtol=1e-10)
+
+def test_compute_transm_loss_range_independent():
+    """ Check that the acoustic environment is only evaluated once if it is 
+        range independent, without changing the transmission loss """
+    bottom = {'sound_speed':1700,'density':1.5,'attenuation':0.5}
+    calls = []
+    def bathy_func(x,y,grid=False): return 200*np.ones(np.shape(x) if not grid else (len(y),len(x)))
+    def bathy_deriv_func(x,y,axis): return np.zeros(x.shape)
+    def sound_speed_func(x,y,z):
+        calls.append(x)
+        return 1490 + 0.05*z
+
+    tl = []
+    for range_independent in [False, True]:
+        calls.clear()
+        transm_loss = pe.TransmissionLoss(freq=200, bathy_func=bathy_func, 
+            bathy_deriv_func=bathy_deriv_func, sound_speed_func=sound_speed_func, 
+            bottom=bottom, propagation_range=1, angular_bin=45, range_independent=range_independent)
+        tl.append(transm_loss.calc(source_depth=[20], rec_depth=[10,50], progress_bar=False)[0])
+
+    assert len(calls) == 1
+    np.testing.assert_allclose(tl[0], tl[1], rtol=1e-10)
+
+def test_compute_transm_loss_env_step():
+    """ Check that the acoustic environment is updated every env_step steps, 
+        or whenever the seafloor depth changes by more than env_tol """
+    bottom = {'sound_speed':1700,'density':1.5,'attenuation':0.5}
+    calls = []
+    def sound_speed_func(x,y,z):
+        calls.append(x)
+        return linear_sound_speed(x,y,z)
+
+    def calc(**kwargs):
+        calls.clear()
+        transm_loss = pe.TransmissionLoss(freq=200, bathy_func=sloping_bathy, 
+            bathy_deriv_func=sloping_bathy_deriv, sound_speed_func=sound_speed_func, 
+            bottom=bottom, propagation_range=2, angular_bin=45, **kwargs)
+        tl = transm_loss.calc(source_depth=[20], rec_depth=[10,50], progress_bar=False)[0]
+        return tl, len(calls), transm_loss
+
+    tl1, n1, transm_loss = calc()
+    grid = transm_loss.grid
+    assert n1 == grid.nr - 1
+
+    tl4, n4, _ = calc(env_step=4)
+    assert n4 == int(np.ceil((grid.nr - 1) / 4))
+    # slowly varying environment; compare away from the deep interference nulls 
+    mask = tl1 < 80
+    assert np.median(np.abs(tl4 - tl1)[mask]) < 0.5
+
+    # the seafloor depth changes fastest in the 45 degree bin, by 0.080 m per step, 
+    # i.e., by more than 1 m every 13 steps
+    slope = np.max(0.01 * transm_loss.costheta + 0.005 * transm_loss.sintheta)
+    steps = int(1 / (slope * grid.dr)) + 1
+    assert steps == 13
+    _, n_tol, _ = calc(env_step=1000, env_tol=1.0)
+    assert n_tol == int(np.ceil((grid.nr - 1) / steps))
+
+def test_compute_transm_loss_sound_speed_profile():
+    """ Check that updating the sound speed with a profile function gives 
+        the same transmission loss as the 3D sound speed function """
+    bottom = {'sound_speed':1700,'density':1.5,'attenuation':0.5}
+    def sound_speed_profile_func(x,y,z): return 1490 + 0.05*z[np.newaxis,:] + 0.001*x[:,np.newaxis]
+
+    tl = []
+    for profile_func in [None, sound_speed_profile_func]:
+        transm_loss = pe.TransmissionLoss(freq=200, bathy_func=sloping_bathy, 
+            bathy_deriv_func=sloping_bathy_deriv, sound_speed_func=linear_sound_speed, 
+            sound_speed_profile_func=profile_func,
+            bottom=bottom, propagation_range=1, angular_bin=45)
+        tl.append(transm_loss.calc(source_depth=[20], rec_depth=[10,50], progress_bar=False)[0])
+
+    np.testing.assert_allclose(tl[0], tl[1], rtol=1e-10)
+
+def test_compute_transm_loss_receivers_from_vertical_field():
+    """ Check that the transmission loss at the receiver depths is the same whether 
+        it is read from the vertical-plane field or computed separately, for 
+        receivers on and off the vertical grid """
+    bottom = {'sound_speed':1700,'density':1.5,'attenuation':0.5}
+    transm_loss = pe.TransmissionLoss(freq=200, bathy_func=sloping_bathy, 
+        bathy_deriv_func=sloping_bathy_deriv, sound_speed_func=linear_sound_speed, 
+        bottom=bottom, propagation_range=1, angular_bin=45)
+    dz = transm_loss.grid.dz
+    for rec_depth in [[4*dz, 10*dz], [.1, 33.3]]:
+        tl, _ = transm_loss.calc(source_depth=[20], rec_depth=rec_depth, progress_bar=False)
+        tl_h, _, tl_v, _ = transm_loss.calc(source_depth=[20], rec_depth=rec_depth, vertical=True, progress_bar=False)
+        np.testing.assert_allclose(tl_h, tl, atol=1e-8)
+
+        # on the grid, the horizontal and vertical output agree
+        if rec_depth[0] > 1:
+            assert transm_loss._rec_kernel is None
+            idx = np.searchsorted(transm_loss.ax_v['vertical_axis'], 10*dz)
+            np.testing.assert_allclose(tl_v[0,idx,1:,:].T, tl_h[0,1], atol=1e-8)
+
+@pytest.mark.parametrize('workers,pool', [(1,'thread'), (3,'thread'), (3,'process')])
+def test_compute_transm_loss_output_file(tmp_path, workers, pool):
+    """ Check that the transmission loss in the vertical plane can be streamed 
+        to a netCDF file in single precision, and read back lazily """
+    bottom = {'sound_speed':1700,'density':1.5,'attenuation':0.5}
+    transm_loss = pe.TransmissionLoss(freq=200, bathy_func=sloping_bathy, 
+        bathy_deriv_func=sloping_bathy_deriv, sound_speed_func=linear_sound_speed, 
+        bottom=bottom, propagation_range=1, angular_bin=45, workers=workers, pool=pool)
+    kwargs = dict(source_depth=[20,80], rec_depth=[10,50], vertical=True, progress_bar=False)
+
+    tl_h, ax_h, tl_v, ax_v = transm_loss.calc(**kwargs)
+    path = str(tmp_path / 'tl.nc')
+    tl_h_disk, _, tl_v_disk, ax_v_disk = transm_loss.calc(output_file=path, **kwargs)
+
+    assert transm_loss._field_vert is None
+    np.testing.assert_array_equal(tl_h_disk, tl_h)
+    assert tl_v_disk.dtype == np.float32 and tl_v_disk.shape == tl_v.shape
+    np.testing.assert_array_equal(ax_v_disk['azimuthal_axis'], tl_v_disk.group()['azimuthal_axis'][:])
+
+    # the data are read when the handle is sliced
+    v = tl_v_disk[1, :, :, 2]
+    np.testing.assert_allclose(v, tl_v[1, :, :, 2], rtol=1e-5)
+    tl_v_disk.group().close()
+
+def test_vertical_plane_file(tmp_path):
+    """ Check that slices of azimuthal bins are written to the re-ordered 
+        azimuthal axis, and that a vanishing field is stored as NaN """
+    q = np.fft.ifftshift(np.arange(-3, 3)) * np.pi / 3
+    f = pe.VerticalPlaneFile(str(tmp_path / 'tl.nc'), source_depth=np.array([10.]), 
+        vertical_axis=np.array([0., 5.]), radial_axis=np.array([0., 100., 200.]), azimuthal_axis=q)
+    field = 10.**(-np.arange(6) / 20.)[np.newaxis, np.newaxis, :] * np.ones((1, 2, 6))
+    field[0, 0, 4] = 0
+    f.write(field[:, :, :2], r=1)
+    f.write(field[:, :, 2:], r=1, q=2)  # wraps around the end of the re-ordered axis
+    f.write(field[:, :, np.newaxis, :], r=slice(2, 3))
+    f.close()
+
+    tl = f.open()
+    np.testing.assert_allclose(tl.group()['azimuthal_axis'][:], np.fft.fftshift(q))
+    answ = np.fft.fftshift(np.arange(6.))
+    answ = np.ma.masked_array(answ, mask=(answ == 4))
+    for r in [1, 2]:
+        np.testing.assert_allclose(tl[0, 1, r, :], answ.data, atol=1e-5)
+        np.testing.assert_array_equal(np.ma.getmaskarray(tl[0, 0, r, :]), answ.mask)
+    assert np.all(np.ma.getmaskarray(tl[0, :, 0, :]))  # not written
+    tl.group().close()
+
+def test_multi_frequency_transm_loss():
+    """ Check that frequencies are propagated on nested grids, with those on the same 
+        grid propagated together, giving the same transmission loss as separate 
+        computations on the same grids """
+    bottom = {'sound_speed':1700,'density':1.5,'attenuation':0.5}
+    kwargs = dict(bathy_func=sloping_bathy, bathy_deriv_func=sloping_bathy_deriv, 
+        sound_speed_func=linear_sound_speed, bottom=bottom, propagation_range=1, angular_bin=45)
+    transm_loss = pe.MultiFrequencyTransmissionLoss(freq=[250,100,200,125], **kwargs)
+    assert np.all(transm_loss.freq == [100,125,200,250])
+    assert transm_loss._groups == {(1,1): [0], (2,2): [1,2], (3,3): [3]}
+
+    calc_kwargs = dict(source_depth=[20], rec_depth=[10,50], vertical=True, progress_bar=False, size_limit=False)
+    tl_h, ax_h, tl_v, ax_v = transm_loss.calc(**calc_kwargs)
+    grid = transm_loss.solvers[0].grid
+    assert tl_h.shape == (4, 1, 2, grid.nq, grid.nr - 1)
+    assert tl_v.shape == (4, 1, grid.nz // 2, grid.nr, grid.nq)
+    assert np.all(ax_h['frequency'] == transm_loss.freq)
+
+    for i, (m, _) in enumerate(transm_loss._grid_ratio):
+        g = transm_loss.solvers[i].grid
+        tl = pe.TransmissionLoss(freq=transm_loss.freq[i], dr=g.dr, dz=g.dz, r_max=g.r[-1], z_max=np.max(g.z), **kwargs)
+        h, a, v, _ = tl.calc(**calc_kwargs)
+        np.testing.assert_allclose(a['radial_axis'][m-1::m], ax_h['radial_axis'])
+        np.testing.assert_allclose(h[..., m-1::m], tl_h[i], atol=1e-8)
+        np.testing.assert_allclose(v[:, ::m, ::m], tl_v[i], atol=1e-8)
+
+def test_multi_frequency_transm_loss_same_grid():
+    """ Check that all the frequencies are propagated together if the grid spacings are 
+        specified, with the sound speed only evaluated once per step """
+    bottom = {'sound_speed':1700,'density':1.5,'attenuation':0.5}
+    calls = []
+    def sound_speed_func(x,y,z):
+        calls.append(x)
+        return linear_sound_speed(x,y,z)
+
+    transm_loss = pe.MultiFrequencyTransmissionLoss(freq=[100,160,200], bathy_func=sloping_bathy, 
+        bathy_deriv_func=sloping_bathy_deriv, sound_speed_func=sound_speed_func, bottom=bottom, 
+        propagation_range=1, angular_bin=45, dr=7.5, dz=3.75)
+    assert len(transm_loss._groups) == 1
+
+    tl, ax = transm_loss.calc(source_depth=[20,80], rec_depth=[10], progress_bar=False)
+    grid = transm_loss.solvers[0].grid
+    assert tl.shape == (3, 2, 1, grid.nq, len(ax['radial_axis']))
+    assert len(calls) == grid.nr - 1
+
+def test_plan_grid():
+    """ Check that the grid is sized for the wavelength, aperture, and accuracy, 
+        with a fast FFT length on the vertical axis """
+    import scipy.fft
+    kwargs = dict(freq=200, max_depth=200, r_max=1e4)
+    grid_kwargs = pe.plan_grid(aperture=90, **kwargs)
+    assert grid_kwargs['dr'] == 7.5 and grid_kwargs['dz'] == 3.75
+    assert grid_kwargs['dq'] == 10 * deg2rad
+    grid = pe.Grid(**grid_kwargs)
+    assert grid.nz % 2 == 0 and scipy.fft.next_fast_len(grid.nz) == grid.nz
+    assert np.max(grid.z) >= 4. / 3 * (200 + 3 * 7.5)
+
+    grid_kwargs = pe.plan_grid(aperture=30, accuracy=2, cross_range=1000, **kwargs)
+    assert grid_kwargs['dr'] == 3.75
+    np.testing.assert_allclose(grid_kwargs['dz'], 3.75)
+    assert grid_kwargs['dq'] == 0.1
+
+def test_transm_loss_estimate(caplog):
+    """ Check that the cost of the transmission loss computation can be estimated 
+        without computing it, and that the grid can be sized automatically """
+    bottom = {'sound_speed':1700,'density':1.5,'attenuation':0.5}
+    kwargs = dict(freq=200, bathy_func=sloping_bathy, bathy_deriv_func=sloping_bathy_deriv, 
+        sound_speed_func=linear_sound_speed, bottom=bottom, propagation_range=1, angular_bin=45)
+    transm_loss = pe.TransmissionLoss(accuracy=2, aperture=30, **kwargs)
+    assert transm_loss.grid.dr == 3.75
+
+    cost = transm_loss.calc(source_depth=[20], rec_depth=[10], dry_run=True)
+    assert not hasattr(transm_loss, '_field_horiz')
+    grid = transm_loss.grid
+    assert (cost['nr'], cost['nz'], cost['nq']) == (grid.nr, grid.nz, grid.nq)
+    assert cost['flops'] > 0 and cost['time'] > 0
+    assert cost['memory'] > grid.nz * grid.nq * 16
+
+    cost_v = transm_loss.estimate(source_depth=[20], rec_depth=[10], vertical=True, steps=0)
+    assert cost_v['time'] is None
+    assert cost_v['flops'] > cost['flops'] and cost_v['memory'] > cost['memory']
+
+    # fewer environment updates are cheaper
+    transm_loss = pe.TransmissionLoss(env_step=8, **kwargs)
+    cost_env = transm_loss.estimate(source_depth=[20], rec_depth=[10], steps=0)
+    cost = pe.TransmissionLoss(**kwargs).estimate(source_depth=[20], rec_depth=[10], steps=0)
+    assert cost_env['flops'] < cost['flops']
+
+    # the estimated wall time is logged with debug messages, without changing the result
+    transm_loss = pe.TransmissionLoss(**kwargs)
+    tl = transm_loss.calc(source_depth=[20], rec_depth=[10], progress_bar=False)[0]
+    with caplog.at_level(logging.DEBUG, logger='kadlu'):
+        tl_debug = transm_loss.calc(source_depth=[20], rec_depth=[10], progress_bar=False)[0]
+    assert any('Estimated cost' in r.message and r.message.endswith(' s') for r in caplog.records)
+    np.testing.assert_allclose(tl_debug, tl, rtol=1e-10)
@@ -39,3 +39,35 @@ def test_sound_speed_from_ssp():
     # evaluate
     c = ss(x=0, y=0, depth=z0, grid=True)
     assert np.all(np.abs(c - c0) < 1E-6)
+
+
+def test_sound_speed_profile():
+    """ Check that the sound speed profiles on a fixed depth axis agree with 
+        the 3D interpolation, for uniform, depth-dependent, and 3D sound speeds """
+    z = np.array([0, 5, 25, 45, 100])
+    x, y = np.array([0, 1000, -2000]), np.array([500, 0, 3000])
+
+    ss = SoundSpeed(ssp=1499)
+    assert np.all(ss.profile(depth=z, x=x, y=y) == 1499)
+
+    ss = SoundSpeed(ssp=(np.array([1500, 1510, 1512, 1599, 1489]), np.array([0, 10, 20, 30, 60])))
+    c = ss.profile(depth=z, x=x, y=y)
+    assert c.shape == (3, 5)
+    assert np.allclose(c, ss(x=0, y=0, depth=z, grid=True))
+
+    bounds = dict(south=43, north=44, west=-60, east=-59)
+    lats = np.linspace(43, 44, 5)
+    lons = np.linspace(-60, -59, 4)
+    depths = np.array([0., 10., 50., 200.])
+    temp = {"value": 4 + 10 * np.random.random((5, 4, 4)), "lat": lats, "lon": lons, "depth": depths}
+    sal = {"value": 30 + np.random.random((5, 4, 4)), "lat": lats, "lon": lons, "depth": depths}
+    o = Ocean(load_temperature=temp, load_salinity=sal, load_bathymetry=100, **bounds)
+    ss = SoundSpeed(o, num_depths=10, rel_err=None)
+
+    c = ss.profile(depth=z, x=x, y=y)
+    answ = ss(x=np.repeat(x, len(z)), y=np.repeat(y, len(z)), depth=np.tile(z, len(x)))
+    assert np.allclose(c, np.reshape(answ, c.shape))
+
+    # the depth-weight matrix is computed once per depth axis
+    ss.profile(depth=z, lat=[43.5], lon=[-59.5])
+    assert len(ss._depth_weights) == 1
@@ -0,0 +1,162 @@
+import time
+import pickle
+import sqlite3
+import threading
+from datetime import datetime
+import pytest
+from kadlu.index import index
+
+bounds = dict(south=44, north=46, west=-64, east=-62, start=datetime(2015, 1, 1), end=datetime(2015, 1, 3))
+
+
+def callback(**kwargs):
+    return kwargs['south']
+
+
+def test_index_reuses_connection(tmp_path):
+    """ Check that hashes are checked and inserted using a single connection """
+    with index(storagedir=str(tmp_path), store=True, **bounds) as fetchmap:
+        con = fetchmap.connection()
+        assert fetchmap(callback=callback) == [44, 44]
+        assert fetchmap.connection() is con
+
+    with sqlite3.connect(tmp_path / 'checksums.db') as con:
+        assert con.execute('SELECT COUNT(*) FROM hashmap').fetchone()[0] == 4
+
+
+def test_index_inmemory(tmp_path):
+    """ Check that the in-memory hashmap is loaded from disk upon entering the
+        context, and that changes are written back to disk upon exit
+    """
+    with index(storagedir=str(tmp_path), store=True, **bounds) as fetchmap:
+        fetchmap(callback=callback)
+        fetchmap.insert_hash(dict(a=1), obj='drop me')
+
+    with index(storagedir=str(tmp_path), store=True, inmemory=True, **bounds) as fetchmap:
+        # existing hashes were copied into memory
+        seed = fetchmap.hash_seed(callback)
+        assert all(fetchmap.serialized(kwargs, seed) for kwargs in fetchmap.kwargslist)
+
+        fetchmap.update_hash(fetchmap.kwargslist[0], seed, obj='updated')
+        fetchmap.insert_hash(dict(a=2), obj='new')
+        fetchmap.drop_hash(dict(a=1))
+
+        # nothing is written to disk before exiting the context
+        with sqlite3.connect(tmp_path / 'checksums.db') as con:
+            h = fetchmap.hash_dict(dict(a=2))
+            assert con.execute('SELECT * FROM hashmap WHERE hash = ?', (h, )).fetchone() is None
+
+    with index(storagedir=str(tmp_path), store=True, **bounds) as fetchmap:
+        assert pickle.loads(fetchmap.serialized(fetchmap.kwargslist[0], seed)) == 'updated'
+        assert pickle.loads(fetchmap.serialized(fetchmap.kwargslist[1], seed)) == 44
+        assert pickle.loads(fetchmap.serialized(dict(a=2))) == 'new'
+        assert not fetchmap.serialized(dict(a=1))
+
+
+def test_index_batched_lookup(tmp_path):
+    """ Check that existing bins are resolved with a single query, and that the
+        callback is only called for the missing bins
+    """
+    calls = []
+    def counting_callback(**kwargs):
+        calls.append(kwargs)
+        return kwargs['start'].day
+
+    kwargs = dict(bounds, end=datetime(2015, 1, 11))
+    with index(storagedir=str(tmp_path), store=True, **kwargs) as fetchmap:
+        seed = fetchmap.hash_seed(counting_callback)
+        for k in fetchmap.kwargslist[::2]:
+            fetchmap.insert_hash(k, seed, obj=k['start'].day)
+
+        queries = []
+        fetchmap.connection().set_trace_callback(queries.append)
+        assert fetchmap(callback=counting_callback) == list(range(1, 11))
+
+    assert [k['start'].day for k in calls] == [2, 4, 6, 8, 10]
+    assert sum(q.startswith('SELECT') for q in queries) == 1
+
+
+def test_index_schedule(tmp_path, monkeypatch):
+    """ Check that bins are fetched concurrently within the source limit, that the
+        callback is called from the calling thread, and that failed fetches are retried
+    """
+    monkeypatch.setitem(index.fetch_limits, 'test', 2)
+    lock = threading.Lock()
+    active, peak, failed = [0], [0], set()
+
+    def download(**kwargs):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        # first attempt of every third bin fails
+        if kwargs['start'].day % 3 == 0 and kwargs['start'] not in failed:
+            failed.add(kwargs['start'])
+            raise ConnectionError('connection reset')
+        return kwargs['start'].day
+
+    writers = []
+    def write(data, **kwargs):
+        writers.append(threading.current_thread())
+        return data
+
+    kwargs = dict(bounds, end=datetime(2015, 1, 11))
+    with index(storagedir=str(tmp_path), store=True, source='test', threads=4, backoff=0, **kwargs) as fetchmap:
+        # bins processed without the fetch function are not fetched again
+        fetchmap.insert_hash(fetchmap.kwargslist[0], fetchmap.hash_seed(write), obj=1)
+        assert fetchmap(callback=write, fetch=download) == list(range(1, 11))
+
+    assert peak[0] == 2
+    assert len(failed) == 3
+    assert len(writers) == 9 and all(w is threading.main_thread() for w in writers)
+
+    # failures are raised after the last retry
+    def unavailable(**kwargs):
+        failed.add(kwargs['start'])
+        raise ConnectionError('server unavailable')
+
+    failed.clear()
+    with index(storagedir=str(tmp_path), source='test', retries=1, backoff=0, **bounds) as fetchmap:
+        with pytest.raises(ConnectionError):
+            fetchmap(callback=callback, fetch=unavailable)
+
+
+def test_index_coalesce(tmp_path):
+    """ Check that adjacent missing bins are merged into rectangular blocks and fetched
+        with a single request, while cached bins are not fetched again
+    """
+    requests = []
+    def download(**kwargs):
+        requests.append(kwargs)
+        return kwargs['west']
+
+    def write(data, **kwargs):
+        return data
+
+    # 3x2 degree region over 2 days, i.e. 12 bins
+    kwargs = dict(south=44, north=46, west=-64, east=-61, start=datetime(2015, 1, 1), end=datetime(2015, 1, 3))
+    with index(storagedir=str(tmp_path), store=True, dx=1, dy=1, coalesce=(2, 2, 1, 2), **kwargs) as fetchmap:
+        assert len(fetchmap.kwargslist) == 12
+
+        # the south-west bin of the first day is cached
+        seed = fetchmap.hash_seed(write)
+        fetchmap.insert_hash(fetchmap.kwargslist[0], seed, obj=-64)
+        res = fetchmap(callback=write, fetch=download)
+
+    # every bin holds the result of the block containing it
+    assert len(res) == 12
+    assert all(r <= k['west'] < r + 2 for r, k in zip(res, fetchmap.kwargslist))
+    bounds = sorted((r['west'], r['east'], r['south'], r['north'], r['start'].day, r['end'].day) for r in requests)
+    assert bounds == [
+        (-64, -63, 44, 45, 2, 3),  # the cached bin is not fetched again
+        (-64, -63, 45, 46, 1, 3),
+        (-63, -61, 44, 46, 1, 3),
+    ]
+
+    # all bins are marked as done
+    requests.clear()
+    with index(storagedir=str(tmp_path), store=True, dx=1, dy=1, coalesce=(2, 2, 1, 2), **kwargs) as fetchmap:
+        fetchmap(callback=write, fetch=download)
+    assert requests == []
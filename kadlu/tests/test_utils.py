@@ -15,7 +15,7 @@ import pytest
 import os
 import math
 import numpy as np
-from kadlu.utils import LLtoXY, XYtoLL, interp_grid_1d, create_boolean_array
+from kadlu.utils import LLtoXY, XYtoLL, interp_grid_1d, create_boolean_array, as_array, set_precision, get_precision
 
 def test_can_convert_single_point_from_ll_to_xy():
     lat_ref = 45
@@ -90,3 +90,18 @@ def test_create_boolean_array():
     assert np.all(a == np.array([True, False, False, False]))
     a = create_boolean_array(n=6, step=3)
     assert np.all(a == np.array([True, False, False, True, False, False]))
+
+
+def test_set_precision():
+    """ Check that the precision determines the default data type of arrays """
+    assert get_precision() == 'float64'
+    assert as_array([1, 2]).dtype == np.float64
+    try:
+        set_precision('float32')
+        assert as_array([1, 2]).dtype == np.float32
+        assert as_array(1, dtype=np.float64).dtype == np.float64
+    finally:
+        set_precision('float64')
+
+    with pytest.raises(AssertionError):
+        set_precision('float16')
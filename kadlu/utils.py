@@ -14,8 +14,56 @@ R1_IUGG = 6371009
 # Degree to radian conversion factor
 deg2rad = np.pi / 180.
 
+# Real and complex data types for each of the supported precisions
+precisions = {
+    'float64': (np.float64, np.complex128),
+    'float32': (np.float32, np.complex64),
+}
 
-def as_array(x, dtype=np.float64):
+_precision = 'float64'
+
+
+def set_precision(precision='float64'):
+    """ Set the floating-point precision used for data values and acoustic fields.
+
+        Single precision (float32) halves the memory used by the interpolators, the 
+        sound speed grid, and the transmission loss fields (complex64), at the cost 
+        of a small loss of accuracy. Coordinates are always stored in double precision.
+
+        Args:
+            precision: str
+                `float64` (default) or `float32`
+
+        Example:
+            >>> import kadlu
+            >>> kadlu.set_precision('float32') # doctest: +SKIP
+    """
+    global _precision
+    assert precision in precisions, f'invalid precision {precision}. Valid options are: {list(precisions.keys())}'
+    _precision = precision
+
+
+def get_precision():
+    """ Get the floating-point precision set with :func:`set_precision`
+
+        Returns:
+            precision: str
+                `float64` or `float32`
+    """
+    return _precision
+
+
+def float_dtype():
+    """ Real data type for the current precision """
+    return precisions[_precision][0]
+
+
+def complex_dtype():
+    """ Complex data type for the current precision """
+    return precisions[_precision][1]
+
+
+def as_array(x, dtype=None):
     """ Converts the input to a numpy array.
     
         If the input is None, the return value is also None.
@@ -24,7 +72,8 @@ def as_array(x, dtype=np.float64):
             x: int,float,list,tuple
                 Value to be converted to a numpy array
             dtype: 
-                Data type. Default is np.float64
+                Data type. Default is the precision set with :func:`set_precision`, 
+                i.e., np.float64 unless changed.
     
         Returns:
             : numpy array
@@ -32,6 +81,9 @@ def as_array(x, dtype=np.float64):
     if x is None:
         return None
 
+    if dtype is None:
+        dtype = float_dtype()
+
     if np.ndim(x) == 0:
         return np.array([x], dtype=dtype)
 